@@ -0,0 +1,77 @@
+import json
+import time
+import sqlite3
+import threading
+
+# ==========================
+# Configuration Constants
+# ==========================
+DB_FILE = "dca_actions.db"
+
+
+class ActionLog:
+    """Persisted idempotency records for orders and withdrawals.
+
+    A record is claimed before the exchange is called and finished after, so
+    a key can only ever be acted on once, across restarts and across the
+    one-shot and daemon modes. A record still 'pending' after a crash is not
+    retried: the call may have gone through, so it is reported for a manual
+    check instead.
+    """
+
+    def __init__(self, db_path=DB_FILE):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS actions (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                exchange TEXT,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                details TEXT
+            );
+            CREATE INDEX IF NOT EXISTS actions_by_kind ON actions (kind, exchange, created_at);
+        """)
+
+    def claim(self, key, kind, exchange=None, **details):
+        """Atomically create a pending record. Returns False if the key was already used."""
+        now = time.time()
+        with self.lock:
+            try:
+                self.db.execute("INSERT INTO actions VALUES (?, ?, ?, 'pending', ?, ?, ?)",
+                                (key, kind, exchange, now, now, json.dumps(details, default=str)))
+            except sqlite3.IntegrityError:
+                return False
+        return True
+
+    def finish(self, key, status, **details):
+        """Mark a claimed record 'done', 'failed' or 'unknown', merging in details such as the order id."""
+        with self.lock:
+            row = self.db.execute("SELECT details FROM actions WHERE key = ?", (key,)).fetchone()
+            merged = dict(json.loads(row[0]) if row and row[0] else {}, **details)
+            self.db.execute("UPDATE actions SET status = ?, updated_at = ?, details = ? WHERE key = ?",
+                            (status, time.time(), json.dumps(merged, default=str), key))
+
+    def release(self, key):
+        """Forget a claim whose call was never made, e.g. the balance turned out too low."""
+        with self.lock:
+            self.db.execute("DELETE FROM actions WHERE key = ? AND status = 'pending'", (key,))
+
+    def recent(self, kind, exchange=None, within=None):
+        """True if a pending or done action of this kind exists within the last `within` seconds."""
+        since = time.time() - within if within else 0
+        with self.lock:
+            row = self.db.execute("SELECT 1 FROM actions WHERE kind = ? AND (? IS NULL OR exchange = ?) "
+                                  "AND status != 'failed' AND created_at >= ? LIMIT 1",
+                                  (kind, exchange, exchange, since)).fetchone()
+        return row is not None
+
+    def unresolved(self):
+        """Records left 'pending' by a run that stopped between claiming and finishing them."""
+        with self.lock:
+            return self.db.execute("SELECT key, kind, exchange, created_at FROM actions WHERE status = 'pending'").fetchall()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,167 @@
+import sqlite3
+import hashlib
+import threading
+from electrum_client import script_for_address
+
+# ==========================
+# Configuration Constants
+# ==========================
+DB_FILE = "address_index.db"
+CHAIN_EXT, CHAIN_INT = 0, 1  # BIP44 change levels: receive and change addresses
+DERIVE_BATCH = 20  # Extend the table in steps of this many indexes
+DEFAULT_ACCOUNT_PATH = "m/84'/0'/0'"
+# Derivation suffixes of an account descriptor, the piggybank derives both chains itself
+DESCRIPTOR_SUFFIXES = ('', '/0/*', '/1/*', '/<0;1>/*')
+
+
+def zpub_fingerprint(zpub):
+    return hashlib.sha256(zpub.encode('utf-8')).hexdigest()[:16]
+
+
+def parse_key_origin(text, fingerprint=None):
+    """Split a zpub with an optional key origin, e.g. "[d34db33f/84h/0h/0h]zpub6r...".
+
+    Also accepts a full wpkh(...) descriptor as wallets export it, with a
+    /0/* or /<0;1>/* suffix and a #checksum. Returns (zpub, master fingerprint
+    as 8 hex characters or None, account path). Raises ValueError on a bad
+    fingerprint, descriptor or key.
+    """
+    # The checksum only guards against typos in the descriptor text, it is not verified here
+    text = text.strip().split('#')[0].strip()
+    if text.startswith('wpkh('):
+        if not text.endswith(')'):
+            raise ValueError("Descriptor is missing its closing parenthesis")
+        text = text[5:-1]
+    path = DEFAULT_ACCOUNT_PATH
+    if text.startswith('['):
+        origin, _, text = text[1:].partition(']')
+        fingerprint, _, origin_path = origin.partition('/')
+        if origin_path:
+            path = 'm/' + origin_path.replace('h', "'").replace('H', "'")
+    # Drop a descriptor's derivation suffix such as /0/* or /<0;1>/*
+    zpub, slash, suffix = text.partition('/')
+    if slash + suffix not in DESCRIPTOR_SUFFIXES:
+        raise ValueError(f"Unsupported derivation suffix {slash + suffix}, expected /0/*, /1/* or /<0;1>/*")
+    validate_zpub(zpub)
+
+    if fingerprint:
+        fingerprint = fingerprint.strip().lower()
+        if len(fingerprint) != 8 or any(c not in '0123456789abcdef' for c in fingerprint):
+            raise ValueError("Master fingerprint must be 8 hex characters")
+    return zpub, fingerprint or None, path
+
+
+def validate_zpub(zpub):
+    """Raise ValueError unless zpub is a BIP84 account key, before anything is saved with it."""
+    from bip_utils import Bip84, Bip84Coins
+    try:
+        Bip84.FromExtendedKey(zpub, Bip84Coins.BITCOIN)
+    except Exception as e:
+        raise ValueError(f"Invalid zpub: {e}")
+
+
+class AddressIndex:
+    """Derive BIP84 addresses once and keep them in a small SQLite table.
+
+    Rows are keyed by (zpub fingerprint, chain, index) and hold the address,
+    scriptPubKey and compressed pubkey. The table is extended lazily and can be
+    searched both ways: index to address, and address or script back to index.
+    """
+
+    def __init__(self, zpub, db_path=DB_FILE):
+        self.zpub = zpub
+        self.wallet = zpub_fingerprint(zpub)
+        self.bip84_ctx = None
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS addresses (
+                wallet TEXT NOT NULL,
+                chain INTEGER NOT NULL,
+                idx INTEGER NOT NULL,
+                address TEXT NOT NULL,
+                script BLOB NOT NULL,
+                pubkey BLOB NOT NULL,
+                PRIMARY KEY (wallet, chain, idx)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS addresses_by_address ON addresses (address);
+            CREATE INDEX IF NOT EXISTS addresses_by_script ON addresses (script);
+        """)
+        self.counts = {}
+
+    # ==========================
+    # Derivation
+    # ==========================
+    def derived_count(self, chain):
+        if chain not in self.counts:
+            row = self.db.execute("SELECT COUNT(*) FROM addresses WHERE wallet = ? AND chain = ?",
+                                  (self.wallet, chain)).fetchone()
+            self.counts[chain] = row[0]
+        return self.counts[chain]
+
+    def derive(self, chain, start, end):
+        # Imported here so lookups served from the table never pay for bip_utils
+        from bip_utils import Bip84, Bip84Coins, Bip44Changes
+        if self.bip84_ctx is None:
+            self.bip84_ctx = Bip84.FromExtendedKey(self.zpub, Bip84Coins.BITCOIN)
+        chain_ctx = self.bip84_ctx.Change(Bip44Changes(chain))
+        rows = []
+        for i in range(start, end):
+            public_key = chain_ctx.AddressIndex(i).PublicKey()
+            address = public_key.ToAddress()
+            rows.append((self.wallet, chain, i, address, script_for_address(address),
+                         public_key.RawCompressed().ToBytes()))
+        return rows
+
+    def ensure(self, chain, count):
+        """Make sure indexes 0..count-1 of a chain are in the table."""
+        with self.lock:
+            have = self.derived_count(chain)
+            if have >= count:
+                return
+            end = max(count, have + DERIVE_BATCH)
+            rows = self.derive(chain, have, end)
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO addresses VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.counts[chain] = end
+
+    # ==========================
+    # Lookups
+    # ==========================
+    def entries(self, chain, start, count):
+        """Return dicts with index, address, script and pubkey for a range of a chain."""
+        self.ensure(chain, start + count)
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT idx, address, script, pubkey FROM addresses "
+                "WHERE wallet = ? AND chain = ? AND idx >= ? AND idx < ? ORDER BY idx",
+                (self.wallet, chain, start, start + count)).fetchall()
+        return [{'chain': chain, 'index': idx, 'address': address, 'script': bytes(script), 'pubkey': bytes(pubkey)}
+                for idx, address, script, pubkey in rows]
+
+    def addresses(self, chain, count, start=0):
+        return [entry['address'] for entry in self.entries(chain, start, count)]
+
+    def address(self, chain, index):
+        return self.entries(chain, index, 1)[0]['address']
+
+    def lookup(self, column, value):
+        with self.lock:
+            row = self.db.execute(
+                f"SELECT chain, idx, address, script, pubkey FROM addresses WHERE wallet = ? AND {column} = ?",
+                (self.wallet, value)).fetchone()
+        if row is None:
+            return None
+        chain, idx, address, script, pubkey = row
+        return {'chain': chain, 'index': idx, 'address': address, 'script': bytes(script), 'pubkey': bytes(pubkey)}
+
+    def lookup_address(self, address):
+        """Return the entry for an address we derived, or None."""
+        return self.lookup('address', address)
+
+    def lookup_script(self, script):
+        """Return the entry for a scriptPubKey (bytes or hex), or None."""
+        return self.lookup('script', bytes.fromhex(script) if isinstance(script, str) else script)
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http_client import get_json
+
+# ==========================
+# Configuration Constants
+# ==========================
+ESPLORA_URL = "https://blockstream.info/api"
+MAX_WORKERS = 8  # Keep the pool small, the Pi Zero and the API both appreciate it
+
+
+@dataclass
+class ScanSnapshot:
+    """Result of one pass over the derived receive addresses."""
+    total_balance: int = 0
+    utxo_count: int = 0
+    first_unused: int = None
+    address_stats: list = field(default_factory=list)
+    complete: bool = True
+
+
+# ==========================
+# Per-address statistics
+# ==========================
+def api_get(url):
+    return get_json(url)
+
+
+def parse_address_stats(data):
+    """Turn one /address/<addr> response into balance, UTXO count and tx count."""
+    chain, mempool = data.get('chain_stats', {}), data.get('mempool_stats', {})
+    balance = (chain.get('funded_txo_sum', 0) - chain.get('spent_txo_sum', 0)
+               + mempool.get('funded_txo_sum', 0) - mempool.get('spent_txo_sum', 0))
+    utxo_count = (chain.get('funded_txo_count', 0) - chain.get('spent_txo_count', 0)
+                  + mempool.get('funded_txo_count', 0) - mempool.get('spent_txo_count', 0))
+    return {
+        'address': data.get('address'),
+        'balance': balance,
+        'utxo_count': utxo_count,
+        'tx_count': chain.get('tx_count', 0) + mempool.get('tx_count', 0),
+        'mempool_tx_count': mempool.get('tx_count', 0),
+    }
+
+
+def fetch_address_stats(address):
+    """Fetch balance and UTXO count for an address with a single request."""
+    data = api_get(f"{ESPLORA_URL}/address/{address}")
+    if data is None:
+        return None
+    stats = parse_address_stats(data)
+    stats['address'] = address
+    return stats
+
+
+# ==========================
+# Scan Engine
+# ==========================
+def build_snapshot(stats_list):
+    """Fold per-address statistics (in index order) into a ScanSnapshot."""
+    snapshot = ScanSnapshot(address_stats=list(stats_list))
+    for index, stats in enumerate(snapshot.address_stats):
+        if stats is None:
+            snapshot.complete = False
+            continue
+        snapshot.total_balance += stats['balance']
+        snapshot.utxo_count += stats['utxo_count']
+        if stats['tx_count'] == 0 and snapshot.first_unused is None:
+            snapshot.first_unused = index
+    return snapshot
+
+
+def scan_addresses(addresses, max_workers=MAX_WORKERS, fetch=fetch_address_stats):
+    """Query all addresses concurrently and return a single ScanSnapshot.
+
+    Cycle latency follows the slowest request instead of the sum of all of them.
+    Addresses that could not be fetched are left as None and mark the snapshot
+    incomplete, so callers can retry instead of trusting a partial total.
+    """
+    if not addresses:
+        return ScanSnapshot()
+
+    def safe_fetch(address):
+        try:
+            return fetch(address)
+        except Exception as e:
+            print(f"Failed to fetch {address}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(addresses))) as pool:
+        stats_list = list(pool.map(safe_fetch, addresses))
+    return build_snapshot(stats_list)
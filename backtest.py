@@ -0,0 +1,198 @@
+#!/usr/bin/python
+# -*- coding:utf-8 -*-
+import os
+import sys
+import csv
+import time
+import argparse
+import itertools
+from dataclasses import dataclass, asdict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from indicators import wilder_rsi, rolling_min
+from candle_store import CandleStore
+
+# ==========================
+# Configuration Constants
+# ==========================
+BACKTEST_DB = "backtest_candles.db"  # Separate from candles.db, which only holds a few days
+HISTORY_DAYS = 729  # yfinance serves hourly candles for the last 730 days, use --csv for longer
+RUN_EVERY = 24  # Hours between simulated bot runs
+RUN_HOUR = 0  # UTC hour of the simulated daily run
+TAKER_FEE = 0.001
+WITHDRAWAL_FEE_BTC = 0.0002
+
+# Default sweep, the live settings in dca.py are 14 / 20 / 25 / 30 / 90
+RSI_PERIODS = (7, 14, 21)
+RSI_LEVELS = (20, 25, 30)
+RSI_WINDOW = 24
+FNG_CUTOFFS = (15, 20, 25, 30)
+BUY_AMOUNTS = (30,)
+BTC_THRESHOLDS = (90, 250, 500)
+
+
+@dataclass(frozen=True)
+class BacktestConfig:
+    rsi_period: int
+    rsi_level: float
+    fng_cutoff: int
+    buy_amount: float
+    btc_threshold: float
+
+
+# ==========================
+# Data
+# ==========================
+def load_history(store, refresh=False, days=HISTORY_DAYS):
+    """Return (timestamps, closes, fear & greed per candle) as NumPy arrays from the backtest store."""
+    if refresh:
+        added = store.sync(backfill_days=days)
+        print(f"Added {added} hourly candle(s) to {BACKTEST_DB}")
+    ts, closes = store.closes()
+    if not ts:
+        raise ValueError(f"No candles in {BACKTEST_DB}, run with --refresh or --csv")
+    ts, closes = np.frombuffer(ts, dtype=np.int64), np.frombuffer(closes, dtype=np.float64)
+    return ts, closes, fear_greed_per_candle(store.fear_greed_history(refresh), ts)
+
+
+def load_csv(path, store):
+    """Candles from a CSV with timestamp (seconds) and close columns, for history beyond yfinance's limit."""
+    with open(path, newline='') as f:
+        rows = [(int(float(row['timestamp'])), float(row['close'])) for row in csv.DictReader(f)]
+    rows.sort()
+    ts = np.array([row[0] for row in rows], dtype=np.int64)
+    closes = np.array([row[1] for row in rows], dtype=np.float64)
+    return ts, closes, fear_greed_per_candle(store.fear_greed_history(), ts)
+
+
+def fear_greed_per_candle(history, ts):
+    """The Fear & Greed value published at or before every candle, NaN before the index existed."""
+    if not history:
+        return np.full(len(ts), np.nan)
+    fng_ts = np.array([row[0] for row in history], dtype=np.int64)
+    fng_values = np.array([row[1] for row in history], dtype=np.float64)
+    index = np.searchsorted(fng_ts, ts, side='right') - 1
+    return np.where(index >= 0, fng_values[np.maximum(index, 0)], np.nan)
+
+
+# ==========================
+# Simulation
+# ==========================
+DATA = {}  # Per process: arrays shared by every configuration
+
+
+def init_worker(ts, closes, fng, run_every, run_hour, taker_fee, withdrawal_fee):
+    decisions = np.nonzero(((ts // 3600) - run_hour) % run_every == 0)[0]
+    DATA.update(closes=closes, fng=fng, decisions=decisions, taker_fee=taker_fee, withdrawal_fee=withdrawal_fee)
+
+
+def simulate(config, rsi_window_min):
+    """Replay one configuration, buy signals and fills are whole-array operations."""
+    decisions = DATA['decisions']
+    prices = DATA['closes'][decisions]
+    with np.errstate(invalid='ignore'):
+        signal = (rsi_window_min[decisions] < config.rsi_level) | (DATA['fng'][decisions] <= config.fng_cutoff)
+    bought = np.where(signal, config.buy_amount / prices * (1 - DATA['taker_fee']), 0.0)
+    cumulative = np.cumsum(bought)
+
+    # Withdrawals depend on the balance left by the previous one, so step from withdrawal to withdrawal
+    withdrawn, base, start = [], 0.0, 0
+    while start < len(cumulative):
+        hits = np.flatnonzero((cumulative[start:] - base) * prices[start:] >= config.btc_threshold)
+        if not len(hits):
+            break
+        i = start + hits[0]
+        withdrawn.append(cumulative[i] - base)
+        base, start = cumulative[i], i + 1
+
+    withdrawn = np.array(withdrawn)
+    fees = np.minimum(withdrawn, DATA['withdrawal_fee'])
+    btc_bought = cumulative[-1] if len(cumulative) else 0.0
+    btc_received = float((withdrawn - fees).sum())
+    btc_on_exchange = btc_bought - base
+    btc_total = btc_received + btc_on_exchange
+    usd_spent = float(signal.sum() * config.buy_amount)
+    return dict(asdict(config),
+                buys=int(signal.sum()),
+                usd_spent=usd_spent,
+                withdrawals=len(withdrawn),
+                sats_accumulated=int(round(btc_total * 1e8)),
+                sats_on_exchange=int(round(btc_on_exchange * 1e8)),
+                cost_basis=usd_spent / btc_total if btc_total else float('nan'),
+                fee_drag_pct=100.0 * float(fees.sum()) / btc_bought if btc_bought else 0.0)
+
+
+def run_period(rsi_period, configs):
+    """Worker task: RSI once for this period, then every configuration using it."""
+    rsi_window_min = rolling_min(wilder_rsi(DATA['closes'], rsi_period), RSI_WINDOW)
+    return [simulate(config, rsi_window_min) for config in configs]
+
+
+def run_grid(configs, ts, closes, fng, workers=None, run_every=RUN_EVERY, run_hour=RUN_HOUR,
+             taker_fee=TAKER_FEE, withdrawal_fee=WITHDRAWAL_FEE_BTC):
+    """Sweep configurations over a process pool, one task per RSI period."""
+    by_period = {}
+    for config in configs:
+        by_period.setdefault(config.rsi_period, []).append(config)
+    init_args = (ts, closes, fng, run_every, run_hour, taker_fee, withdrawal_fee)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=init_args) as pool:
+        futures = [pool.submit(run_period, period, group) for period, group in by_period.items()]
+        return [result for future in futures for result in future.result()]
+
+
+def build_grid(rsi_periods, rsi_levels, fng_cutoffs, buy_amounts, btc_thresholds):
+    return [BacktestConfig(*values) for values in
+            itertools.product(rsi_periods, rsi_levels, fng_cutoffs, buy_amounts, btc_thresholds)]
+
+
+def print_results(results, top):
+    results = sorted(results, key=lambda r: (np.isnan(r['cost_basis']), r['cost_basis']))
+    print(f"{'RSI p':>5} {'lvl':>4} {'F&G':>4} {'buy $':>6} {'wd $':>5} {'buys':>5} {'spent $':>8} "
+          f"{'sats':>10} {'cost basis':>11} {'fee drag':>8}")
+    for r in results[:top]:
+        print(f"{r['rsi_period']:>5} {r['rsi_level']:>4g} {r['fng_cutoff']:>4} {r['buy_amount']:>6g} "
+              f"{r['btc_threshold']:>5g} {r['buys']:>5} {r['usd_spent']:>8.0f} {r['sats_accumulated']:>10} "
+              f"{r['cost_basis']:>11.0f} {r['fee_drag_pct']:>7.2f}%")
+
+
+def parse_list(text, cast):
+    return tuple(cast(item) for item in text.split(','))
+
+
+# Main entry point for command line
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest the DCA buy and withdrawal rules over a parameter grid.")
+    parser.add_argument('--refresh', action='store_true', help="download new candles and the Fear & Greed history")
+    parser.add_argument('--days', type=int, default=HISTORY_DAYS, help="history to download into an empty store")
+    parser.add_argument('--csv', help="use candles from a CSV with timestamp and close columns instead")
+    parser.add_argument('--rsi-periods', type=lambda t: parse_list(t, int), default=RSI_PERIODS)
+    parser.add_argument('--rsi-levels', type=lambda t: parse_list(t, float), default=RSI_LEVELS)
+    parser.add_argument('--fng-cutoffs', type=lambda t: parse_list(t, int), default=FNG_CUTOFFS)
+    parser.add_argument('--buy-amounts', type=lambda t: parse_list(t, float), default=BUY_AMOUNTS)
+    parser.add_argument('--btc-thresholds', type=lambda t: parse_list(t, float), default=BTC_THRESHOLDS)
+    parser.add_argument('--run-every', type=int, default=RUN_EVERY, help="hours between simulated bot runs")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--out', help="write every result to this CSV file")
+    args = parser.parse_args()
+
+    store = CandleStore(BACKTEST_DB)
+    try:
+        ts, closes, fng = load_csv(args.csv, store) if args.csv else load_history(store, args.refresh, args.days)
+    except Exception as e:
+        print(f"Failed to load history: {e}")
+        sys.exit(1)
+
+    configs = build_grid(args.rsi_periods, args.rsi_levels, args.fng_cutoffs, args.buy_amounts, args.btc_thresholds)
+    print(f"{len(closes)} hourly candles, {len(configs)} configurations, {args.workers} worker(s)")
+    start = time.monotonic()
+    results = run_grid(configs, ts, closes, fng, workers=args.workers, run_every=args.run_every)
+    print(f"Backtest finished in {time.monotonic() - start:.2f}s\n")
+    print_results(results, args.top)
+
+    if args.out:
+        with open(args.out, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"\nWrote {len(results)} results to {args.out}")
@@ -0,0 +1,187 @@
+import math
+import zlib
+import hashlib
+
+# ==========================
+# Uniform Resources (BCR-2020-005) with fountain codes, for crypto-psbt QR transport
+# ==========================
+BYTEWORDS = (
+    "able acid also apex aqua arch atom aunt away axis back bald barn belt beta bias blue body brag brew bulb buzz "
+    "calm cash cats chef city claw code cola cook cost crux curl cusp cyan dark data days deli dice diet door down "
+    "draw drop drum dull duty each easy echo edge epic even exam exit eyes fact fair fern figs film fish fizz flap "
+    "flew flux foxy free frog fuel fund gala game gear gems gift girl glow good gray grim guru gush gyro half hang "
+    "hard hawk heat help high hill holy hope horn huts iced idea idle inch inky into iris iron item jade jazz join "
+    "jolt jowl judo jugs jump junk jury keep keno kept keys kick kiln king kite kiwi knob lamb lava lazy leaf legs "
+    "liar limp lion list logo loud love luau luck lung main many math maze memo menu meow mild mint miss monk nail "
+    "navy need news next noon note numb obey oboe omit onyx open oval owls paid part peck play plus poem pool pose "
+    "puff puma purr quad quiz race ramp real redo rich road rock roof ruby ruin runs rust safe saga scar sets silk "
+    "skew slot soap solo song stub surf swan taco task taxi tent tied time tiny toil tomb toys trip tuna twin ugly "
+    "undo unit urge user vast very veto vial vibe view visa void vows wall wand warm wasp wave waxy webs what when "
+    "whiz wolf work yank yawn yell yoga yurt zaps zero zest zinc zone zoom"
+).split()
+MINIMAL_BYTEWORDS = [word[0] + word[-1] for word in BYTEWORDS]
+MAX_UINT64 = 0xffffffffffffffff
+
+
+# ==========================
+# Bytewords and CBOR
+# ==========================
+def bytewords_minimal(data):
+    """Encode bytes plus their CRC32 as minimal (two letter) bytewords."""
+    data = bytes(data) + zlib.crc32(data).to_bytes(4, 'big')
+    return ''.join(MINIMAL_BYTEWORDS[b] for b in data)
+
+
+def cbor_head(major, value):
+    if value < 24:
+        return bytes([major << 5 | value])
+    for info, size in ((24, 1), (25, 2), (26, 4), (27, 8)):
+        if value < 1 << (8 * size):
+            return bytes([major << 5 | info]) + value.to_bytes(size, 'big')
+    raise ValueError("CBOR value too large")
+
+
+def cbor_uint(value):
+    return cbor_head(0, value)
+
+
+def cbor_bytes(data):
+    return cbor_head(2, len(data)) + bytes(data)
+
+
+def cbor_array(items):
+    return cbor_head(4, len(items)) + b''.join(items)
+
+
+# ==========================
+# Fountain code helpers (Xoshiro256**, alias sampler, shuffle)
+# ==========================
+class Xoshiro256:
+    def __init__(self, seed):
+        digest = hashlib.sha256(seed).digest()
+        self.s = [int.from_bytes(digest[i * 8:(i + 1) * 8], 'big') for i in range(4)]
+
+    @staticmethod
+    def rotl(x, k):
+        return ((x << k) | (x >> (64 - k))) & MAX_UINT64
+
+    def next(self):
+        s = self.s
+        result = (self.rotl((s[1] * 5) & MAX_UINT64, 7) * 9) & MAX_UINT64
+        t = (s[1] << 17) & MAX_UINT64
+        s[2] ^= s[0]
+        s[3] ^= s[1]
+        s[1] ^= s[2]
+        s[0] ^= s[3]
+        s[2] ^= t
+        s[3] = self.rotl(s[3], 45)
+        return result
+
+    def next_double(self):
+        return self.next() / (float(MAX_UINT64) + 1)
+
+    def next_int(self, low, high):
+        return int(self.next_double() * (high - low + 1)) + low
+
+
+class RandomSampler:
+    """Walker/Vose alias sampler, picks index i with probability probs[i] / sum(probs)."""
+
+    def __init__(self, probs):
+        n = len(probs)
+        total = sum(probs)
+        scaled = [p * n / total for p in probs]
+        small, large = [], []
+        for i in range(n - 1, -1, -1):
+            (small if scaled[i] < 1 else large).append(i)
+        self.probs, self.aliases = [0.0] * n, [0] * n
+        while small and large:
+            a, g = small.pop(), large.pop()
+            self.probs[a], self.aliases[a] = scaled[a], g
+            scaled[g] += scaled[a] - 1
+            (small if scaled[g] < 1 else large).append(g)
+        while large:
+            self.probs[large.pop()] = 1.0
+        while small:
+            self.probs[small.pop()] = 1.0
+
+    def next(self, rng):
+        r1, r2 = rng.next_double(), rng.next_double()
+        i = int(len(self.probs) * r1)
+        return i if r2 < self.probs[i] else self.aliases[i]
+
+
+def choose_fragments(seq_num, seq_len, checksum):
+    """Indexes of the fragments XORed into part seq_num, pure fragments first, then mixed ones."""
+    if seq_num <= seq_len:
+        return [seq_num - 1]
+    rng = Xoshiro256(seq_num.to_bytes(4, 'big') + checksum.to_bytes(4, 'big'))
+    degree = RandomSampler([1.0 / i for i in range(1, seq_len + 1)]).next(rng) + 1
+    remaining, shuffled = list(range(seq_len)), []
+    while remaining:
+        shuffled.append(remaining.pop(rng.next_int(0, len(remaining) - 1)))
+    return sorted(shuffled[:degree])
+
+
+def nominal_fragment_length(message_len, min_fragment_len, max_fragment_len):
+    fragment_len = message_len
+    for fragment_count in range(1, max(1, message_len // min_fragment_len) + 1):
+        fragment_len = math.ceil(message_len / fragment_count)
+        if fragment_len <= max_fragment_len:
+            break
+    return fragment_len
+
+
+# ==========================
+# Encoder
+# ==========================
+class UREncoder:
+    """Fountain-coded multipart UR encoder.
+
+    The first seq_len parts carry the fragments in order, every later part is
+    a pseudo-random XOR mix, so a scanner can decode from any sufficiently
+    large subset of frames in any order.
+    """
+
+    def __init__(self, ur_type, cbor, max_fragment_len=200, min_fragment_len=10):
+        self.ur_type = ur_type
+        self.message = bytes(cbor)
+        self.checksum = zlib.crc32(self.message)
+        self.fragment_len = nominal_fragment_length(len(self.message), min_fragment_len, max_fragment_len)
+        padded = self.message.ljust(math.ceil(len(self.message) / self.fragment_len) * self.fragment_len, b'\0')
+        self.fragments = [padded[i:i + self.fragment_len] for i in range(0, len(padded), self.fragment_len)]
+        self.seq_num = 0
+
+    @property
+    def seq_len(self):
+        return len(self.fragments)
+
+    @property
+    def is_single_part(self):
+        return self.seq_len == 1
+
+    def part(self, seq_num):
+        if self.is_single_part:
+            return f"ur:{self.ur_type}/{bytewords_minimal(self.message)}"
+        mixed = bytearray(self.fragment_len)
+        for index in choose_fragments(seq_num, self.seq_len, self.checksum):
+            for i, b in enumerate(self.fragments[index]):
+                mixed[i] ^= b
+        part = cbor_array([cbor_uint(seq_num), cbor_uint(self.seq_len), cbor_uint(len(self.message)),
+                           cbor_uint(self.checksum), cbor_bytes(mixed)])
+        return f"ur:{self.ur_type}/{seq_num}-{self.seq_len}/{bytewords_minimal(part)}"
+
+    def next_part(self):
+        self.seq_num += 1
+        return self.part(self.seq_num)
+
+
+def psbt_ur_parts(psbt_bytes, max_fragment_len=200, redundancy=2):
+    """Animated QR frames for a PSBT as uppercase ur:crypto-psbt parts (QR alphanumeric mode).
+
+    Returns seq_len * redundancy parts: the plain fragments followed by
+    fountain-mixed ones that let the wallet recover from missed frames.
+    """
+    encoder = UREncoder('crypto-psbt', cbor_bytes(psbt_bytes), max_fragment_len)
+    count = 1 if encoder.is_single_part else encoder.seq_len * redundancy
+    return [encoder.next_part().upper() for _ in range(count)]
@@ -0,0 +1,332 @@
+import os
+import json
+import time
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+import http_client
+from electrum_client import ElectrumClient, ElectrumError
+
+# ==========================
+# Configuration Constants
+# ==========================
+BROADCAST_FILE = "broadcast.json"  # Optional list of broadcast backends
+STATUS_FILE = "broadcast_status.json"
+DEFAULT_BACKENDS = [
+    {'type': 'esplora', 'url': 'https://blockstream.info/api'},
+    {'type': 'esplora', 'url': 'https://mempool.space/api'},
+]
+MAX_ATTEMPTS = 5  # Broadcast rounds before giving up on transient failures
+RETRY_BASE = 5.0  # Seconds, doubled after every failed round
+RETRY_CAP = 120.0
+CONFIRM_POLL = 60  # Seconds between confirmation checks of broadcast transactions
+KEEP_STATUS = 7 * 24 * 3600  # Forget confirmed or failed transactions after a week
+
+# Node responses meaning the transaction is already out there, which is as good as accepted
+ALREADY_KNOWN = ('already in block chain', 'already-in-mempool', 'txn-already-known', 'already known')
+
+
+class BroadcastRejected(Exception):
+    """A backend refused the transaction itself, retrying will not help."""
+
+
+# ==========================
+# PSBT validation and finalization
+# ==========================
+def finalize_psbt(psbt_base64):
+    """Decode a signed PSBT, finalize P2WPKH inputs from their signatures and extract it.
+
+    Returns (txid, raw transaction hex). Raises ValueError if the PSBT is
+    malformed or any input is still missing a signature.
+    """
+    from bitcointx.core import b2lx
+    from bitcointx.core.script import CScriptWitness
+    from bitcointx.core.psbt import PartiallySignedTransaction
+    from generate_psbt import select_bitcoin_params
+
+    select_bitcoin_params()
+    try:
+        psbt = PartiallySignedTransaction.deserialize(base64.b64decode(psbt_base64))
+    except Exception as e:
+        raise ValueError(f"Invalid PSBT: {e}")
+
+    for index, psbt_input in enumerate(psbt.inputs):
+        if psbt_input.is_final():
+            continue
+        # Our inputs are all P2WPKH, the final witness is just <signature> <pubkey>
+        if len(psbt_input.partial_sigs) != 1:
+            raise ValueError(f"Input {index} is not signed")
+        (pubkey, signature), = psbt_input.partial_sigs.items()
+        psbt_input.final_script_witness = CScriptWitness([signature, pubkey])
+        psbt_input.partial_sigs = {}
+
+    try:
+        tx = psbt.extract_transaction()
+    except Exception as e:
+        raise ValueError(f"Cannot extract the final transaction: {e}")
+    return b2lx(tx.GetTxid()), tx.serialize().hex()
+
+
+# ==========================
+# Backends
+# ==========================
+class EsploraBroadcaster:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.name = self.url
+
+    def broadcast(self, raw_tx):
+        try:
+            response = http_client.post(f"{self.url}/tx", data=raw_tx)
+        except requests.RequestException as e:
+            raise ConnectionError(str(e))
+        if response.status_code == 200:
+            return response.text.strip()
+        if any(message in response.text.lower() for message in ALREADY_KNOWN):
+            return None
+        if response.status_code in http_client.RETRY_STATUS:
+            raise ConnectionError(f"HTTP {response.status_code}")
+        raise BroadcastRejected(response.text.strip() or f"HTTP {response.status_code}")
+
+    def tx_status(self, txid):
+        """Return the Esplora status dict ({'confirmed': ..., 'block_height': ...}) or None."""
+        return http_client.get_json(f"{self.url}/tx/{txid}/status")
+
+
+class ElectrumBroadcaster:
+    def __init__(self, host, port, use_ssl=True, verify_ssl=True):
+        self.name = f"electrum://{host}:{port}"
+        self.client = ElectrumClient(host, port, use_ssl=use_ssl, verify_ssl=verify_ssl)
+        self.lock = threading.Lock()
+
+    def broadcast(self, raw_tx):
+        try:
+            with self.lock:
+                return self.client.call('blockchain.transaction.broadcast', raw_tx)
+        except ElectrumError as e:
+            if any(message in str(e).lower() for message in ALREADY_KNOWN):
+                return None
+            if 'timeout' in str(e).lower():
+                raise ConnectionError(str(e))
+            raise BroadcastRejected(str(e))
+        except OSError as e:
+            self.client.close()
+            raise ConnectionError(str(e))
+
+    def tx_status(self, txid):
+        # Electrum has no cheap by-txid status call, confirmations come from Esplora backends
+        return None
+
+
+def load_broadcasters(config_file=BROADCAST_FILE):
+    """Backends from broadcast.json ({"backends": [...]}), falling back to blockstream.info and mempool.space."""
+    backends = DEFAULT_BACKENDS
+    if os.path.exists(config_file):
+        with open(config_file, 'r') as f:
+            backends = json.load(f).get('backends', DEFAULT_BACKENDS)
+    broadcasters = []
+    for backend in backends:
+        if backend.get('type') == 'electrum':
+            broadcasters.append(ElectrumBroadcaster(backend['host'], int(backend.get('port', 50002)),
+                                                    use_ssl=backend.get('ssl', True),
+                                                    verify_ssl=backend.get('verify_ssl', True)))
+        else:
+            broadcasters.append(EsploraBroadcaster(backend['url']))
+    return broadcasters
+
+
+# ==========================
+# Broadcast queue
+# ==========================
+class BroadcastQueue:
+    """Broadcast finalized transactions in the background and track them by txid.
+
+    Every round submits to all backends concurrently and the first acceptance
+    wins. Rounds where every backend failed transiently are rescheduled with
+    backoff, so one failing transaction never holds up the others, and a
+    rejection by the network fails the job. Broadcast transactions are then
+    polled until they confirm. Statuses survive restarts in STATUS_FILE.
+    """
+
+    def __init__(self, broadcasters=None, status_file=STATUS_FILE):
+        self.broadcasters = broadcasters
+        self.status_file = status_file
+        self.scheduled = {}  # txid -> time of its next broadcast round
+        self.condition = threading.Condition()
+        self.statuses = {}
+        self.lock = threading.Lock()
+        self.worker = None
+        self.load_statuses()
+
+    def load_statuses(self):
+        if self.status_file and os.path.exists(self.status_file):
+            try:
+                with open(self.status_file, 'r') as f:
+                    self.statuses = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable broadcast status file: {e}")
+
+    def save_statuses(self):
+        if not self.status_file:
+            return
+        # Held while writing, so web requests and the worker never interleave on the tmp file
+        with self.lock:
+            try:
+                with open(f"{self.status_file}.tmp", 'w') as f:
+                    json.dump(self.statuses, f)
+                os.replace(f"{self.status_file}.tmp", self.status_file)
+            except OSError as e:
+                print(f"Failed to save broadcast status: {e}")
+
+    def update(self, txid, **fields):
+        with self.lock:
+            status = self.statuses.setdefault(txid, {'txid': txid})
+            status.update(fields, updated_at=time.time())
+        self.save_statuses()
+
+    def status(self, txid):
+        with self.lock:
+            status = self.statuses.get(txid)
+            return dict(status) if status is not None else None
+
+    # ==========================
+    # Submission
+    # ==========================
+    def submit(self, psbt_base64):
+        """Validate and finalize a signed PSBT, queue it and return its txid. Raises ValueError."""
+        txid, raw_tx = finalize_psbt(psbt_base64)
+        current = self.status(txid)
+        if current and current['state'] in ('queued', 'broadcasting', 'retrying', 'broadcast', 'confirmed'):
+            return txid
+        self.ensure_worker()
+        self.update(txid, state='queued', attempts=0, errors={}, raw_tx=raw_tx, submitted_at=time.time())
+        self.schedule(txid)
+        return txid
+
+    def schedule(self, txid, at=None):
+        """Queue a broadcast round for txid at time at (now by default) and wake the worker."""
+        with self.condition:
+            self.scheduled[txid] = at or time.time()
+            self.condition.notify()
+
+    def ensure_worker(self):
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                if self.broadcasters is None:
+                    self.broadcasters = load_broadcasters()
+                # Resume jobs interrupted by a restart
+                for txid, status in self.statuses.items():
+                    if status['state'] in ('queued', 'broadcasting', 'retrying'):
+                        self.schedule(txid, status.get('next_attempt_at'))
+                self.worker = threading.Thread(target=self.run, daemon=True)
+                self.worker.start()
+
+    def broadcast_round(self, txid, raw_tx):
+        """Submit to every backend at once. Returns the accepting backend, raises on failure."""
+        errors, rejected = {}, False
+        pool = ThreadPoolExecutor(max_workers=len(self.broadcasters))
+        try:
+            futures = {pool.submit(b.broadcast, raw_tx): b for b in self.broadcasters}
+            for future in as_completed(futures):
+                broadcaster = futures[future]
+                try:
+                    returned = future.result()
+                except BroadcastRejected as e:
+                    errors[broadcaster.name], rejected = f"rejected: {e}", True
+                except Exception as e:
+                    errors[broadcaster.name] = str(e)
+                else:
+                    if returned and returned != txid:
+                        errors[broadcaster.name] = f"returned unexpected txid {returned}"
+                        continue
+                    return broadcaster.name
+        finally:
+            # First success wins, the remaining submissions finish in the background
+            pool.shutdown(wait=False)
+        self.update(txid, errors=errors)
+        raise BroadcastRejected(errors) if rejected else ConnectionError(errors)
+
+    def process(self, txid):
+        """Run one broadcast round, a transient failure is rescheduled instead of waited out here."""
+        status = self.status(txid)
+        attempt = status['attempts']
+        if attempt >= MAX_ATTEMPTS:
+            self.update(txid, state='failed')
+            return
+        self.update(txid, state='broadcasting', attempts=attempt + 1)
+        try:
+            backend = self.broadcast_round(txid, status['raw_tx'])
+        except BroadcastRejected:
+            self.update(txid, state='failed')
+            print(f"Transaction {txid} was rejected: {self.status(txid)['errors']}")
+            return
+        except ConnectionError:
+            if attempt + 1 >= MAX_ATTEMPTS:
+                self.update(txid, state='failed')
+                print(f"Broadcast of {txid} failed on every backend {MAX_ATTEMPTS} times, giving up")
+                return
+            delay = min(RETRY_CAP, RETRY_BASE * 2 ** attempt)
+            next_attempt_at = time.time() + delay
+            self.update(txid, state='retrying', next_attempt_at=next_attempt_at)
+            print(f"Broadcast of {txid} failed on every backend, retrying in {delay:.0f}s...")
+            self.schedule(txid, next_attempt_at)
+            return
+        self.update(txid, state='broadcast', backend=backend, broadcast_at=time.time())
+        print(f"Transaction {txid} broadcast via {backend}")
+
+    # ==========================
+    # Confirmation tracking
+    # ==========================
+    def check_confirmations(self):
+        with self.lock:
+            pending = [txid for txid, s in self.statuses.items() if s['state'] == 'broadcast']
+            expired = [txid for txid, s in self.statuses.items()
+                       if s['state'] in ('confirmed', 'failed') and time.time() - s['updated_at'] > KEEP_STATUS]
+            for txid in expired:
+                del self.statuses[txid]
+        for txid in pending:
+            for broadcaster in self.broadcasters:
+                tx_status = broadcaster.tx_status(txid)
+                if tx_status is None:
+                    continue
+                if tx_status.get('confirmed'):
+                    self.update(txid, state='confirmed', block_height=tx_status.get('block_height'),
+                                confirmed_at=time.time())
+                    print(f"Transaction {txid} confirmed in block {tx_status.get('block_height')}")
+                else:
+                    self.update(txid, last_checked_at=time.time())
+                break
+        if expired:
+            self.save_statuses()
+
+    def next_due(self, deadline):
+        """Wait for the earliest scheduled broadcast to come due and return its txid, or None at deadline."""
+        with self.condition:
+            while True:
+                now = time.time()
+                txid = min(self.scheduled, key=self.scheduled.get, default=None)
+                if txid is not None and self.scheduled[txid] <= now:
+                    del self.scheduled[txid]
+                    return txid
+                if now >= deadline:
+                    return None
+                self.condition.wait(min(deadline, self.scheduled.get(txid, deadline)) - now)
+
+    def run(self):
+        next_check = time.time() + CONFIRM_POLL
+        while True:
+            txid = self.next_due(next_check)
+            if txid is None:
+                self.check_confirmations()
+                next_check = time.time() + CONFIRM_POLL
+                continue
+            try:
+                self.process(txid)
+            except Exception as e:
+                self.update(txid, state='failed', errors={'queue': str(e)})
+                print(f"Broadcast of {txid} failed: {e}")
+
+
+# Shared queue used by the web app
+broadcaster = BroadcastQueue()
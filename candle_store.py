@@ -0,0 +1,273 @@
+import time
+import sqlite3
+import threading
+from array import array
+from datetime import datetime, timedelta, timezone
+from http_client import get_json
+from footprint import timed_import
+
+# ==========================
+# Configuration Constants
+# ==========================
+DB_FILE = "candles.db"
+SYMBOL = "BTC-USD"
+CANDLE_SECONDS = 3600  # Hourly candles
+BACKFILL_DAYS = 5  # History downloaded into an empty store
+CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?interval=1h&period1={start}&period2={end}"
+CHART_HEADERS = {'User-Agent': 'Mozilla/5.0'}  # Yahoo answers 429 to the default requests agent
+FNG_URL = "https://api.alternative.me/fng/?limit=1"
+FNG_HISTORY_URL = "https://api.alternative.me/fng/?limit=0"
+
+
+# ==========================
+# Wilder RSI, one candle at a time
+# ==========================
+def rsi_from_averages(avg_gain, avg_loss):
+    # Same form as TA-Lib, which returns 0 rather than 50 or 100 for a flat series
+    total = avg_gain + avg_loss
+    return 100.0 * avg_gain / total if total else 0.0
+
+
+def rsi_step(state, close, period):
+    """Advance an RSI state dict by one close. Returns the RSI, or None while still seeding.
+
+    The first `period` changes are averaged (TA-Lib's seed), after that each
+    candle is Wilder-smoothed in O(1): avg = (avg * (period - 1) + x) / period.
+    """
+    prev_close = state.get('prev_close')
+    state['prev_close'] = close
+    if prev_close is None:
+        return None
+    change = close - prev_close
+    gain, loss = max(change, 0.0), max(-change, 0.0)
+
+    state['count'] = state.get('count', 0) + 1
+    if state['count'] <= period:
+        state['avg_gain'] = state.get('avg_gain', 0.0) + gain / period
+        state['avg_loss'] = state.get('avg_loss', 0.0) + loss / period
+        if state['count'] < period:
+            return None
+    else:
+        state['avg_gain'] = (state['avg_gain'] * (period - 1) + gain) / period
+        state['avg_loss'] = (state['avg_loss'] * (period - 1) + loss) / period
+    return rsi_from_averages(state['avg_gain'], state['avg_loss'])
+
+
+# ==========================
+# Data sources
+# ==========================
+def parse_chart(data):
+    """Candles from a Yahoo chart response, skipping empty hours and the live point that is not on the hour."""
+    result = data['chart']['result'][0]
+    quote = result['indicators']['quote'][0]
+    candles = []
+    for i, ts in enumerate(result.get('timestamp') or []):
+        if quote['close'][i] is None or ts % CANDLE_SECONDS:
+            continue
+        candles.append((ts, quote['open'][i], quote['high'][i], quote['low'][i], quote['close'][i],
+                        quote['volume'][i] or 0.0))
+    return candles
+
+
+def fetch_hourly_candles(since_ts, backfill_days=BACKFILL_DAYS):
+    """Hourly candles starting at since_ts (or a backfill), as (ts, open, high, low, close, volume).
+
+    Reads Yahoo's chart JSON directly, the same data yfinance serves but
+    without importing pandas, which is most of a run's memory on a Pi Zero.
+    yfinance is only imported if the chart endpoint fails.
+    """
+    now = int(time.time())
+    start = since_ts or now - backfill_days * 86400
+    data = get_json(CHART_URL.format(symbol=SYMBOL, start=start, end=now), headers=CHART_HEADERS)
+    if data is not None and data.get('chart', {}).get('result'):
+        return parse_chart(data)
+    print("Yahoo chart endpoint unavailable, falling back to yfinance")
+    return fetch_hourly_candles_yfinance(since_ts, backfill_days)
+
+
+def fetch_hourly_candles_yfinance(since_ts, backfill_days=BACKFILL_DAYS):
+    yf = timed_import('yfinance')
+
+    start = (datetime.fromtimestamp(since_ts, timezone.utc) if since_ts
+             else datetime.now(timezone.utc) - timedelta(days=backfill_days))
+    df = yf.download(SYMBOL, start=start.strftime('%Y-%m-%d'), interval='1h', progress=False)
+    if getattr(df.columns, 'nlevels', 1) > 1:
+        # Newer yfinance versions return (field, ticker) columns even for one ticker
+        df.columns = df.columns.get_level_values(0)
+    return [(int(ts.timestamp()), float(row['Open']), float(row['High']), float(row['Low']),
+             float(row['Close']), float(row['Volume'])) for ts, row in df.iterrows()]
+
+
+class CandleStore:
+    """Append-only hourly candle store with incremental RSI and a cached Fear & Greed value.
+
+    Only closed candles newer than the last stored one are fetched and
+    appended. Every tracked RSI period keeps its Wilder state in the database,
+    so a new candle costs one O(1) update per period instead of a recompute.
+    """
+
+    def __init__(self, db_path=DB_FILE, symbol=SYMBOL):
+        self.symbol = symbol
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS candles (
+                symbol TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                open REAL, high REAL, low REAL, close REAL NOT NULL, volume REAL,
+                PRIMARY KEY (symbol, ts)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS rsi (
+                symbol TEXT NOT NULL,
+                period INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (symbol, period, ts)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS rsi_state (
+                symbol TEXT NOT NULL,
+                period INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                prev_close REAL, avg_gain REAL, avg_loss REAL, count INTEGER,
+                PRIMARY KEY (symbol, period)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS fear_greed (
+                ts INTEGER PRIMARY KEY,
+                value INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            );
+        """)
+
+    def close(self):
+        self.db.close()
+
+    # ==========================
+    # Candles
+    # ==========================
+    def last_timestamp(self):
+        row = self.db.execute("SELECT MAX(ts) FROM candles WHERE symbol = ?", (self.symbol,)).fetchone()
+        return row[0]
+
+    def candles(self, count):
+        """The last `count` candles, oldest first."""
+        rows = self.db.execute("SELECT ts, open, high, low, close, volume FROM candles WHERE symbol = ? "
+                               "ORDER BY ts DESC LIMIT ?", (self.symbol, count)).fetchall()
+        return rows[::-1]
+
+    def closes(self, count=None):
+        """(timestamps, closes) of the last `count` candles, all by default, as compact array buffers, oldest first.
+
+        Eight bytes per value instead of a tuple of Python floats per row,
+        NumPy can wrap them without a copy (np.frombuffer).
+        """
+        ts, closes = array('q'), array('d')
+        for row_ts, close in self.db.execute("SELECT ts, close FROM (SELECT ts, close FROM candles WHERE symbol = ? "
+                                             "ORDER BY ts DESC LIMIT ?) ORDER BY ts",
+                                             (self.symbol, -1 if count is None else count)):
+            ts.append(row_ts)
+            closes.append(close)
+        return ts, closes
+
+    def append(self, candles, now=None):
+        """Store closed candles newer than the last one and advance every RSI state. Returns how many were added."""
+        now = time.time() if now is None else now
+        last = self.last_timestamp() or 0
+        # The newest candle is still forming, storing it would freeze a wrong close
+        new = sorted(c for c in candles if c[0] > last and c[0] + CANDLE_SECONDS <= now)
+        if not new:
+            return 0
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR IGNORE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                [(self.symbol,) + tuple(c) for c in new])
+            for period, state in self.rsi_states().items():
+                self.advance_rsi(period, state, [(c[0], c[4]) for c in new])
+        return len(new)
+
+    def sync(self, fetch=fetch_hourly_candles, now=None, backfill_days=BACKFILL_DAYS):
+        """Fetch candles newer than the last stored one. No network call while the next candle is still open."""
+        now = time.time() if now is None else now
+        last = self.last_timestamp()
+        if last is not None and last + 2 * CANDLE_SECONDS > now:
+            return 0
+        return self.append(fetch(last, backfill_days), now)
+
+    # ==========================
+    # RSI
+    # ==========================
+    def rsi_states(self):
+        rows = self.db.execute("SELECT period, ts, prev_close, avg_gain, avg_loss, count FROM rsi_state "
+                               "WHERE symbol = ?", (self.symbol,)).fetchall()
+        return {period: {'ts': ts, 'prev_close': prev_close, 'avg_gain': avg_gain, 'avg_loss': avg_loss, 'count': count}
+                for period, ts, prev_close, avg_gain, avg_loss, count in rows}
+
+    def advance_rsi(self, period, state, closes):
+        values = []
+        for ts, close in closes:
+            if ts <= state.get('ts', 0):
+                continue
+            value = rsi_step(state, close, period)
+            state['ts'] = ts
+            if value is not None:
+                values.append((self.symbol, period, ts, value))
+        self.db.executemany("INSERT OR REPLACE INTO rsi VALUES (?, ?, ?, ?)", values)
+        self.db.execute("INSERT OR REPLACE INTO rsi_state VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (self.symbol, period, state.get('ts', 0), state.get('prev_close'),
+                         state.get('avg_gain', 0.0), state.get('avg_loss', 0.0), state.get('count', 0)))
+
+    def track_rsi(self, period):
+        """Start keeping RSI for a period, replaying the stored candles once."""
+        if period in self.rsi_states():
+            return
+        ts, closes = self.closes()
+        with self.lock, self.db:
+            self.advance_rsi(period, {}, zip(ts, closes))
+
+    def rsi_values(self, period, count):
+        """The last `count` RSI values as (ts, value), oldest first."""
+        self.track_rsi(period)
+        rows = self.db.execute("SELECT ts, value FROM rsi WHERE symbol = ? AND period = ? ORDER BY ts DESC LIMIT ?",
+                               (self.symbol, period, count)).fetchall()
+        return rows[::-1]
+
+    # ==========================
+    # Fear & Greed
+    # ==========================
+    def fear_greed(self, now=None):
+        """Latest Fear & Greed value, from the store until alternative.me publishes the next one."""
+        now = time.time() if now is None else now
+        row = self.db.execute("SELECT value, expires_at FROM fear_greed ORDER BY ts DESC LIMIT 1").fetchone()
+        if row is not None and row[1] > now:
+            return row[0]
+
+        data = get_json(FNG_URL)
+        if data is None:
+            if row is not None:
+                print("Fear and Greed Index unavailable, using the last stored value")
+                return row[0]
+            raise ValueError(f"Failed to load data from {FNG_URL}")
+        entry = data['data'][0]
+        # time_until_update is when the next daily value is due, poll again shortly after
+        expires_at = now + int(entry.get('time_until_update') or 3600) + 60
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO fear_greed VALUES (?, ?, ?, ?)",
+                            (int(entry['timestamp']), int(entry['value']), now, expires_at))
+        return int(entry['value'])
+
+    def fear_greed_expires(self):
+        """When the stored Fear & Greed value is superseded by the next publication, or None."""
+        row = self.db.execute("SELECT expires_at FROM fear_greed ORDER BY ts DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def fear_greed_history(self, refresh=False):
+        """Every daily Fear & Greed value as [(ts, value)], oldest first, downloading the full history on request."""
+        if refresh:
+            data = get_json(FNG_HISTORY_URL)
+            if data is None:
+                raise ValueError(f"Failed to load data from {FNG_HISTORY_URL}")
+            now = time.time()
+            with self.lock, self.db:
+                # Never overwrite the cached live value and its expiry
+                self.db.executemany("INSERT OR IGNORE INTO fear_greed VALUES (?, ?, ?, ?)",
+                                    [(int(entry['timestamp']), int(entry['value']), now, now) for entry in data['data']])
+        return self.db.execute("SELECT ts, value FROM fear_greed ORDER BY ts").fetchall()
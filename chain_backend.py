@@ -0,0 +1,150 @@
+import os
+import json
+import time
+from address_scan import ESPLORA_URL, scan_addresses, build_snapshot
+from chain_watcher import ChainWatcher
+from electrum_client import ElectrumClient, script_for_address, scripthash_for_address
+from http_client import get_json
+
+# ==========================
+# Configuration Constants
+# ==========================
+BACKEND_FILE = "backend.json"  # e.g. {"type": "electrum", "host": "electrum.blockstream.info", "port": 50002, "ssl": true}
+
+
+# ==========================
+# Esplora REST backend (blockstream.info)
+# ==========================
+class EsploraWatcher(ChainWatcher):
+    def wait(self, timeout):
+        """Plain polling, there is nothing to wake us up early."""
+        time.sleep(timeout)
+        return False
+
+    def close(self):
+        pass
+
+
+class EsploraBackend:
+    name = "esplora"
+
+    def address_stats(self, addresses):
+        return scan_addresses(addresses).address_stats
+
+    def utxos(self, addresses):
+        """Return {address: [utxo, ...]} as reported by /address/<addr>/utxo."""
+        result = {}
+        for address in addresses:
+            utxos = get_json(f"{ESPLORA_URL}/address/{address}/utxo")
+            if utxos is None:
+                raise ConnectionError(f"Failed to fetch UTXOs for {address}")
+            result[address] = utxos
+        return result
+
+    def watcher(self, addresses):
+        return EsploraWatcher(addresses)
+
+
+# ==========================
+# Electrum backend
+# ==========================
+def electrum_utxo(item):
+    """Convert a listunspent entry to the Esplora UTXO format used everywhere else."""
+    return {
+        'txid': item['tx_hash'],
+        'vout': item['tx_pos'],
+        'value': item['value'],
+        'status': {'confirmed': item.get('height', 0) > 0, 'block_height': item.get('height', 0)},
+    }
+
+
+def electrum_stats(address, balance, history, unspent):
+    mempool_txs = [tx for tx in history if tx.get('height', 0) <= 0]
+    return {
+        'address': address,
+        'balance': balance.get('confirmed', 0) + balance.get('unconfirmed', 0),
+        'utxo_count': len(unspent),
+        'tx_count': len(history),
+        'mempool_tx_count': len(mempool_txs),
+    }
+
+
+class ElectrumWatcher:
+    """Push-driven watcher: rescans in one batch whenever a subscribed script changes."""
+
+    def __init__(self, backend, addresses):
+        self.backend = backend
+        self.addresses = list(addresses)
+        self.scripthashes = [scripthash_for_address(address) for address in self.addresses]
+        self.statuses = None
+        self.last_snapshot = None
+        self.api_calls = 0
+
+    def poll(self):
+        self.api_calls = 0
+        statuses = self.backend.client.subscribe_scripthashes(self.scripthashes)
+        self.api_calls += 1
+        if statuses == self.statuses and self.last_snapshot is not None:
+            return self.last_snapshot, False
+        snapshot = build_snapshot(self.backend.address_stats(self.addresses))
+        self.api_calls += 1
+        self.statuses = statuses
+        changed = snapshot != self.last_snapshot
+        self.last_snapshot = snapshot
+        return snapshot, changed
+
+    def wait(self, timeout):
+        """Wait for a scripthash notification instead of a fixed poll interval. Returns True if one arrived."""
+        notifications = self.backend.client.wait_for_notification(timeout)
+        if notifications:
+            print(f"Received {len(notifications)} Electrum notification(s)")
+        return bool(notifications)
+
+    def close(self):
+        self.backend.client.close()
+
+
+class ElectrumBackend:
+    name = "electrum"
+
+    def __init__(self, host, port, use_ssl=True, verify_ssl=True):
+        self.client = ElectrumClient(host, port, use_ssl=use_ssl, verify_ssl=verify_ssl)
+
+    def address_stats(self, addresses):
+        """Fetch balance, history and unspent outputs for every address in one batch."""
+        calls = []
+        for address in addresses:
+            scripthash = scripthash_for_address(address)
+            calls += [('blockchain.scripthash.get_balance', [scripthash]),
+                      ('blockchain.scripthash.get_history', [scripthash]),
+                      ('blockchain.scripthash.listunspent', [scripthash])]
+        results = self.client.batch(calls)
+        return [electrum_stats(address, *results[i * 3:i * 3 + 3]) for i, address in enumerate(addresses)]
+
+    def utxos(self, addresses):
+        """Return {address: [utxo, ...]}; the script is ours, so no parent transaction is needed."""
+        results = self.client.batch([('blockchain.scripthash.listunspent', [scripthash_for_address(address)])
+                                     for address in addresses])
+        utxos = {}
+        for address, unspent in zip(addresses, results):
+            script_hex = script_for_address(address).hex()
+            utxos[address] = [dict(electrum_utxo(item), scriptPubKey=script_hex) for item in unspent]
+        return utxos
+
+    def watcher(self, addresses):
+        return ElectrumWatcher(self, addresses)
+
+
+# ==========================
+# Backend selection
+# ==========================
+def get_backend(config_file=BACKEND_FILE):
+    """Return the configured chain backend, Esplora REST unless backend.json says otherwise."""
+    config = {}
+    if os.path.exists(config_file):
+        with open(config_file, 'r') as f:
+            config = json.load(f)
+    if config.get('type') == 'electrum':
+        return ElectrumBackend(config['host'], int(config.get('port', 50002)),
+                               use_ssl=config.get('ssl', True), verify_ssl=config.get('verify_ssl', True))
+    return EsploraBackend()
@@ -0,0 +1,152 @@
+import os
+import json
+import hashlib
+from address_scan import ESPLORA_URL, api_get, fetch_address_stats, scan_addresses, build_snapshot
+
+# ==========================
+# Configuration Constants
+# ==========================
+STATE_FILE = "chain_state.json"
+FULL_RESCAN_EVERY = 20  # Cycles between full rescans, catches spends from old addresses
+
+
+def fetch_tip_height():
+    """Fetch the current chain tip height."""
+    return api_get(f"{ESPLORA_URL}/blocks/tip/height")
+
+
+def addresses_fingerprint(addresses):
+    return hashlib.sha256("\n".join(addresses).encode('utf-8')).hexdigest()[:16]
+
+
+class ChainWatcher:
+    """Keep the last scan in memory and on disk and only re-query what could have changed.
+
+    In steady state a cycle costs two requests: the chain tip and the address
+    currently shown on screen (plus the rest of the range up to the last used
+    address, when the wallet has gaps). Addresses with unconfirmed transactions are
+    refreshed when a new block arrives, and every FULL_RESCAN_EVERY cycles a
+    full scan catches spends made from older addresses with another wallet.
+    """
+
+    def __init__(self, addresses, state_file=STATE_FILE, full_rescan_every=FULL_RESCAN_EVERY):
+        self.addresses = list(addresses)
+        self.state_file = state_file
+        self.full_rescan_every = full_rescan_every
+        self.fingerprint = addresses_fingerprint(self.addresses)
+        self.tip_height = None
+        self.stats = {}
+        self.last_used_index = -1
+        self.cycles_since_full_scan = 0
+        self.api_calls = 0
+        self.load_state()
+
+    # ==========================
+    # Persistence
+    # ==========================
+    def load_state(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable {self.state_file}: {e}")
+            return
+        if state.get('fingerprint') != self.fingerprint:
+            return
+        self.tip_height = state.get('tip_height')
+        self.stats = state.get('stats', {})
+        self.last_used_index = state.get('last_used_index', -1)
+
+    def save_state(self):
+        state = {
+            'fingerprint': self.fingerprint,
+            'tip_height': self.tip_height,
+            'last_used_index': self.last_used_index,
+            'stats': self.stats,
+        }
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.state_file)
+
+    # ==========================
+    # Scanning
+    # ==========================
+    def snapshot(self):
+        return build_snapshot([self.stats.get(address) for address in self.addresses])
+
+    def has_full_state(self):
+        return all(address in self.stats for address in self.addresses)
+
+    def update_stats(self, stats_list):
+        for stats in stats_list:
+            if stats is None:
+                continue
+            self.stats[stats['address']] = stats
+            if stats['tx_count'] > 0:
+                self.last_used_index = max(self.last_used_index, self.addresses.index(stats['address']))
+
+    def refresh(self, addresses):
+        """Re-query a handful of addresses. Returns True if any of them changed."""
+        changed = False
+        for address in addresses:
+            stats = fetch_address_stats(address)
+            self.api_calls += 1
+            if stats is None:
+                raise ConnectionError(f"Failed to fetch {address}")
+            if stats != self.stats.get(address):
+                changed = True
+            self.update_stats([stats])
+        return changed
+
+    def full_scan(self):
+        snapshot = scan_addresses(self.addresses)
+        self.api_calls += len(self.addresses)
+        if not snapshot.complete:
+            raise ConnectionError("Full scan incomplete")
+        self.stats = {}
+        self.last_used_index = -1
+        self.update_stats(snapshot.address_stats)
+        self.cycles_since_full_scan = 0
+        return snapshot
+
+    def poll(self):
+        """Run one watch cycle and return (snapshot, changed)."""
+        self.api_calls = 0
+        tip_height = fetch_tip_height()
+        self.api_calls += 1
+        if tip_height is None:
+            raise ConnectionError("Failed to fetch chain tip")
+
+        self.cycles_since_full_scan += 1
+        if not self.has_full_state() or self.cycles_since_full_scan >= self.full_rescan_every:
+            previous = self.snapshot() if self.has_full_state() else None
+            self.tip_height = tip_height
+            snapshot = self.full_scan()
+            self.save_state()
+            return snapshot, previous is None or snapshot != previous
+
+        # The screen shows the first unused address, in a wallet with gaps the unused
+        # addresses between it and the last used one can still be paid, so watch them all
+        receive_index = self.last_used_index + 1
+        first_unused = self.snapshot().first_unused
+        watched = self.addresses[receive_index if first_unused is None else first_unused:receive_index + 1]
+        if tip_height != self.tip_height:
+            # A new block may confirm (or drop) transactions that were still pending
+            watched += [address for address, stats in self.stats.items()
+                        if stats['mempool_tx_count'] > 0 and address not in watched]
+
+        changed = self.refresh(watched)
+
+        # A payment to the receive address moves us forward, check the next ones until unused
+        while self.last_used_index + 1 > receive_index and self.last_used_index + 1 < len(self.addresses):
+            receive_index = self.last_used_index + 1
+            changed = self.refresh([self.addresses[receive_index]]) or changed
+
+        tip_changed = tip_height != self.tip_height
+        self.tip_height = tip_height
+        if changed or tip_changed:
+            self.save_state()
+        return self.snapshot(), changed
@@ -0,0 +1,205 @@
+import math
+import random
+
+# ==========================
+# Configuration Constants
+# ==========================
+# Weight units (WU) of the parts of a segwit transaction, vsize = ceil(weight / 4)
+TX_OVERHEAD_WEIGHT = 4 * (4 + 4) + 2  # version + locktime, plus segwit marker and flag
+P2WPKH_INPUT_WEIGHT = 4 * (32 + 4 + 1 + 4) + (1 + 1 + 72 + 1 + 33)  # outpoint, empty scriptSig, sequence + witness
+P2WPKH_SCRIPT_LEN = 22
+DUST_LIMIT = 546  # Change below this is added to the fee instead
+MIN_CHANGE = 1000  # Knapsack aims for at least this much change
+BNB_MAX_TRIES = 100000
+KNAPSACK_ITERATIONS = 100  # Core uses 1000, a Pi Zero gets most of the benefit from far fewer
+
+
+# ==========================
+# Weight and fee estimation
+# ==========================
+def varint_size(n):
+    return 1 if n < 0xfd else 3 if n <= 0xffff else 5 if n <= 0xffffffff else 9
+
+
+def output_weight(script_len):
+    """Weight of one output: 8-byte value, script length varint and script."""
+    return 4 * (8 + varint_size(script_len) + script_len)
+
+
+def estimate_weight(n_inputs, output_script_lens):
+    """Weight of a transaction spending n P2WPKH inputs to outputs with the given script lengths."""
+    return (TX_OVERHEAD_WEIGHT
+            + 4 * (varint_size(n_inputs) + varint_size(len(output_script_lens)))
+            + n_inputs * P2WPKH_INPUT_WEIGHT
+            + sum(output_weight(script_len) for script_len in output_script_lens))
+
+
+def estimate_vsize(n_inputs, output_script_lens):
+    return math.ceil(estimate_weight(n_inputs, output_script_lens) / 4)
+
+
+def estimate_fee(n_inputs, output_script_lens, fee_rate):
+    """Fee in satoshis for a fee rate in sat/vB."""
+    return math.ceil(estimate_vsize(n_inputs, output_script_lens) * fee_rate)
+
+
+def input_fee(fee_rate):
+    return P2WPKH_INPUT_WEIGHT * fee_rate / 4
+
+
+def effective_value(utxo, fee_rate):
+    """What an input is worth after paying for its own space at fee_rate."""
+    return utxo['value'] - input_fee(fee_rate)
+
+
+# ==========================
+# Economical consolidation
+# ==========================
+def economical_consolidation(utxos, fee_rate):
+    """Split UTXOs into (worth spending, uneconomic) at the current fee rate."""
+    kept, dropped = [], []
+    for utxo in utxos:
+        (kept if effective_value(utxo, fee_rate) > 0 else dropped).append(utxo)
+    return kept, dropped
+
+
+# ==========================
+# Branch and bound (changeless)
+# ==========================
+def select_bnb(utxos, target, fee_rate, cost_of_change, max_tries=BNB_MAX_TRIES):
+    """Search for an input set whose effective value lands in [target, target + cost_of_change].
+
+    Depth-first search over UTXOs sorted by effective value, as in Bitcoin Core,
+    minimising the excess. Returns the selected UTXOs or None.
+    """
+    pool = sorted(((effective_value(u, fee_rate), u) for u in utxos), key=lambda item: item[0], reverse=True)
+    pool = [item for item in pool if item[0] > 0]
+    values = [item[0] for item in pool]
+    curr_available = sum(values)
+    if curr_available < target:
+        return None
+
+    curr_value, curr_selection = 0, []
+    best_selection, best_waste = None, math.inf
+    index = 0
+    for _ in range(max_tries):
+        backtrack = False
+        if curr_value + curr_available < target or curr_value > target + cost_of_change:
+            backtrack = True
+        elif curr_value >= target:
+            waste = curr_value - target
+            if waste <= best_waste:
+                best_selection, best_waste = list(curr_selection), waste
+                if waste == 0:
+                    break
+            backtrack = True
+
+        if backtrack:
+            if not curr_selection:
+                break
+            # Put the UTXOs skipped after the last inclusion back into the lookahead
+            index -= 1
+            while index > curr_selection[-1]:
+                curr_available += values[index]
+                index -= 1
+            # The last included UTXO now takes its omission branch
+            curr_value -= values[curr_selection.pop()]
+        else:
+            curr_available -= values[index]
+            # Skip inclusion if an equal value UTXO right before was just omitted, same subtree
+            if not curr_selection or index - 1 == curr_selection[-1] or values[index] != values[index - 1]:
+                curr_selection.append(index)
+                curr_value += values[index]
+        index += 1
+
+    if best_selection is None:
+        return None
+    return [pool[i][1] for i in best_selection]
+
+
+# ==========================
+# Knapsack fallback (with change)
+# ==========================
+def approximate_best_subset(values, total, target, iterations, rng):
+    best, best_value = [True] * len(values), total
+    for _ in range(iterations):
+        if best_value == target:
+            break
+        included, subtotal, reached = [False] * len(values), 0, False
+        for npass in range(2):
+            if reached:
+                break
+            for i, value in enumerate(values):
+                if (rng.random() < 0.5) if npass == 0 else not included[i]:
+                    subtotal += value
+                    included[i] = True
+                    if subtotal >= target:
+                        reached = True
+                        if subtotal < best_value:
+                            best, best_value = list(included), subtotal
+                        subtotal -= value
+                        included[i] = False
+    return best, best_value
+
+
+def select_knapsack(utxos, target, fee_rate, iterations=KNAPSACK_ITERATIONS, rng=None):
+    """Bitcoin Core style stochastic knapsack. Returns the selected UTXOs or None."""
+    rng = rng or random.Random()
+    pool = [(effective_value(u, fee_rate), u) for u in utxos]
+    pool = [item for item in pool if item[0] > 0]
+
+    smaller, lowest_larger = [], None
+    for item in pool:
+        if item[0] == target:
+            return [item[1]]
+        if item[0] < target:
+            smaller.append(item)
+        elif lowest_larger is None or item[0] < lowest_larger[0]:
+            lowest_larger = item
+
+    total_smaller = sum(item[0] for item in smaller)
+    if total_smaller == target:
+        return [item[1] for item in smaller]
+    if total_smaller < target:
+        return [lowest_larger[1]] if lowest_larger else None
+
+    smaller.sort(key=lambda item: item[0], reverse=True)
+    best, best_value = approximate_best_subset([item[0] for item in smaller], total_smaller, target, iterations, rng)
+    if lowest_larger and best_value != target and lowest_larger[0] <= best_value:
+        return [lowest_larger[1]]
+    return [item[1] for item, chosen in zip(smaller, best) if chosen]
+
+
+# ==========================
+# Coin selection entry point
+# ==========================
+def select_coins(utxos, amount, fee_rate, recipient_script_len=P2WPKH_SCRIPT_LEN, change_script_len=P2WPKH_SCRIPT_LEN):
+    """Pick inputs to pay amount at fee_rate, trying a changeless BnB solution first.
+
+    Returns a dict with the selected UTXOs, the algorithm used, fee and change
+    (0 when there is no change output). Raises ValueError on insufficient funds.
+    """
+    # Fee for everything except the inputs, which effective values already pay for
+    base_fee = estimate_fee(0, [recipient_script_len], fee_rate)
+    change_fee = math.ceil(output_weight(change_script_len) * fee_rate / 4)
+    cost_of_change = change_fee + math.ceil(input_fee(fee_rate))
+
+    algorithm = 'bnb'
+    selected = select_bnb(utxos, amount + base_fee, fee_rate, cost_of_change)
+    if selected is None:
+        algorithm = 'knapsack'
+        selected = select_knapsack(utxos, amount + base_fee + change_fee + MIN_CHANGE, fee_rate)
+    if selected is None:
+        # Not enough for a comfortable change output, try to spend without one
+        selected = select_knapsack(utxos, amount + base_fee, fee_rate)
+    if selected is None:
+        raise ValueError("Insufficient funds for this amount at the current fee rate")
+
+    input_value = sum(u['value'] for u in selected)
+    fee = estimate_fee(len(selected), [recipient_script_len, change_script_len], fee_rate)
+    change = input_value - amount - fee
+    if algorithm == 'bnb' or change < DUST_LIMIT:
+        # No change output, whatever is left over goes to the miners
+        fee = input_value - amount
+        change = 0
+    return {'selected': selected, 'algorithm': algorithm, 'input_value': input_value, 'fee': fee, 'change': change}
@@ -1,12 +1,18 @@
 import os
+import sys
 import json
-import requests
-import ccxt
-import pandas as pd
-import talib
-import yfinance as yf
-from datetime import datetime, timedelta
-from bip_utils import Bip84, Bip84Coins, Bip44Changes
+import time
+import asyncio
+from datetime import datetime, timezone
+from address_index import AddressIndex, CHAIN_EXT
+from http_client import get_json
+from candle_store import CandleStore
+from action_log import ActionLog
+from footprint import timed_import, report
+from exchange_snapshot import (EXCHANGE_NAMES, SYMBOL, exchange_config, has_credentials, open_exchanges,
+                               close_exchanges, snapshot_exchanges, print_snapshot)
+from exchange_quotes import QuoteCache, ticker_quote, withdraw_share, print_quotes
+import market_cache
 
 # ==========================
 # Configuration Constants
@@ -14,6 +20,16 @@ from bip_utils import Bip84, Bip84Coins, Bip44Changes
 BUY_AMOUNT = 30  # Amount in USD to buy
 BTC_THRESHOLD = 90  # Threshold in USD to withdraw
 RSI_PERIOD = 14
+RSI_WINDOW = 24  # Hourly RSI values checked for a buy signal
+RSI_BUY_LEVEL = 20
+FNG_EXTREME_FEAR = 25
+WITHDRAW_COOLDOWN = 6 * 3600  # Seconds, an exchange may still show a withdrawal's balance while processing it
+WITHDRAWAL_PARAMS = {
+    'bybit': {'chain': 'BTC'},
+    'bitget': {'chain': 'BTC'},
+    'kucoin': {'network': 'BTC'},
+    'mexc': {'chain': 'BTC'},
+}
 
 # ==========================
 # Helper Functions
@@ -23,137 +39,188 @@ def load_json(file_or_url):
     if os.path.exists(file_or_url):
         with open(file_or_url, 'r') as f:
             return json.load(f)
-    response = requests.get(file_or_url)
-    if response.status_code == 200:
-        return response.json()
+    data = get_json(file_or_url)
+    if data is not None:
+        return data
     raise ValueError(f"Failed to load data from {file_or_url}")
 
 
 def fetch_utxos(address):
     """Fetch UTXOs for a given Bitcoin address."""
     url = f"https://blockstream.info/api/address/{address}/utxo"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    return []
+    return get_json(url) or []
 
 
 def generate_first_address(zpub):
     """Generate the first Bitcoin address from a given zpub using BIP84 (index 0)."""
-    bip84_ctx = Bip84.FromExtendedKey(zpub, Bip84Coins.BITCOIN)
-    return bip84_ctx.Change(Bip44Changes.CHAIN_EXT).AddressIndex(0).PublicKey().ToAddress()
+    return AddressIndex(zpub).address(CHAIN_EXT, 0)
 
 
-def fetch_rsi_signals(btc_data, rsi_period):
-    """Fetch RSI signals over the last 38 hours of Bitcoin data."""
-    last_24_hours = btc_data.tail(38)
-    last_24_hours['RSI'] = talib.RSI(last_24_hours['Close'], timeperiod=rsi_period)
-    buy_signals = last_24_hours[last_24_hours['RSI'] < 20]
-    print(f"RSI values for the last 24 hours:\n{last_24_hours['RSI']}")
-    print(f"Buy signals (RSI < 20) found: {len(buy_signals)}")
+def fetch_rsi_signals(store, rsi_period):
+    """Count buy signals (RSI below RSI_BUY_LEVEL) over the last RSI_WINDOW hourly candles."""
+    rsi_values = store.rsi_values(rsi_period, RSI_WINDOW)
+    buy_signals = [value for _, value in rsi_values if value < RSI_BUY_LEVEL]
+    print("RSI values for the last 24 hours:")
+    for ts, value in rsi_values:
+        print(f"  {datetime.fromtimestamp(ts, timezone.utc):%Y-%m-%d %H:%M}  {value:.2f}")
+    print(f"Buy signals (RSI < {RSI_BUY_LEVEL}) found: {len(buy_signals)}")
     return len(buy_signals)
 
 
-def fetch_fear_and_greed_index():
-    """Fetch the Fear and Greed Index and check for extreme fear."""
-    fng_data = load_json("https://api.alternative.me/fng/?limit=1")['data'][0]
-    fng_value = int(fng_data['value'])
-    print(f"Fear and Greed Index: {fng_value}, Extreme fear: {fng_value <= 25}")
-    return fng_value <= 25
+def fetch_fear_and_greed_index(store):
+    """Check the Fear and Greed Index for extreme fear, fetched at most once per published value."""
+    fng_value = store.fear_greed()
+    print(f"Fear and Greed Index: {fng_value}, Extreme fear: {fng_value <= FNG_EXTREME_FEAR}")
+    return fng_value <= FNG_EXTREME_FEAR
 
 
-def find_best_exchange_for_btc(exchanges):
-    """Find the best exchange to buy BTC based on the lowest BTC/USDT price."""
-    best_price = float('inf')
-    best_exchange = None
+async def fetch_market_state(exchanges, quote_cache, buy_amount=None, btc_threshold=BTC_THRESHOLD):
+    """Return (snapshot, quotes). Order books are only read when a buy is due, alongside the snapshot."""
+    if buy_amount is None:
+        return await snapshot_exchanges(exchanges), {}
+    snapshot, quotes = await asyncio.gather(snapshot_exchanges(exchanges),
+                                            quote_cache.quotes(exchanges, buy_amount, btc_threshold))
+    return snapshot, quotes
 
-    for exchange_name, exchange in exchanges.items():
-        try:
-            if not exchange.apiKey or not exchange.secret:
-                print(f"Skipping {exchange_name} due to missing API credentials.")
-                continue
-
-            ticker = exchange.fetch_ticker('BTC/USDT')
-            price = ticker['last']
-            print(f"{exchange_name} offers BTC/USDT at {price} USD")
-
-            if price < best_price:
-                best_price = price
-                best_exchange = exchange_name
-
-        except Exception as e:
-            print(f"Failed to fetch ticker from {exchange_name}: {e}")
 
-    if best_exchange:
-        print(f"Best exchange to buy BTC: {best_exchange} at {best_price} USD")
-    return best_exchange, best_price
-
-
-def execute_buy_order(exchange, buy_amount, best_price):
-    """Execute a market buy order for BTC/USDT."""
+async def fetch_market_state_once(api_keys, buy_amount=None):
+    exchanges = open_exchanges(api_keys)
     try:
-        balance = exchange.fetch_balance()['total'].get('USDT', 0)
-        print(f"Balance on exchange: {balance} USDT")
+        return await fetch_market_state(exchanges, QuoteCache(), buy_amount)
+    finally:
+        await close_exchanges(exchanges)
+
+
+def find_best_exchange_for_btc(snapshot, quotes, exchanges, buy_amount=BUY_AMOUNT, btc_threshold=BTC_THRESHOLD):
+    """Route the buy to the lowest all-in cost (depth, taker and withdrawal fees) among exchanges with enough USDT.
+
+    An exchange whose order book could not be read is quoted at its ticker price.
+    """
+    print_quotes(quotes)
+    candidates = []
+    for state in snapshot.available():
+        balance = snapshot.balance(state.name, 'USDT')
+        if balance < buy_amount:
+            print(f"Insufficient balance on {state.name} to buy BTC: {balance} USDT")
+            continue
+        quote = quotes.get(state.name)
+        if quote is None or not quote.ok:
+            quote = ticker_quote(state.name, exchanges[state.name], state.price, buy_amount,
+                                 withdraw_share(buy_amount, btc_threshold))
+        candidates.append(quote)
+
+    best = min(candidates, key=lambda quote: quote.all_in_price, default=None)
+    if best is not None:
+        print(f"Best exchange to buy BTC: {best.exchange} at {best.avg_price:.2f} USD, "
+              f"{best.all_in_price:.2f} USD per BTC withdrawn")
+    return best
+
+
+def buy_key(now=None):
+    """One buy per UTC day, the cadence of the original once-per-boot run."""
+    return f"buy:{datetime.fromtimestamp(now or time.time(), timezone.utc):%Y-%m-%d}"
+
+
+def claim_withdrawal(actions, exchange_name, btc_balance, now=None):
+    """Claim a withdrawal unless one from this exchange may still be in flight. Returns the key or None."""
+    now = now or time.time()
+    if actions.recent('withdraw', exchange_name, WITHDRAW_COOLDOWN):
+        print(f"A withdrawal from {exchange_name} was made in the last {WITHDRAW_COOLDOWN // 3600}h, skipping")
+        return None
+    key = f"withdraw:{exchange_name}:{int(now // WITHDRAW_COOLDOWN)}"
+    return key if actions.claim(key, 'withdraw', exchange_name, amount=btc_balance) else None
+
+
+def settle(actions, key, error=None, **details):
+    """Finish a claimed action after the exchange call.
+
+    A definite rejection releases the claim so a later run may try again, a
+    network error leaves it blocked because the request may have gone through.
+    """
+    if error is None:
+        actions.finish(key, 'done', **details)
+    elif isinstance(error, timed_import('ccxt').NetworkError):
+        actions.finish(key, 'unknown', error=str(error))
+        print(f"Outcome of {key} is unknown, check the exchange manually")
+    else:
+        actions.release(key)
+
+
+def execute_buy_order(exchange, quote):
+    """Execute a market buy order for BTC/USDT, sized from the quoted fill. Returns the order, raises on failure."""
+    order = exchange.create_market_buy_order(SYMBOL, quote.btc_amount)
+    print(f"Bought {quote.buy_amount} USD worth of BTC on {quote.exchange}")
+    return order
+
+
+def buy_btc(actions, exchange, snapshot, quote):
+    """Buy on the chosen exchange at most once per day, then refresh only that exchange's balance."""
+    exchange_name = quote.exchange
+    key = buy_key()
+    if not actions.claim(key, 'buy', exchange_name, amount=quote.buy_amount, price=quote.avg_price,
+                         all_in_price=quote.all_in_price):
+        print(f"Already bought today ({key}), skipping")
+        return
 
-        if balance >= buy_amount:
-            symbol = 'BTC/USDT'
-            order = exchange.create_market_buy_order(symbol, buy_amount / best_price)
-            print(f"Bought {buy_amount} USD worth of BTC on exchange")
-        else:
-            print(f"Insufficient balance to buy BTC.")
+    try:
+        order = execute_buy_order(exchange, quote)
     except Exception as e:
         print(f"Failed to buy BTC: {e}")
+        settle(actions, key, e)
+        return
+    settle(actions, key, order_id=order.get('id'))
+
+    try:
+        snapshot.update_balances(exchange_name, exchange.fetch_balance()['total'])
+    except Exception as e:
+        print(f"Failed to refresh balance on {exchange_name}: {e}")
+
+
+def withdrawal_candidates(snapshot, btc_threshold):
+    """Return [(exchange name, BTC balance)] for every exchange whose BTC is worth at least btc_threshold."""
+    candidates = []
+    for state in snapshot.available():
+        btc_balance = snapshot.balance(state.name, 'BTC')
+        btc_value = btc_balance * state.price
+        print(f"BTC balance on {state.name}: {btc_balance}, valued at {btc_value} USD")
+        if btc_value >= btc_threshold:
+            candidates.append((state.name, btc_balance))
+        else:
+            print(f"BTC value on {state.name} is below the threshold for withdrawal: {btc_value} USD")
+    return candidates
 
 
-def check_and_withdraw_btc(exchanges, first_address, btc_threshold):
-    """Check balances and withdraw BTC if the value exceeds a threshold."""
-    for exchange_name, exchange in exchanges.items():
+def check_and_withdraw_btc(actions, exchanges, snapshot, first_address, btc_threshold):
+    """Withdraw BTC from every exchange whose snapshot balance exceeds a threshold."""
+    for exchange_name, btc_balance in withdrawal_candidates(snapshot, btc_threshold):
+        key = claim_withdrawal(actions, exchange_name, btc_balance)
+        if key is None:
+            continue
+        params = WITHDRAWAL_PARAMS.get(exchange_name, {})
+        print(f"Attempting to withdraw from {exchange_name}...")
+        print(f"BTC Balance: {btc_balance}, Address: {first_address}, Params: {params}")
+
+        # Execute the withdrawal
         try:
-            if not exchange.apiKey or not exchange.secret:
-                print(f"Skipping {exchange_name} due to missing API credentials.")
-                continue
-
-            # Fetch BTC balance
-            btc_balance = exchange.fetch_balance()['total'].get('BTC', 0)
-            btc_price = exchange.fetch_ticker('BTC/USDT')['last']
-            btc_value = btc_balance * btc_price
-
-            print(f"BTC balance on {exchange_name}: {btc_balance}, valued at {btc_value} USD")
-
-            # Check if BTC value exceeds the threshold for withdrawal
-            if btc_value >= btc_threshold:
-                print(f"Using the first Bitcoin address for withdrawal: {first_address}")
-
-                # Set up withdrawal parameters for specific exchanges
-                withdrawal_params = {}
-                if exchange_name == 'bybit':
-                    withdrawal_params = {'chain': 'BTC'}
-                elif exchange_name == 'bitget':
-                    withdrawal_params = {'chain': 'BTC'}
-                elif exchange_name == 'kucoin':
-                    withdrawal_params = {'network': 'BTC'}
-                elif exchange_name == 'mexc':
-                    withdrawal_params = {'chain': 'BTC'}
-
-                print(f"Attempting to withdraw from {exchange_name}...")
-                print(f"BTC Balance: {btc_balance}, Address: {first_address}, Params: {withdrawal_params}")
-
-                # Execute the withdrawal
-                try:
-                    withdrawal = exchange.withdraw('BTC', btc_balance, first_address, None, withdrawal_params)
-                    print(f"Withdrew {btc_balance} BTC from {exchange_name} to {first_address}")
-                except Exception as e:
-                    print(f"Failed to withdraw from {exchange_name}: {e}")
-            else:
-                print(f"BTC value on {exchange_name} is below the threshold for withdrawal: {btc_value} USD")
+            withdrawal = exchanges[exchange_name].withdraw('BTC', btc_balance, first_address, None, params)
+            print(f"Withdrew {btc_balance} BTC from {exchange_name} to {first_address}")
         except Exception as e:
-            print(f"Failed to fetch balance on {exchange_name}: {e}")
+            print(f"Failed to withdraw from {exchange_name}: {e}")
+            settle(actions, key, e)
+            continue
+        settle(actions, key, withdrawal_id=withdrawal.get('id'))
 
 
 # ==========================
 # Main Bot Logic
 # ==========================
 def main():
+    if '--daemon' in sys.argv:
+        from dca_daemon import run_daemon
+        asyncio.run(run_daemon())
+        return
+    started = time.monotonic()
+
     # Load API keys and zpub from JSON files
     api_keys = load_json("api_keys.json")
     zpub = load_json("zpub.json").get("zpub")
@@ -167,34 +234,48 @@ def main():
     print("- Kucoin")
     print("- MEXC")
 
-    # Setup exchange credentials
-    EXCHANGES = {
-        'bybit': ccxt.bybit({'apiKey': api_keys.get('bybit', {}).get('apiKey'), 'secret': api_keys.get('bybit', {}).get('secret')}),
-        'bitget': ccxt.bitget({'apiKey': api_keys.get('bitget', {}).get('apiKey'), 'secret': api_keys.get('bitget', {}).get('secret'), 'password': api_keys.get('bitget', {}).get('password')}),
-        'kucoin': ccxt.kucoin({'apiKey': api_keys.get('kucoin', {}).get('apiKey'), 'secret': api_keys.get('kucoin', {}).get('secret'), 'password': api_keys.get('kucoin', {}).get('password')}),
-        'mexc': ccxt.mexc({'apiKey': api_keys.get('mexc', {}).get('apiKey'), 'secret': api_keys.get('mexc', {}).get('secret')}),
-    }
+    # Setup exchange credentials, these clients are only used to trade and withdraw
+    ccxt = timed_import('ccxt')
+    configs = {name: exchange_config(api_keys, name) for name in EXCHANGE_NAMES}
+    EXCHANGES = {name: getattr(ccxt, name)(config) for name, config in configs.items()}
 
-    # Fetch Bitcoin price data for the last 5 days
-    end_date = datetime.today()
-    start_date = end_date - timedelta(days=5)
-    btc = yf.download('BTC-USD', start=start_date.strftime('%Y-%m-%d'), end=end_date.strftime('%Y-%m-%d'), interval='1h')
-    btc.index = btc.index.tz_convert('UTC')
+    # Market metadata comes from market_cache/ instead of a full load_markets per exchange
+    start = time.monotonic()
+    refresh_thread = market_cache.prepare({name: config for name, config in configs.items() if has_credentials(config)})
+    warmed = [name for name, exchange in EXCHANGES.items() if market_cache.warm(exchange, name)]
+    print(f"Market metadata ready for {', '.join(warmed) or 'no exchanges'} in {time.monotonic() - start:.2f}s")
+
+    # Only candles newer than the last stored one are downloaded, RSI is updated incrementally
+    store = CandleStore()
+    added = store.sync()
+    print(f"Added {added} new hourly candle(s) to the candle store")
 
     # Fetch RSI signals for the last 24 hours
-    buy_signals = fetch_rsi_signals(btc, RSI_PERIOD)
+    buy_signals = fetch_rsi_signals(store, RSI_PERIOD)
 
     # Check the Fear and Greed Index
-    extreme_fear = fetch_fear_and_greed_index()
+    extreme_fear = fetch_fear_and_greed_index(store)
+
+    # Tickers and balances of all exchanges at once, plus order book quotes if a buy is due
+    buy_due = buy_signals > 0 or extreme_fear
+    snapshot, quotes = asyncio.run(fetch_market_state_once(api_keys, BUY_AMOUNT if buy_due else None))
+    print_snapshot(snapshot)
+
+    # Orders and withdrawals are recorded before they are sent, shared with the daemon mode
+    actions = ActionLog()
 
     # Determine if a buy order should be placed
-    if buy_signals > 0 or extreme_fear:
-        best_exchange, best_price = find_best_exchange_for_btc(EXCHANGES)
-        if best_exchange:
-            execute_buy_order(EXCHANGES[best_exchange], BUY_AMOUNT, best_price)
+    if buy_due:
+        quote = find_best_exchange_for_btc(snapshot, quotes, EXCHANGES)
+        if quote:
+            buy_btc(actions, EXCHANGES[quote.exchange], snapshot, quote)
 
     # Withdraw BTC if the balance exceeds the threshold
-    check_and_withdraw_btc(EXCHANGES, first_address, BTC_THRESHOLD)
+    check_and_withdraw_btc(actions, EXCHANGES, snapshot, first_address, BTC_THRESHOLD)
+
+    if refresh_thread is not None:
+        refresh_thread.join()
+    report("DCA run", started)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,188 @@
+import os
+import time
+import signal
+import asyncio
+from datetime import datetime, timezone
+import dca
+import market_cache
+from candle_store import CandleStore, CANDLE_SECONDS
+from action_log import ActionLog
+from footprint import report
+from exchange_snapshot import (EXCHANGE_NAMES, exchange_config, has_credentials, open_exchanges, close_exchanges,
+                               print_snapshot)
+from exchange_quotes import QuoteCache
+
+# ==========================
+# Configuration Constants
+# ==========================
+API_KEYS_FILE = "api_keys.json"
+CANDLE_DELAY = 90  # Seconds after the hourly close before yfinance serves the closed candle
+RETRY_INTERVAL = 300  # Seconds before asking again when a closed candle was not served yet
+MIN_SLEEP = 5
+
+
+class WarmClients:
+    """Async ccxt clients kept open between runs.
+
+    Their HTTP sessions, markets and rate limiter survive from one candle to
+    the next. The clients are reopened when api_keys.json changes and
+    re-warmed once the market cache has been refreshed.
+    """
+
+    def __init__(self, path=API_KEYS_FILE):
+        self.path = path
+        self.mtime = None
+        self.warmed_at = 0
+        self.configs = {}
+        self.exchanges = {}
+
+    async def get(self):
+        loop = asyncio.get_running_loop()
+        mtime = os.path.getmtime(self.path)
+        if mtime != self.mtime:
+            await self.close()
+            api_keys = dca.load_json(self.path)
+            configs = {name: exchange_config(api_keys, name) for name in EXCHANGE_NAMES}
+            self.configs = {name: config for name, config in configs.items() if has_credentials(config)}
+            await self.refresh_markets()
+            self.exchanges = open_exchanges(api_keys)
+            self.mtime = mtime
+        elif time.time() - self.warmed_at > market_cache.MARKETS_TTL:
+            await self.refresh_markets()
+            for name, exchange in self.exchanges.items():
+                await loop.run_in_executor(None, market_cache.warm, exchange, name)
+        return self.exchanges
+
+    async def refresh_markets(self):
+        # A one-shot run leaves stale caches to a background thread, here the next candle is an hour away
+        loop = asyncio.get_running_loop()
+        thread = await loop.run_in_executor(None, market_cache.prepare, self.configs)
+        if thread is not None:
+            await loop.run_in_executor(None, thread.join)
+        self.warmed_at = time.time()
+
+    async def close(self):
+        await close_exchanges(self.exchanges)
+        self.exchanges = {}
+
+
+# ==========================
+# Guarded exchange calls
+# ==========================
+async def buy_btc(actions, exchange, snapshot, quote):
+    """Async counterpart of dca.buy_btc for the warm clients, with the same once-per-day record."""
+    exchange_name = quote.exchange
+    key = dca.buy_key()
+    if not actions.claim(key, 'buy', exchange_name, amount=quote.buy_amount, price=quote.avg_price,
+                         all_in_price=quote.all_in_price):
+        print(f"Already bought today ({key}), skipping")
+        return
+
+    try:
+        order = await exchange.create_market_buy_order(dca.SYMBOL, quote.btc_amount)
+        print(f"Bought {quote.buy_amount} USD worth of BTC on {exchange_name}")
+    except Exception as e:
+        print(f"Failed to buy BTC: {e}")
+        dca.settle(actions, key, e)
+        return
+    dca.settle(actions, key, order_id=order.get('id'))
+
+    try:
+        snapshot.update_balances(exchange_name, (await exchange.fetch_balance())['total'])
+    except Exception as e:
+        print(f"Failed to refresh balance on {exchange_name}: {e}")
+
+
+async def withdraw_btc(actions, exchanges, snapshot, first_address, btc_threshold=dca.BTC_THRESHOLD):
+    """Async counterpart of dca.check_and_withdraw_btc."""
+    for exchange_name, btc_balance in dca.withdrawal_candidates(snapshot, btc_threshold):
+        key = dca.claim_withdrawal(actions, exchange_name, btc_balance)
+        if key is None:
+            continue
+        params = dca.WITHDRAWAL_PARAMS.get(exchange_name, {})
+        print(f"Attempting to withdraw {btc_balance} BTC from {exchange_name} to {first_address}, Params: {params}")
+        try:
+            withdrawal = await exchanges[exchange_name].withdraw('BTC', btc_balance, first_address, None, params)
+            print(f"Withdrew {btc_balance} BTC from {exchange_name} to {first_address}")
+        except Exception as e:
+            print(f"Failed to withdraw from {exchange_name}: {e}")
+            dca.settle(actions, key, e)
+            continue
+        dca.settle(actions, key, withdrawal_id=withdrawal.get('id'))
+
+
+# ==========================
+# Scheduling
+# ==========================
+def next_wake(store, now):
+    """Shortly after the next hourly close, or earlier when a new Fear & Greed value is due."""
+    wake = (now // CANDLE_SECONDS + 1) * CANDLE_SECONDS + CANDLE_DELAY
+    last = store.last_timestamp()
+    if last is not None and last + 2 * CANDLE_SECONDS <= now:
+        # The last closed candle was not served yet, ask again soon instead of waiting an hour
+        wake = min(wake, now + RETRY_INTERVAL)
+    expires = store.fear_greed_expires()
+    if expires is not None and now < expires < wake:
+        wake = expires
+    return max(wake, now + MIN_SLEEP)
+
+
+async def run_once(clients, quote_cache, store, actions, first_address):
+    loop = asyncio.get_running_loop()
+    added = await loop.run_in_executor(None, store.sync)
+    print(f"Added {added} new hourly candle(s) to the candle store")
+    buy_signals = await loop.run_in_executor(None, dca.fetch_rsi_signals, store, dca.RSI_PERIOD)
+    extreme_fear = await loop.run_in_executor(None, dca.fetch_fear_and_greed_index, store)
+
+    buy_due = buy_signals > 0 or extreme_fear
+    exchanges = await clients.get()
+    snapshot, quotes = await dca.fetch_market_state(exchanges, quote_cache, dca.BUY_AMOUNT if buy_due else None)
+    print_snapshot(snapshot)
+
+    if buy_due:
+        quote = dca.find_best_exchange_for_btc(snapshot, quotes, exchanges)
+        if quote:
+            await buy_btc(actions, exchanges[quote.exchange], snapshot, quote)
+    await withdraw_btc(actions, exchanges, snapshot, first_address)
+
+
+# ==========================
+# Daemon entry point
+# ==========================
+async def run_daemon():
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    first_address = dca.generate_first_address(dca.load_json("zpub.json").get("zpub"))
+    print(f"DCA daemon withdrawing to {first_address}")
+    store = CandleStore()
+    actions = ActionLog()
+    clients = WarmClients()
+    quote_cache = QuoteCache()
+
+    for key, kind, exchange, created_at in actions.unresolved():
+        print(f"{key} on {exchange} was started at {datetime.fromtimestamp(created_at, timezone.utc):%Y-%m-%d %H:%M} "
+              f"UTC but never finished, check the exchange manually. It will not be repeated.")
+
+    try:
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                await run_once(clients, quote_cache, store, actions, first_address)
+            except Exception as e:
+                print(f"DCA run failed: {e}")
+            report("DCA run", started)
+
+            wake = next_wake(store, time.time())
+            print(f"Next DCA run at {datetime.fromtimestamp(wake, timezone.utc):%Y-%m-%d %H:%M:%S} UTC")
+            try:
+                await asyncio.wait_for(stop.wait(), wake - time.time())
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        print("Shutting down DCA daemon...")
+        await clients.close()
+        store.close()
+        actions.close()
@@ -0,0 +1,118 @@
+import os
+import time
+import hashlib
+
+# ==========================
+# Configuration Constants
+# ==========================
+FULL_REFRESH_EVERY = 20  # Partial refreshes before a full one clears ghosting
+FULL_REFRESH_INTERVAL = 3600  # Seconds, force a full refresh at least this often
+PARTIAL_MAX_CHANGE = 0.25  # Fraction of changed bytes above which a full refresh looks better
+
+
+def frame_hash(buffer):
+    return hashlib.sha1(bytes(buffer)).hexdigest()
+
+
+def changed_fraction(old, new):
+    if old is None or len(old) != len(new):
+        return 1.0
+    return sum(1 for a, b in zip(old, new) if a != b) / len(new)
+
+
+class DisplayManager:
+    """Only talk to the panel when the frame actually changed.
+
+    Identical frames are skipped, small changes such as a new balance use the
+    partial-refresh path and a full refresh runs on a schedule to clear ghosting.
+    """
+
+    def __init__(self, epd, full_refresh_every=FULL_REFRESH_EVERY, full_refresh_interval=FULL_REFRESH_INTERVAL,
+                 partial_max_change=PARTIAL_MAX_CHANGE, state_file=None):
+        self.epd = epd
+        self.state_file = state_file
+        self.width, self.height = epd.width, epd.height
+        self.full_refresh_every = full_refresh_every
+        self.full_refresh_interval = full_refresh_interval
+        self.partial_max_change = partial_max_change
+        self.last_buffer = None
+        self.last_hash = None
+        self.partials_since_full = 0
+        self.last_full_refresh = 0.0
+        self.asleep = True
+        self.counts = {'skipped': 0, 'partial': 0, 'full': 0}
+        self.refresh_time = {'partial': 0.0, 'full': 0.0}
+
+    def needs_full_refresh(self, buffer):
+        return (self.last_buffer is None
+                or self.partials_since_full >= self.full_refresh_every
+                or time.monotonic() - self.last_full_refresh >= self.full_refresh_interval
+                or changed_fraction(self.last_buffer, buffer) > self.partial_max_change)
+
+    def show(self, img):
+        """Render a landscape PIL image, returns 'skipped', 'partial' or 'full'."""
+        buffer = self.epd.getbuffer(img.rotate(90, expand=True))
+        digest = frame_hash(buffer)
+        if digest == self.last_hash:
+            self.counts['skipped'] += 1
+            return 'skipped'
+
+        mode = 'full' if self.needs_full_refresh(buffer) else 'partial'
+        self.refresh(buffer, mode, clear=True)
+        self.save_frame()
+        return mode
+
+    def refresh(self, buffer, mode, clear=False):
+        start = time.monotonic()
+        self.asleep = False
+        self.epd.init()
+        if mode == 'full':
+            if clear:
+                self.epd.Clear(0xFF)
+            # Writes both RAM banks so the following partial refreshes have a base image
+            self.epd.displayPartBaseImage(buffer)
+            self.partials_since_full = 0
+            self.last_full_refresh = time.monotonic()
+        else:
+            self.epd.displayPartial(buffer)
+            self.partials_since_full += 1
+        self.epd.sleep()
+        self.asleep = True
+
+        self.counts[mode] += 1
+        self.refresh_time[mode] += time.monotonic() - start
+        self.last_buffer, self.last_hash = bytes(buffer), frame_hash(buffer)
+
+    # ==========================
+    # Last frame persistence
+    # ==========================
+    def save_frame(self):
+        if not self.state_file:
+            return
+        try:
+            with open(f"{self.state_file}.tmp", 'wb') as f:
+                f.write(self.last_buffer)
+            os.replace(f"{self.state_file}.tmp", self.state_file)
+        except OSError as e:
+            print(f"Failed to save last frame: {e}")
+
+    def restore(self):
+        """Show the last frame saved on disk without building any image. Returns True if there was one."""
+        if not self.state_file or not os.path.exists(self.state_file):
+            return False
+        with open(self.state_file, 'rb') as f:
+            buffer = f.read()
+        if len(buffer) != (self.width + 7) // 8 * self.height:
+            return False
+        # One full refresh without the extra Clear pass, this is about getting a screen up fast
+        self.refresh(buffer, 'full')
+        return True
+
+    def shutdown(self):
+        """Make sure the panel ends up in deep sleep, e.g. after an interrupted refresh."""
+        if not self.asleep:
+            self.epd.sleep()
+            self.asleep = True
+
+    def stats(self):
+        return {'counts': dict(self.counts), 'refresh_time': dict(self.refresh_time)}
@@ -0,0 +1,223 @@
+import ssl
+import json
+import queue
+import socket
+import hashlib
+import threading
+
+# ==========================
+# Configuration Constants
+# ==========================
+CLIENT_NAME = "piggybank"
+PROTOCOL_VERSION = "1.4"
+TIMEOUT = 20  # Seconds to wait for a response
+
+BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+
+
+class ElectrumError(Exception):
+    pass
+
+
+# ==========================
+# Address helpers
+# ==========================
+def bech32_polymod(values):
+    generator = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
+    chk = 1
+    for value in values:
+        top = chk >> 25
+        chk = (chk & 0x1ffffff) << 5 ^ value
+        for i in range(5):
+            chk ^= generator[i] if ((top >> i) & 1) else 0
+    return chk
+
+
+def decode_segwit_address(address):
+    """Decode a bech32/bech32m address into (witness_version, witness_program)."""
+    address = address.lower()
+    hrp, _, data_part = address.rpartition('1')
+    if not hrp or len(data_part) < 7 or any(c not in BECH32_CHARSET for c in data_part):
+        raise ValueError(f"Invalid segwit address: {address}")
+    data = [BECH32_CHARSET.index(c) for c in data_part]
+    checksum = bech32_polymod([ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp] + data)
+    if checksum not in (1, 0x2bc830a3):
+        raise ValueError(f"Invalid checksum for address: {address}")
+
+    # Regroup the 5-bit words after the version into bytes
+    acc, bits, program = 0, 0, []
+    for value in data[1:-6]:
+        acc = (acc << 5) | value
+        bits += 5
+        if bits >= 8:
+            bits -= 8
+            program.append((acc >> bits) & 0xff)
+    return data[0], bytes(program)
+
+
+def script_for_address(address):
+    """Build the scriptPubKey for a native segwit address."""
+    version, program = decode_segwit_address(address)
+    return bytes([version + 0x50 if version else 0, len(program)]) + program
+
+
+def scripthash_for_script(script):
+    """Electrum indexes scripts by the reversed sha256 of the scriptPubKey."""
+    return hashlib.sha256(script).digest()[::-1].hex()
+
+
+def scripthash_for_address(address):
+    return scripthash_for_script(script_for_address(address))
+
+
+# ==========================
+# JSON-RPC client
+# ==========================
+class ElectrumClient:
+    """Electrum JSON-RPC over one persistent TCP/TLS connection.
+
+    Requests can be sent one by one with call() or as a single batch with
+    batch(). Subscription notifications are pushed onto self.notifications.
+    """
+
+    def __init__(self, host, port, use_ssl=True, verify_ssl=True, timeout=TIMEOUT):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.verify_ssl = verify_ssl
+        self.timeout = timeout
+        self.sock = None
+        self.next_id = 0
+        self.pending = {}
+        self.subscriptions = set()
+        self.notifications = queue.Queue()
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+
+    # ==========================
+    # Connection handling
+    # ==========================
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        if self.use_ssl:
+            context = ssl.create_default_context()
+            if not self.verify_ssl:
+                # Self-signed servers, only when backend.json asks for it with "verify_ssl": false
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            sock = context.wrap_socket(sock, server_hostname=self.host)
+        sock.settimeout(None)
+        self.sock = sock
+        threading.Thread(target=self.read_loop, args=(sock,), daemon=True).start()
+        self.call('server.version', CLIENT_NAME, PROTOCOL_VERSION)
+
+        # Resubscribe after a reconnect so no notification is missed
+        if self.subscriptions:
+            self.batch([('blockchain.scripthash.subscribe', [sh]) for sh in self.subscriptions])
+
+    def ensure_connected(self):
+        if self.sock is None:
+            self.connect()
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+            # Requests sent on the closed socket will never be answered
+            self.fail_pending(ConnectionError("Electrum connection closed"))
+
+    def read_loop(self, sock):
+        reader = sock.makefile('r', encoding='utf-8')
+        try:
+            for line in reader:
+                if line.strip():
+                    self.dispatch(json.loads(line))
+        except (OSError, ValueError) as e:
+            print(f"Electrum connection lost: {e}")
+        finally:
+            # After close() and a reconnect the pending requests belong to the new socket, leave them alone
+            if self.sock is sock:
+                self.sock = None
+                self.fail_pending(ConnectionError("Electrum connection closed"))
+
+    def dispatch(self, message):
+        for item in message if isinstance(message, list) else [message]:
+            if item.get('id') is None and 'method' in item:
+                self.notifications.put((item['method'], item.get('params', [])))
+                continue
+            with self.lock:
+                slot = self.pending.pop(item.get('id'), None)
+            if slot is not None:
+                slot['response'] = item
+                slot['event'].set()
+
+    def fail_pending(self, error):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for slot in pending.values():
+            slot['response'] = {'error': {'message': str(error)}, 'connection_error': True}
+            slot['event'].set()
+
+    # ==========================
+    # Requests
+    # ==========================
+    def send(self, payload):
+        data = (json.dumps(payload) + '\n').encode('utf-8')
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    def register(self, method, params):
+        with self.lock:
+            self.next_id += 1
+            request_id = self.next_id
+            slot = {'event': threading.Event(), 'response': None}
+            self.pending[request_id] = slot
+        return {'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': list(params)}, slot
+
+    def wait_result(self, request, slot):
+        if not slot['event'].wait(self.timeout):
+            with self.lock:
+                self.pending.pop(request['id'], None)
+            raise ElectrumError(f"Timeout waiting for {request['method']}")
+        response = slot['response']
+        if response.get('connection_error'):
+            raise ConnectionError(response['error']['message'])
+        if response.get('error'):
+            raise ElectrumError(f"{request['method']} failed: {response['error']}")
+        return response.get('result')
+
+    def call(self, method, *params):
+        self.ensure_connected()
+        request, slot = self.register(method, params)
+        self.send(request)
+        return self.wait_result(request, slot)
+
+    def batch(self, calls):
+        """Send [(method, params), ...] as one JSON-RPC batch and return results in order."""
+        if not calls:
+            return []
+        self.ensure_connected()
+        registered = [self.register(method, params) for method, params in calls]
+        self.send([request for request, _ in registered])
+        return [self.wait_result(request, slot) for request, slot in registered]
+
+    # ==========================
+    # Scripthash helpers
+    # ==========================
+    def subscribe_scripthashes(self, scripthashes):
+        """Subscribe to status changes, returns the current status per scripthash."""
+        self.subscriptions.update(scripthashes)
+        return self.batch([('blockchain.scripthash.subscribe', [sh]) for sh in scripthashes])
+
+    def wait_for_notification(self, timeout):
+        """Block until a notification arrives or timeout passes. Returns all pending notifications."""
+        try:
+            notifications = [self.notifications.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while not self.notifications.empty():
+            notifications.append(self.notifications.get_nowait())
+        return notifications
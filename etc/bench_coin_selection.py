@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark coin selection and fee estimation with thousands of candidate UTXOs.
+
+    python etc/bench_coin_selection.py --utxos 5000 --fee-rate 15
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from coin_selection import (select_bnb, select_knapsack, select_coins, economical_consolidation,  # noqa: E402
+                            estimate_fee, output_weight, input_fee, P2WPKH_SCRIPT_LEN)
+
+
+def random_utxos(count, rng):
+    # Mostly small piggybank-style deposits with a long tail of larger ones and some dust
+    utxos = []
+    for i in range(count):
+        value = int(rng.lognormvariate(10, 1.5)) + 300
+        utxos.append({'txid': f"{i:064x}", 'vout': 0, 'value': value})
+    return utxos
+
+
+def timed(label, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<36} {elapsed * 1000:9.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--utxos', type=int, default=5000)
+    parser.add_argument('--fee-rate', type=float, default=15)
+    parser.add_argument('--seed', type=int, default=21)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    utxos = random_utxos(args.utxos, rng)
+    total = sum(u['value'] for u in utxos)
+    print(f"{len(utxos)} UTXOs, {total} sats total, fee rate {args.fee_rate} sat/vB\n")
+
+    kept, dropped = timed("economical_consolidation", economical_consolidation, utxos, args.fee_rate)
+    print(f"  kept {len(kept)}, dropped {len(dropped)} uneconomic inputs")
+    timed("estimate_fee (all inputs)", estimate_fee, len(kept), [P2WPKH_SCRIPT_LEN], args.fee_rate)
+
+    cost_of_change = int(output_weight(P2WPKH_SCRIPT_LEN) * args.fee_rate / 4 + input_fee(args.fee_rate))
+    for fraction in (0.001, 0.01, 0.1, 0.5):
+        amount = int(total * fraction)
+        print(f"\nTarget {amount} sats ({fraction:.1%} of the wallet)")
+        bnb = timed("  select_bnb", select_bnb, utxos, amount, args.fee_rate, cost_of_change)
+        print(f"    {'no solution' if bnb is None else f'{len(bnb)} inputs'}")
+        knapsack = timed("  select_knapsack", select_knapsack, utxos, amount, args.fee_rate, rng=rng)
+        print(f"    {'no solution' if knapsack is None else f'{len(knapsack)} inputs'}")
+        result = timed("  select_coins", select_coins, utxos, amount, args.fee_rate)
+        print(f"    {result['algorithm']}: {len(result['selected'])} inputs, fee {result['fee']}, change {result['change']}")
+
+
+if __name__ == "__main__":
+    main()
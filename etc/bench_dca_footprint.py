@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compare import time and peak RSS of the old pandas/TA-Lib stack with the DCA hot path, and check the RSI.
+
+    python etc/bench_dca_footprint.py --candles 2000
+
+Every stack is imported in a fresh interpreter so the numbers do not add
+up. The RSI check compares indicators.wilder_rsi and the incremental
+candle_store.rsi_step with talib.RSI when TA-Lib is installed.
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOT)
+
+STACKS = {
+    'pandas + talib + yfinance + ccxt': ['pandas', 'talib', 'yfinance', 'ccxt'],
+    'dca (hot path)': ['dca'],
+    'dca + ccxt': ['dca', 'ccxt'],
+    'dca + numpy RSI': ['dca', 'indicators'],
+}
+
+PROBE = """
+import sys, json, time, resource, importlib
+start = time.perf_counter()
+for name in sys.argv[1:]:
+    importlib.import_module(name)
+print(json.dumps([time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3]))
+"""
+
+
+def probe(modules):
+    result = subprocess.run([sys.executable, '-c', PROBE] + modules, cwd=ROOT, capture_output=True, text=True)
+    if result.returncode:
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check_rsi(count, period):
+    import numpy as np
+    from indicators import wilder_rsi
+    from candle_store import rsi_step
+
+    rng = np.random.default_rng(1)
+    closes = 30000 * np.exp(np.cumsum(rng.normal(0, 0.004, count)))
+    vectorized = wilder_rsi(closes, period)
+
+    state = {}
+    incremental = np.array([np.nan if value is None else value
+                            for value in (rsi_step(state, close, period) for close in closes.tolist())])
+    print(f"wilder_rsi vs rsi_step: max diff {np.nanmax(np.abs(vectorized - incremental)):.2e}")
+
+    try:
+        import talib
+    except ImportError:
+        print("TA-Lib not installed, skipping the talib.RSI comparison")
+        return
+    reference = talib.RSI(closes, timeperiod=period)
+    same_nan = np.array_equal(np.isnan(reference), np.isnan(vectorized))
+    print(f"wilder_rsi vs talib.RSI: max diff {np.nanmax(np.abs(vectorized - reference)):.2e}, NaN layout equal: {same_nan}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--candles', type=int, default=2000)
+    parser.add_argument('--period', type=int, default=14)
+    args = parser.parse_args()
+
+    print(f"{'stack':<34} {'import s':>9} {'peak MB':>8}")
+    for label, modules in STACKS.items():
+        measured = probe(modules)
+        if measured is None:
+            print(f"{label:<34} {'not installed':>18}")
+        else:
+            print(f"{label:<34} {measured[0]:9.2f} {measured[1]:8.1f}")
+    print()
+    check_rsi(args.candles, args.period)
+
+
+if __name__ == "__main__":
+    main()
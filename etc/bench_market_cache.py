@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Measure cold (load_markets) versus warm (market_cache) ccxt start-up per exchange.
+
+    python etc/bench_market_cache.py --exchanges bybit kucoin
+
+Only public endpoints are used. The cache is written to a temporary directory
+so the real market_cache/ is left alone.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import argparse
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import market_cache  # noqa: E402
+from exchange_snapshot import EXCHANGE_NAMES, SYMBOL  # noqa: E402
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--exchanges', nargs='+', default=list(EXCHANGE_NAMES))
+    args = parser.parse_args()
+
+    import ccxt
+
+    cache_dir = tempfile.mkdtemp(prefix='market_cache-')
+    print(f"{'exchange':<10} {'cold s':>8} {'cold MB':>8} {'warm s':>8} {'warm MB':>8} {'cache KB':>9}")
+    for name in args.exchanges:
+        def cold():
+            exchange = getattr(ccxt, name)()
+            exchange.load_markets()
+            market_cache.save_cache(name, exchange, cache_dir)
+            return exchange
+
+        def warm():
+            exchange = getattr(ccxt, name)()
+            market_cache.warm(exchange, name, cache_dir)
+            # Resolving the traded market must not trigger a download
+            exchange.market(SYMBOL)
+            return exchange
+
+        try:
+            _, cold_time, cold_mb = measure(cold)
+            _, warm_time, warm_mb = measure(warm)
+        except Exception as e:
+            print(f"{name:<10} failed: {e}")
+            continue
+        size = os.path.getsize(market_cache.cache_path(name, cache_dir)) / 1e3
+        print(f"{name:<10} {cold_time:8.2f} {cold_mb:8.1f} {warm_time:8.3f} {warm_mb:8.1f} {size:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
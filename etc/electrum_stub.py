@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Minimal local Electrum server for testing the Electrum backend offline.
+
+Run it, point backend.json at it and type payments on stdin:
+
+    python etc/electrum_stub.py --port 50001
+    {"type": "electrum", "host": "127.0.0.1", "port": 50001, "ssl": false}
+    pay bc1q... 21000
+
+Every payment updates the scripthash history and pushes a
+blockchain.scripthash.subscribe notification to subscribed clients.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+import socketserver
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from electrum_client import scripthash_for_address  # noqa: E402
+
+
+def status_for_history(history):
+    """Electrum status: sha256 of 'txid:height:' for each history entry, None if empty."""
+    if not history:
+        return None
+    return hashlib.sha256(''.join(f"{tx['tx_hash']}:{tx['height']}:" for tx in history).encode()).hexdigest()
+
+
+class StubHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.stub.clients.append(self)
+        try:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                time.sleep(self.server.stub.delay)
+                message = json.loads(line)
+                if isinstance(message, list):
+                    response = [self.server.stub.handle_request(item) for item in message]
+                else:
+                    response = self.server.stub.handle_request(message)
+                self.send(response)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.server.stub.clients.remove(self)
+
+    def send(self, payload):
+        with self.server.stub.lock:
+            self.wfile.write((json.dumps(payload) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class StubElectrumServer:
+    def __init__(self, host='127.0.0.1', port=0, tip_height=850000, delay=0.0):
+        self.tip_height = tip_height
+        self.delay = delay  # Seconds before answering each message, to stand in for a slow server
+        self.history = {}
+        self.unspent = {}
+        self.subscribed = set()
+        self.clients = []
+        self.broadcasts = []
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingServer((host, port), StubHandler)
+        self.server.stub = self
+        self.port = self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_payment(self, address, value, height=0):
+        """Record a payment to address and notify subscribers. Returns the fake txid."""
+        scripthash = scripthash_for_address(address)
+        history = self.history.setdefault(scripthash, [])
+        txid = hashlib.sha256(f"{scripthash}:{len(history)}:{value}".encode()).hexdigest()
+        history.append({'tx_hash': txid, 'height': height})
+        self.unspent.setdefault(scripthash, []).append(
+            {'tx_hash': txid, 'tx_pos': 0, 'height': height, 'value': value})
+        if scripthash in self.subscribed:
+            notification = {'jsonrpc': '2.0', 'method': 'blockchain.scripthash.subscribe',
+                            'params': [scripthash, status_for_history(history)]}
+            for client in list(self.clients):
+                client.send(notification)
+        return txid
+
+    def handle_request(self, request):
+        self.request_count += 1
+        method, params = request.get('method'), request.get('params', [])
+        try:
+            result = self.dispatch(method, params)
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': result}
+        except Exception as e:
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'error': {'code': -32601, 'message': str(e)}}
+
+    def dispatch(self, method, params):
+        if method == 'server.version':
+            return ['ElectrumStub 0.1', '1.4']
+        if method == 'server.ping':
+            return None
+        if method == 'blockchain.headers.subscribe':
+            return {'height': self.tip_height, 'hex': '00' * 80}
+        if method == 'blockchain.estimatefee':
+            return 0.0001
+        if method == 'blockchain.transaction.broadcast':
+            raw_tx = params[0]
+            self.broadcasts.append(raw_tx)
+            return hashlib.sha256(hashlib.sha256(bytes.fromhex(raw_tx)).digest()).digest()[::-1].hex()
+
+        scripthash = params[0]
+        if method == 'blockchain.scripthash.subscribe':
+            self.subscribed.add(scripthash)
+            return status_for_history(self.history.get(scripthash, []))
+        if method == 'blockchain.scripthash.get_history':
+            return self.history.get(scripthash, [])
+        if method == 'blockchain.scripthash.listunspent':
+            return self.unspent.get(scripthash, [])
+        if method == 'blockchain.scripthash.get_balance':
+            unspent = self.unspent.get(scripthash, [])
+            return {'confirmed': sum(u['value'] for u in unspent if u['height'] > 0),
+                    'unconfirmed': sum(u['value'] for u in unspent if u['height'] <= 0)}
+        raise ValueError(f"unknown method {method}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=50001)
+    args = parser.parse_args()
+
+    stub = StubElectrumServer(args.host, args.port).start()
+    print(f"Electrum stub listening on {args.host}:{stub.port}. Type 'pay <address> <sats>' to simulate a payment.")
+    for line in sys.stdin:
+        parts = line.split()
+        if len(parts) == 3 and parts[0] == 'pay':
+            txid = stub.add_payment(parts[1], int(parts[2]))
+            print(f"Paid {parts[2]} sats to {parts[1]} in {txid}")
+        elif parts:
+            print("Usage: pay <address> <sats>")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Check that a transaction that keeps failing does not hold up the rest of the broadcast queue.
+
+    python etc/test_broadcast_queue.py
+
+Two transactions are queued on a stand-in backend that fails every round of
+the first one with a network error and accepts the second. The retry backoff
+and confirmation poll are shortened so the test takes a few seconds. The
+second transaction must be broadcast and confirmed while the first one is
+still being retried, and the first one must fail after MAX_ATTEMPTS rounds.
+Exits non-zero if a check fails.
+"""
+
+import os
+import sys
+import time
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import broadcast_queue  # noqa: E402
+
+FAILING, GOOD = 'aa' * 32, 'bb' * 32
+
+
+class StandInBroadcaster:
+    """Fails FAILING with a network error, accepts anything else and reports it confirmed."""
+    name = 'stand-in'
+
+    def __init__(self):
+        self.rounds = {}
+        self.lock = threading.Lock()
+
+    def broadcast(self, raw_tx):
+        with self.lock:
+            self.rounds[raw_tx] = self.rounds.get(raw_tx, 0) + 1
+        if raw_tx == FAILING:
+            raise ConnectionError("backend unreachable")
+        return None
+
+    def tx_status(self, txid):
+        return {'confirmed': True, 'block_height': 850001}
+
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def main():
+    broadcast_queue.RETRY_BASE = 0.2
+    broadcast_queue.CONFIRM_POLL = 0.5
+    backend = StandInBroadcaster()
+    queue = broadcast_queue.BroadcastQueue(broadcasters=[backend], status_file=None)
+
+    failures = []
+
+    def check(ok, message):
+        print(f"{'ok  ' if ok else 'FAIL'} {message}")
+        if not ok:
+            failures.append(message)
+
+    queue.ensure_worker()
+    # The raw transaction stands in for itself, submit() would only add PSBT finalization
+    for txid in (FAILING, GOOD):
+        queue.update(txid, state='queued', attempts=0, errors={}, raw_tx=txid, submitted_at=time.time())
+        queue.schedule(txid)
+
+    start = time.monotonic()
+    check(wait_for(lambda: queue.status(GOOD)['state'] == 'confirmed', 3),
+          f"second transaction {queue.status(GOOD)['state']} after {time.monotonic() - start:.1f}s")
+    check(queue.status(FAILING)['state'] == 'retrying',
+          f"first transaction {queue.status(FAILING)['state']} meanwhile, {backend.rounds.get(FAILING)} round(s)")
+
+    total_backoff = sum(min(broadcast_queue.RETRY_CAP, broadcast_queue.RETRY_BASE * 2 ** attempt)
+                        for attempt in range(broadcast_queue.MAX_ATTEMPTS - 1))
+    check(wait_for(lambda: queue.status(FAILING)['state'] == 'failed', total_backoff + 3),
+          f"first transaction {queue.status(FAILING)['state']} after {backend.rounds.get(FAILING)} round(s) "
+          f"in {time.monotonic() - start:.1f}s")
+    check(backend.rounds.get(FAILING) == broadcast_queue.MAX_ATTEMPTS and backend.rounds.get(GOOD) == 1,
+          f"rounds per transaction {backend.rounds}")
+
+    print(f"\n{len(failures)} check(s) failed" if failures else "\nAll checks passed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Check that ChainWatcher notices payments to the address on screen, also in a wallet with gaps.
+
+    python etc/test_chain_watcher.py
+
+The Esplora requests are answered from an in-memory chain, and the state
+file goes to a temporary directory. The wallet has a0, a1 and a3 used and
+a2 unused, so the screen shows a2 while the last used address is a3.
+Exits non-zero if a check fails.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import chain_watcher  # noqa: E402
+from address_scan import scan_addresses  # noqa: E402
+
+ADDRESSES = [f"a{i}" for i in range(21)]
+
+
+class FakeChain:
+    """Address stats as fetch_address_stats returns them, with a log of the queried addresses."""
+
+    def __init__(self):
+        self.tip_height = 800000
+        self.received = {}
+        self.queried = []
+
+    def pay(self, address, value):
+        self.received.setdefault(address, []).append(value)
+
+    def stats(self, address):
+        self.queried.append(address)
+        values = self.received.get(address, [])
+        return {'address': address, 'balance': sum(values), 'utxo_count': len(values), 'tx_count': len(values),
+                'mempool_tx_count': 0}
+
+
+def main():
+    chain = FakeChain()
+    chain_watcher.fetch_tip_height = lambda: chain.tip_height
+    chain_watcher.fetch_address_stats = chain.stats
+    chain_watcher.scan_addresses = lambda addresses: scan_addresses(addresses, fetch=chain.stats)
+
+    failures = []
+
+    def check(ok, message):
+        print(f"{'ok  ' if ok else 'FAIL'} {message}")
+        if not ok:
+            failures.append(message)
+
+    for address in ('a0', 'a1', 'a3'):
+        chain.pay(address, 10000)
+    watcher = chain_watcher.ChainWatcher(ADDRESSES, state_file=os.path.join(tempfile.mkdtemp(), 'chain_state.json'))
+    snapshot, _ = watcher.poll()
+    check(snapshot.first_unused == 2, f"screen shows index {snapshot.first_unused} after the first scan")
+
+    # Steady state: the gap is watched along with the next unused address
+    chain.queried = []
+    snapshot, changed = watcher.poll()
+    check(not changed and chain.queried == ['a2', 'a3', 'a4'], f"idle poll queried {chain.queried}")
+
+    # A payment to the address on screen is seen on the next poll, not at the next full rescan
+    chain.pay('a2', 20000)
+    chain.queried = []
+    snapshot, changed = watcher.poll()
+    check(changed and snapshot.first_unused == 4 and snapshot.total_balance == 50000,
+          f"payment to a2 seen: changed={changed}, screen shows index {snapshot.first_unused}, "
+          f"balance {snapshot.total_balance}, queried {chain.queried}")
+
+    # Without gaps a cycle is back to the tip and the address on screen
+    chain.queried = []
+    watcher.poll()
+    check(chain.queried == ['a4'], f"poll without gaps queried {chain.queried}")
+
+    print(f"\n{len(failures)} check(s) failed" if failures else "\nAll checks passed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
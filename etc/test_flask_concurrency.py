@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Check that slow jobs no longer block the web app, against slow local backends.
+
+    python etc/test_flask_concurrency.py --jobs 6 --delay 2 --electrum-delay 0.3
+
+PSBT jobs run the real PSBT service against the local Electrum stub, which
+waits --electrum-delay seconds before answering each message. The wallet is
+the BIP84 test vector account, written with backend.json to a temporary
+directory. A local HTTP server stands in for the Wi-Fi script and answers
+after --delay seconds. The app is served the way `flask_app.py --production`
+serves it. While the jobs wait on their backends, the test checks that
+submissions return a job id at once, other pages stay fast, and every job
+finishes with a server-sent event. Exits non-zero if a check fails.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'etc'))
+import flask_app  # noqa: E402
+from http_client import get_json  # noqa: E402
+from job_queue import JOB_WORKERS  # noqa: E402
+from address_index import AddressIndex, CHAIN_EXT  # noqa: E402
+from electrum_stub import StubElectrumServer  # noqa: E402
+
+FAST = 0.5  # Seconds any request may take while jobs are running
+# BIP84 test vector, mnemonic "abandon abandon ... about"
+ZPUB = "zpub6rFR7y4Q2AijBEqTUquhVz398htDFrtymD9xYYfG1m4wAcvPhXNfE3EfH1r1ADqtfSdVCToUG868RvUUkgDKf31mGDtKsAYz2oz2AGutZYs"
+FINGERPRINT = "73c5da0a"
+RECIPIENT = "bc1qar0srrr7xfkvy5l643lydnw9re59gtzzwf5mdq"
+FEE_RATE = 2
+
+
+class SlowBackend(BaseHTTPRequestHandler):
+    delay = 2.0
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        body = json.dumps({'path': self.path}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def setup_wallet(electrum_delay):
+    """Write the wallet files to a temporary directory and fund three receive addresses on a slow stub."""
+    os.chdir(tempfile.mkdtemp(prefix='flask-concurrency-'))
+    stub = StubElectrumServer(delay=electrum_delay).start()
+    with open('zpub.json', 'w') as f:
+        json.dump({'zpub': ZPUB, 'fingerprint': FINGERPRINT}, f)
+    with open('backend.json', 'w') as f:
+        json.dump({'type': 'electrum', 'host': '127.0.0.1', 'port': stub.port, 'ssl': False}, f)
+    index = AddressIndex(ZPUB)
+    for i in range(3):
+        stub.add_payment(index.address(CHAIN_EXT, i), 50000, height=800000)
+    index.close()
+    return stub
+
+
+def start_app(port):
+    """Serve the app in a background thread like serve(production=True), falling back to werkzeug."""
+    try:
+        from waitress import create_server
+        server = create_server(flask_app.app, host='127.0.0.1', port=port, threads=flask_app.WSGI_THREADS)
+        label = "waitress"
+    except ImportError:
+        from werkzeug.serving import make_server
+        server = make_server('127.0.0.1', port, flask_app.app, threaded=True)
+        label = "werkzeug (waitress not installed)"
+    threading.Thread(target=server.run if label == "waitress" else server.serve_forever, daemon=True).start()
+    return label
+
+
+def request(url, data=None):
+    """Return (seconds, status, body) of a GET, or a form POST when data is given."""
+    body = urllib.parse.urlencode(data).encode() if data is not None else None
+    req = urllib.request.Request(url, data=body, headers={'Accept': 'application/json'})
+    start = time.monotonic()
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            return time.monotonic() - start, response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return time.monotonic() - start, e.code, e.read()
+
+
+def follow_events(url):
+    """Read a server-sent event stream until the job finishes, return the final job."""
+    job = None
+    with urllib.request.urlopen(url, timeout=60) as response:
+        for line in response:
+            line = line.decode().strip()
+            if line.startswith('data: '):
+                job = json.loads(line[len('data: '):])
+                if job['state'] in ('done', 'failed'):
+                    return job
+    return job
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=6)
+    parser.add_argument('--delay', type=float, default=2.0, help="seconds the Wi-Fi stand-in takes per request")
+    parser.add_argument('--electrum-delay', type=float, default=0.3, help="seconds the Electrum stub takes per message")
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    SlowBackend.delay = args.delay
+    backend = ThreadingHTTPServer(('127.0.0.1', 0), SlowBackend)
+    threading.Thread(target=backend.serve_forever, daemon=True).start()
+    backend_url = f"http://127.0.0.1:{backend.server_address[1]}"
+
+    stub = setup_wallet(args.electrum_delay)
+    flask_app.psbt_api.service.fee_cache = (float('inf'), FEE_RATE)  # No mempool.space call
+    flask_app.run_wifi_setup = lambda ssid, password: get_json(f"{backend_url}/wifi/{ssid}") and {"message": "ok"}
+    label = start_app(args.port)
+    base = f"http://127.0.0.1:{args.port}"
+    time.sleep(0.5)
+    print(f"App on {label}, Wi-Fi stand-in delay {args.delay}s, Electrum stub delay {args.electrum_delay}s per message, "
+          f"{JOB_WORKERS} job worker(s)")
+
+    failures = []
+
+    def check(ok, message):
+        print(f"{'ok  ' if ok else 'FAIL'} {message}")
+        if not ok:
+            failures.append(message)
+
+    # Submissions answer with a job id straight away, even while earlier jobs wait on the backend
+    start = time.monotonic()
+    submitted = []
+    lock = threading.Lock()
+
+    def submit(i):
+        if i % 3 == 2:
+            kind, result = 'setup_wifi', request(f"{base}/setup_wifi", {'ssid': f"net{i}", 'password': 'secret'})
+        else:
+            # A sweep first, then payments of different amounts so each job builds its own PSBT
+            amount = str(10000 + 1000 * i) if i else ''
+            kind, result = 'generate_psbt', request(f"{base}/generate_psbt",
+                                                    {'recipient_address': RECIPIENT, 'amount': amount})
+        with lock:
+            submitted.append((kind,) + result)
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(args.jobs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    slowest = max(seconds for _, seconds, _, _ in submitted)
+    check(all(status == 202 for _, _, status, _ in submitted), f"{args.jobs} submissions answered 202")
+    check(slowest < FAST, f"slowest submission took {slowest:.3f}s")
+    kinds = {json.loads(body)['job_id']: kind for kind, _, status, body in submitted if status == 202}
+    job_ids = list(kinds)
+    psbt_job = next(job_id for job_id, kind in kinds.items() if kind == 'generate_psbt')
+
+    # Other routes stay responsive while the jobs run
+    for path in ('/', f"/jobs/{psbt_job}", f"/generate_psbt/{psbt_job}"):
+        seconds, status, _ = request(base + path)
+        check(status == 200 and seconds < FAST, f"GET {path.split('?')[0][:40]} {status} in {seconds:.3f}s during jobs")
+
+    # Every job finishes, followed over server-sent events
+    finished = {}
+
+    def follow(job_id):
+        finished[job_id] = follow_events(f"{base}/jobs/{job_id}/events")
+
+    followers = [threading.Thread(target=follow, args=(job_id,)) for job_id in job_ids]
+    for thread in followers:
+        thread.start()
+    for thread in followers:
+        thread.join()
+    elapsed = time.monotonic() - start
+    done = [job for job in finished.values() if job and job['state'] == 'done']
+    errors = {job['error'] for job in finished.values() if job and job['state'] == 'failed'}
+    check(len(done) == len(job_ids),
+          f"{len(done)}/{len(job_ids)} jobs done over server-sent events in {elapsed:.1f}s {sorted(errors) or ''}")
+
+    for job_id in (job_id for job_id, kind in kinds.items() if kind == 'generate_psbt'):
+        seconds, status, body = request(f"{base}/generate_psbt/{job_id}")
+        check(status == 200 and b'PSBT Details' in body, f"PSBT page rendered from a finished job in {seconds:.3f}s")
+
+    backend.shutdown()
+    stub.stop()
+    print(f"\n{len(failures)} check(s) failed" if failures else "\nAll checks passed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
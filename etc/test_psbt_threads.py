@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Run the real PsbtService off the main thread, against the local Electrum stub.
+
+    python etc/test_psbt_threads.py
+
+bitcointx keeps its chain params in a contextvar, so every new thread
+starts without them. Web request threads and job workers call the service
+this way. The wallet is the BIP84 test vector account and the files the
+service reads (zpub.json, backend.json, address_index.db) are written to a
+temporary directory. The fee rate is pinned so nothing leaves the machine.
+Exits non-zero if a check fails.
+"""
+
+import os
+import sys
+import json
+import base64
+import hashlib
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'etc'))
+from electrum_stub import StubElectrumServer  # noqa: E402
+
+# BIP84 test vector, mnemonic "abandon abandon ... about"
+ZPUB = "zpub6rFR7y4Q2AijBEqTUquhVz398htDFrtymD9xYYfG1m4wAcvPhXNfE3EfH1r1ADqtfSdVCToUG868RvUUkgDKf31mGDtKsAYz2oz2AGutZYs"
+FINGERPRINT = "73c5da0a"
+RECIPIENT = "bc1qar0srrr7xfkvy5l643lydnw9re59gtzzwf5mdq"
+FEE_RATE = 2
+MANY_UTXOS = 401  # Too many for one transaction, built as several PSBTs
+
+
+def in_thread(func, *args):
+    """Run func in a fresh thread and return (result, error)."""
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = func(*args)
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    return outcome.get('result'), outcome.get('error')
+
+
+def witness_utxos(psbt_base64):
+    from bitcointx.core.psbt import PartiallySignedTransaction
+    from generate_psbt import select_bitcoin_params
+    select_bitcoin_params()
+    psbt = PartiallySignedTransaction.deserialize(base64.b64decode(psbt_base64))
+    return [psbt_input.witness_utxo for psbt_input in psbt.inputs]
+
+
+def fake_utxos(index, count):
+    """count UTXOs of 10000 sats paid to the first receive address, shaped like PsbtService.utxos() returns them."""
+    from address_index import CHAIN_EXT
+    entry = index.entries(CHAIN_EXT, 0, 1)[0]
+    return [{'txid': hashlib.sha256(str(i).encode()).hexdigest(), 'vout': 0, 'value': 10000,
+             'scriptPubKey': entry['script'].hex(),
+             'address': entry['address'], 'key_path': (CHAIN_EXT, 0), 'pubkey': entry['pubkey'].hex()}
+            for i in range(count)]
+
+
+def consolidate(utxos):
+    """Select params on the calling thread like PsbtService.generate does."""
+    import generate_psbt
+    generate_psbt.select_bitcoin_params()
+    return generate_psbt.create_consolidation_psbts(utxos, RECIPIENT, FEE_RATE)
+
+
+def main():
+    os.chdir(tempfile.mkdtemp(prefix='psbt-threads-'))
+    stub = StubElectrumServer().start()
+    with open('zpub.json', 'w') as f:
+        json.dump({'zpub': ZPUB, 'fingerprint': FINGERPRINT}, f)
+    with open('backend.json', 'w') as f:
+        json.dump({'type': 'electrum', 'host': '127.0.0.1', 'port': stub.port, 'ssl': False}, f)
+
+    from address_index import AddressIndex, CHAIN_EXT
+    import generate_psbt
+
+    index = AddressIndex(ZPUB)
+    for i in range(3):
+        stub.add_payment(index.address(CHAIN_EXT, i), 50000, height=800000)
+
+    service = generate_psbt.PsbtService()
+    service.fee_cache = (float('inf'), FEE_RATE)  # No mempool.space call
+
+    failures = []
+
+    def check(ok, message):
+        print(f"{'ok  ' if ok else 'FAIL'} {message}")
+        if not ok:
+            failures.append(message)
+
+    result, error = in_thread(service.generate, RECIPIENT, None)
+    check(error is None, f"consolidation generated in a worker thread ({error or 'no error'})")
+    if result:
+        check(result['input_count'] == 3, f"{result['input_count']} inputs swept")
+
+    summaries, error = in_thread(consolidate, fake_utxos(index, MANY_UTXOS))
+    check(error is None and len(summaries) > 1 and sum(s['input_count'] for s in summaries) == MANY_UTXOS,
+          f"{MANY_UTXOS} UTXOs split over several PSBTs in a worker thread ({error or f'{len(summaries)} PSBTs'})")
+    index.close()
+
+    result, error = in_thread(service.generate, RECIPIENT, 60000)
+    check(error is None, f"payment generated in a worker thread ({error or 'no error'})")
+    if result:
+        utxos, error = in_thread(witness_utxos, result['transactions'][0]['psbt'])
+        check(error is None and utxos and all(utxo is not None and utxo.nValue == 50000 for utxo in utxos),
+              f"PSBT deserialized in a worker thread with witness UTXOs ({error or len(utxos)})")
+        from broadcast_queue import finalize_psbt
+        _, error = in_thread(finalize_psbt, result['transactions'][0]['psbt'])
+        check(str(error).endswith("is not signed"), f"unsigned PSBT refused by finalize_psbt in a worker thread ({error})")
+
+    stub.stop()
+    print(f"\n{len(failures)} check(s) failed" if failures else "\nAll checks passed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
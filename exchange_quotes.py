@@ -0,0 +1,135 @@
+import time
+import asyncio
+from dataclasses import dataclass
+from exchange_snapshot import SYMBOL, EXCHANGE_TIMEOUT
+
+# ==========================
+# Configuration Constants
+# ==========================
+DEPTH_LIMIT = 20  # Order book levels per side, a value every exchange accepts (KuCoin only allows 20 or 100)
+QUOTE_TTL = 5  # Seconds a quote is reused before the order book is fetched again
+DEFAULT_TAKER_FEE = 0.001  # Used when the cached market has no taker fee
+DEFAULT_WITHDRAWAL_FEE_BTC = 0.0005  # Used when the cached currency has no BTC withdrawal fee, on the high side
+WITHDRAWAL_NETWORK = 'BTC'
+
+
+@dataclass
+class Quote:
+    """What buying `buy_amount` USDT of BTC on one exchange costs, all fees included."""
+    exchange: str
+    buy_amount: float
+    best_ask: float = None
+    avg_price: float = None  # Average fill walking the asks
+    btc_amount: float = None  # Order size in BTC, before the taker fee
+    taker_fee: float = None
+    withdrawal_fee: float = None  # Share of one BTC withdrawal carried by this buy
+    btc_received: float = None  # BTC that reaches the wallet
+    fetched_at: float = 0.0
+    error: str = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def all_in_price(self):
+        """USDT paid per BTC that reaches the wallet."""
+        return self.buy_amount / self.btc_received if self.ok and self.btc_received > 0 else float('inf')
+
+
+def walk_asks(asks, quote_amount):
+    """Return (BTC bought, average price) for spending quote_amount on the asks, or None if the book is too thin."""
+    spent = bought = 0.0
+    for price, amount in asks:
+        take = min(amount, (quote_amount - spent) / price)
+        spent += take * price
+        bought += take
+        if spent >= quote_amount * (1 - 1e-9):
+            return bought, quote_amount / bought
+    return None
+
+
+def taker_fee(exchange):
+    market = (exchange.markets or {}).get(SYMBOL) or {}
+    return market.get('taker') if market.get('taker') is not None else DEFAULT_TAKER_FEE
+
+
+def withdrawal_fee(exchange):
+    """BTC withdrawal fee from the cached currencies (market_cache keeps BTC and USDT)."""
+    currency = (exchange.currencies or {}).get('BTC') or {}
+    network = (currency.get('networks') or {}).get(WITHDRAWAL_NETWORK) or {}
+    for fee in (network.get('fee'), currency.get('fee')):
+        if fee is not None:
+            return float(fee)
+    return DEFAULT_WITHDRAWAL_FEE_BTC
+
+
+def withdraw_share(buy_amount, btc_threshold):
+    """Part of one withdrawal fee a buy pays for, a withdrawal happens about every btc_threshold / buy_amount buys."""
+    return min(1.0, buy_amount / btc_threshold) if btc_threshold else 1.0
+
+
+def build_quote(name, exchange, asks, buy_amount, share):
+    """Quote from the ask side of a book, share is the part of one withdrawal fee this buy pays for."""
+    quote = Quote(name, buy_amount, fetched_at=time.time())
+    fill = walk_asks(asks, buy_amount)
+    if not asks or fill is None:
+        quote.error = "not enough depth"
+        return quote
+    quote.best_ask = asks[0][0]
+    quote.btc_amount, quote.avg_price = fill
+    quote.taker_fee = taker_fee(exchange)
+    quote.withdrawal_fee = withdrawal_fee(exchange) * share
+    quote.btc_received = quote.btc_amount * (1 - quote.taker_fee) - quote.withdrawal_fee
+    return quote
+
+
+def ticker_quote(name, exchange, price, buy_amount, share):
+    """Fallback when no order book could be read: fill at the ticker price, fees as usual."""
+    return build_quote(name, exchange, [(price, float('inf'))], buy_amount, share)
+
+
+class QuoteCache:
+    """Depth-aware quotes for every exchange, fetched in parallel and reused for QUOTE_TTL seconds."""
+
+    def __init__(self, ttl=QUOTE_TTL, timeout=EXCHANGE_TIMEOUT):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.cache = {}  # (exchange name, buy amount) -> Quote
+
+    async def fetch(self, name, exchange, buy_amount, share):
+        try:
+            book = await asyncio.wait_for(exchange.fetch_order_book(SYMBOL, DEPTH_LIMIT), self.timeout)
+            quote = build_quote(name, exchange, [(float(price), float(amount)) for price, amount, *_ in book['asks']],
+                                buy_amount, share)
+        except asyncio.TimeoutError:
+            quote = Quote(name, buy_amount, fetched_at=time.time(), error=f"timed out after {self.timeout}s")
+        except Exception as e:
+            quote = Quote(name, buy_amount, fetched_at=time.time(), error=str(e))
+        if quote.ok:
+            self.cache[(name, buy_amount)] = quote
+        return quote
+
+    async def quotes(self, exchanges, buy_amount, btc_threshold):
+        """Return {name: Quote} for {name: async exchange}, only stale or missing ones hit the network."""
+        share = withdraw_share(buy_amount, btc_threshold)
+        now = time.time()
+        quotes, pending = {}, {}
+        for name, exchange in exchanges.items():
+            cached = self.cache.get((name, buy_amount))
+            if cached is not None and now - cached.fetched_at < self.ttl:
+                quotes[name] = cached
+            else:
+                pending[name] = self.fetch(name, exchange, buy_amount, share)
+        for name, quote in zip(pending, await asyncio.gather(*pending.values())):
+            quotes[name] = quote
+        return quotes
+
+
+def print_quotes(quotes):
+    for quote in sorted(quotes.values(), key=lambda q: q.all_in_price):
+        if quote.ok:
+            print(f"{quote.exchange}: ask {quote.best_ask}, fill {quote.avg_price:.2f}, taker {quote.taker_fee:.2%}, "
+                  f"withdrawal share {quote.withdrawal_fee:.8f} BTC, all-in {quote.all_in_price:.2f} USDT/BTC")
+        else:
+            print(f"No quote from {quote.exchange}: {quote.error}")
@@ -0,0 +1,127 @@
+import time
+import asyncio
+from dataclasses import dataclass, field
+import market_cache
+from footprint import timed_import
+
+# ==========================
+# Configuration Constants
+# ==========================
+EXCHANGE_NAMES = ('bybit', 'bitget', 'kucoin', 'mexc')
+SYMBOL = 'BTC/USDT'
+EXCHANGE_TIMEOUT = 10  # Seconds per exchange for the whole snapshot, a slow one is left out instead of waited for
+
+
+def exchange_config(api_keys, name):
+    """ccxt constructor options for an exchange from api_keys.json."""
+    keys = api_keys.get(name, {})
+    config = {'apiKey': keys.get('apiKey'), 'secret': keys.get('secret'), 'enableRateLimit': True,
+              'timeout': EXCHANGE_TIMEOUT * 1000}
+    if 'password' in keys:
+        config['password'] = keys['password']
+    return config
+
+
+def has_credentials(config):
+    return bool(config.get('apiKey') and config.get('secret'))
+
+
+# ==========================
+# Snapshot
+# ==========================
+@dataclass
+class ExchangeState:
+    name: str
+    price: float = None
+    balances: dict = field(default_factory=dict)  # Currency -> total balance
+    error: str = None
+    latency: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+@dataclass
+class ExchangeSnapshot:
+    """Tickers and balances of every configured exchange, fetched at one point in time."""
+    exchanges: dict  # Name -> ExchangeState
+    taken_at: float
+
+    def available(self):
+        return [state for state in self.exchanges.values() if state.ok]
+
+    def best_price(self):
+        """Return (exchange name, price) with the lowest BTC/USDT price, or (None, inf)."""
+        best = min(self.available(), key=lambda state: state.price, default=None)
+        return (best.name, best.price) if best else (None, float('inf'))
+
+    def balance(self, name, currency):
+        return self.exchanges[name].balances.get(currency) or 0
+
+    def update_balances(self, name, balances):
+        """Refresh one exchange after it traded, the others stay as snapshotted."""
+        self.exchanges[name].balances = balances
+
+
+async def fetch_exchange_state(name, exchange, timeout):
+    start = time.monotonic()
+    try:
+        ticker, balance = await asyncio.wait_for(
+            asyncio.gather(exchange.fetch_ticker(SYMBOL), exchange.fetch_balance()), timeout)
+        return ExchangeState(name, price=ticker['last'], balances=balance['total'],
+                             latency=time.monotonic() - start)
+    except asyncio.TimeoutError:
+        return ExchangeState(name, error=f"timed out after {timeout}s", latency=time.monotonic() - start)
+    except Exception as e:
+        return ExchangeState(name, error=str(e), latency=time.monotonic() - start)
+
+
+def open_exchanges(api_keys, names=EXCHANGE_NAMES):
+    """Async ccxt clients for every exchange with credentials, warmed from the market cache."""
+    ccxt_async = timed_import('ccxt.async_support')
+
+    exchanges = {}
+    for name in names:
+        config = exchange_config(api_keys, name)
+        if not has_credentials(config):
+            print(f"Skipping {name} due to missing API credentials.")
+            continue
+        exchanges[name] = getattr(ccxt_async, name)(config)
+        market_cache.warm(exchanges[name], name)
+    return exchanges
+
+
+async def close_exchanges(exchanges):
+    await asyncio.gather(*(exchange.close() for exchange in exchanges.values()), return_exceptions=True)
+
+
+async def snapshot_exchanges(exchanges, timeout=EXCHANGE_TIMEOUT):
+    """Snapshot already open clients, the daemon keeps them (and their sessions) between snapshots."""
+    states = await asyncio.gather(*(fetch_exchange_state(name, exchange, timeout)
+                                    for name, exchange in exchanges.items()))
+    return ExchangeSnapshot({state.name: state for state in states}, time.time())
+
+
+async def fetch_snapshot_async(api_keys, names=EXCHANGE_NAMES, timeout=EXCHANGE_TIMEOUT):
+    exchanges = open_exchanges(api_keys, names)
+    try:
+        return await snapshot_exchanges(exchanges, timeout)
+    finally:
+        await close_exchanges(exchanges)
+
+
+def print_snapshot(snapshot):
+    for state in snapshot.exchanges.values():
+        if state.ok:
+            print(f"{state.name}: BTC/USDT {state.price}, {state.balances.get('BTC') or 0} BTC, "
+                  f"{state.balances.get('USDT') or 0} USDT ({state.latency:.2f}s)")
+        else:
+            print(f"Failed to fetch ticker and balance from {state.name}: {state.error}")
+
+
+def fetch_snapshot(api_keys, names=EXCHANGE_NAMES, timeout=EXCHANGE_TIMEOUT):
+    """Fetch ticker and balance of every exchange concurrently, about as slow as the slowest exchange."""
+    snapshot = asyncio.run(fetch_snapshot_async(api_keys, names, timeout))
+    print_snapshot(snapshot)
+    return snapshot
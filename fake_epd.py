@@ -0,0 +1,77 @@
+# -*- coding:utf-8 -*-
+"""Stand-in for waveshare_epd.epd2in13_V4 so display code runs without the HAT.
+
+Set PIGGYBANK_FAKE_EPD=1 to use it. Every call is counted and refreshes add
+their typical panel time to simulated_time (or really sleep with
+FAKE_EPD_DELAY=1), so refresh counts and timings can be checked on a PC.
+"""
+
+import os
+import time
+
+EPD_WIDTH = 122
+EPD_HEIGHT = 250
+
+# Typical blocking times of the 2.13" V4 panel, in seconds
+FULL_REFRESH_SECONDS = 2.0
+PARTIAL_REFRESH_SECONDS = 0.3
+CLEAR_SECONDS = 2.0
+
+
+class EPD:
+    def __init__(self):
+        self.width = EPD_WIDTH
+        self.height = EPD_HEIGHT
+        self.calls = {}
+        self.simulated_time = 0.0
+        self.real_delay = os.environ.get('FAKE_EPD_DELAY') == '1'
+        self.frame = None
+
+    def record(self, name, seconds=0.0):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.simulated_time += seconds
+        if self.real_delay and seconds:
+            time.sleep(seconds)
+
+    def init(self):
+        self.record('init')
+        return 0
+
+    def init_fast(self):
+        self.record('init_fast')
+        return 0
+
+    def getbuffer(self, image):
+        linewidth = (self.width + 7) // 8
+        if image.size == (self.height, self.width):
+            image = image.rotate(90, expand=True)
+        image = image.convert('1')
+        if image.size != (self.width, self.height):
+            raise ValueError(f"Wrong image dimensions: {image.size}")
+        # PIL packs mode '1' rows MSB first with rows padded to whole bytes, same as the panel RAM
+        buf = bytearray(image.tobytes('raw'))
+        assert len(buf) == linewidth * self.height
+        return buf
+
+    def display(self, image):
+        self.record('display', FULL_REFRESH_SECONDS)
+        self.frame = bytes(image)
+
+    def display_fast(self, image):
+        self.record('display_fast', FULL_REFRESH_SECONDS / 2)
+        self.frame = bytes(image)
+
+    def displayPartBaseImage(self, image):
+        self.record('displayPartBaseImage', FULL_REFRESH_SECONDS)
+        self.frame = bytes(image)
+
+    def displayPartial(self, image):
+        self.record('displayPartial', PARTIAL_REFRESH_SECONDS)
+        self.frame = bytes(image)
+
+    def Clear(self, color=0xFF):
+        self.record('Clear', CLEAR_SECONDS)
+        self.frame = bytes([color]) * ((self.width + 7) // 8 * self.height)
+
+    def sleep(self):
+        self.record('sleep')
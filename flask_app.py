@@ -1,10 +1,19 @@
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, request, render_template, jsonify, Response, abort, url_for
 import subprocess
 import os
+import io
+import sys
 import json
+import time
 import base64
-import requests
-from bitcointx.core.psbt import PartiallySignedTransaction
+import hashlib
+from functools import lru_cache
+import bc_ur
+from address_index import parse_key_origin
+from broadcast_queue import broadcaster
+from job_queue import jobs
+from coin_selection import DUST_LIMIT
+import generate_psbt as psbt_api  # Imported once, the PSBT service stays warm in this process
 
 app = Flask(__name__)
 
@@ -21,45 +30,170 @@ def save_api_keys(api_keys):
     with open(API_KEYS_FILE, 'w') as f:
         json.dump(api_keys, f, indent=4)
 
+# ======= Local QR rendering ======= #
+QR_CACHE_DIR = 'qr_cache'
+QR_CHUNK_SIZE = 400  # Base64 characters per static QR code
+UR_FRAGMENT_LEN = 200  # PSBT bytes per animated BC-UR frame
+UR_FRAME_MS = 250  # Animation speed of the BC-UR frames
+
+# QR payloads per PSBT hash: static base64 chunks and fountain-coded ur:crypto-psbt parts
+qr_frames = {}
+
+def register_psbt(psbt_base64):
+    """Prepare the QR payloads of a PSBT and return its hash, which the QR image URLs use."""
+    psbt_bytes = base64.b64decode(psbt_base64)
+    psbt_hash = hashlib.sha256(psbt_bytes).hexdigest()
+    if psbt_hash not in qr_frames:
+        qr_frames[psbt_hash] = {
+            'base64': [psbt_base64[i:i + QR_CHUNK_SIZE] for i in range(0, len(psbt_base64), QR_CHUNK_SIZE)],
+            'ur': bc_ur.psbt_ur_parts(psbt_bytes, UR_FRAGMENT_LEN),
+        }
+    return psbt_hash
+
+def render_qr_png(data):
+    import qrcode
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=4, border=2)
+    qr.add_data(data)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+@lru_cache(maxsize=256)
+def qr_png(psbt_hash, mode, index):
+    """PNG of one QR frame, from memory, then the disk cache, then rendered. Raises KeyError if unknown."""
+    path = os.path.join(QR_CACHE_DIR, psbt_hash, f"{mode}-{index}.png")
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    frames = qr_frames[psbt_hash][mode]
+    if not 0 <= index < len(frames):
+        raise KeyError(index)
+    png = render_qr_png(frames[index])
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(png)
+        os.replace(f"{path}.tmp", path)
+    except OSError as e:
+        print(f"Failed to cache QR image: {e}")
+    return png
+
+@app.route('/qr/<psbt_hash>/<mode>/<int:index>.png')
+def qr_image(psbt_hash, mode, index):
+    if mode not in ('base64', 'ur') or not all(c in '0123456789abcdef' for c in psbt_hash):
+        abort(404)
+    try:
+        png = qr_png(psbt_hash, mode, index)
+    except KeyError:
+        abort(404)
+    # The URL is derived from the PSBT contents, so the image never changes
+    return Response(png, mimetype='image/png', headers={'Cache-Control': 'public, max-age=31536000, immutable'})
+
+# ======= Background jobs ======= #
+SSE_TIMEOUT = 60  # Seconds an event stream stays open, the browser reconnects on its own
+SSE_HEARTBEAT = 15  # Seconds between keep-alive comments while nothing changes
+
+def job_links(job_id):
+    return {"job_id": job_id, "status_url": url_for('job_status', job_id=job_id),
+            "events_url": url_for('job_events', job_id=job_id)}
+
+def wants_json():
+    return request.accept_mimetypes.best == 'application/json'
+
+# Route to poll a job
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(job), 200
+
+# Route to follow a job with server-sent events, one event per state change
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    if jobs.get(job_id) is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+
+    def stream():
+        # Bounded, so a forgotten tab does not hold a server thread for good
+        deadline = time.monotonic() + SSE_TIMEOUT
+        version = None
+        while time.monotonic() < deadline:
+            job = jobs.get(job_id) if version is None else jobs.wait(job_id, version, SSE_HEARTBEAT)
+            if job is None:
+                yield "event: gone\ndata: {}\n\n"
+                return
+            if job['version'] == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = job['version']
+            yield f"data: {json.dumps(job)}\n\n"
+            if job['state'] in ('done', 'failed'):
+                return
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # ======= Route to show form and collect recipient address ======= #
 @app.route('/')
 def home():
     return render_template('index.html')
 
-# Route to handle PSBT generation
+def build_psbt_page(recipient_address, amount):
+    """Job body: generate with the warm PSBT service and return the psbt.html context."""
+    # An empty amount sweeps everything
+    result = psbt_api.service.generate(recipient_address, amount)
+
+    # QR codes are rendered locally, large consolidations come as several transactions
+    transactions = []
+    for tx in result['transactions']:
+        psbt_hash = register_psbt(tx['psbt'])
+        frames = qr_frames[psbt_hash]
+        transactions.append(dict(tx, psbt_hash=psbt_hash, ur_frames=len(frames['ur']),
+                                 base64_frames=len(frames['base64'])))
+
+    return dict(transactions=transactions, total_satoshis=result['total_satoshis'], fee=result['fee'],
+                fee_rate=result['fee_rate'], input_count=result['input_count'],
+                dropped_count=result['dropped_count'], change=result['change'], frame_ms=UR_FRAME_MS)
+
+# Route to handle PSBT generation, the chain queries run as a background job
 @app.route('/generate_psbt', methods=['POST'])
 def generate_psbt():
     recipient_address = request.form.get('recipient_address')
+    amount = request.form.get('amount')
 
     if not recipient_address:
         return render_template('index.html', error="Recipient address is required")
-
     try:
-        # Call the generate_psbt.py script and capture the output
-        process = subprocess.Popen(
-            ['python3', 'generate_psbt.py', recipient_address],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        psbt_data, error = process.communicate()
-
-        if process.returncode != 0:
-            return render_template('index.html', error=f"Failed to generate PSBT: {error.decode('utf-8')}")
-
-        # The psbt_data should have PSBT, total_satoshis, and fee, separated by newlines
-        psbt_data_str = psbt_data.decode('utf-8').strip()
-        psbt_serialized, total_satoshis, fee = psbt_data_str.split('\n')
-
-        # Split the PSBT into chunks for QR codes
-        chunk_size = 400
-        psbt_chunks = [psbt_serialized[i:i + chunk_size] for i in range(0, len(psbt_serialized), chunk_size)]
-
+        amount = int(amount) if amount else None
+    except ValueError:
+        return render_template('index.html', error=f"Invalid amount: {amount}")
+    # The min attribute of the form is no guarantee, a negative or dust output would make an invalid PSBT
+    if amount is not None and amount <= DUST_LIMIT:
+        return render_template('index.html', error=f"Invalid amount: {amount}, it must be more than {DUST_LIMIT} sats")
+
+    job_id = jobs.submit('generate_psbt', build_psbt_page, recipient_address, amount)
+    if wants_json():
+        return jsonify(dict(job_links(job_id), result_url=url_for('psbt_result', job_id=job_id))), 202
+    return psbt_result(job_id)
+
+# Route to show a PSBT generation job: a waiting page until it finishes, then the PSBT details
+@app.route('/generate_psbt/<job_id>')
+def psbt_result(job_id):
+    job = jobs.get(job_id)
+    if job is None or job['kind'] != 'generate_psbt':
+        return render_template('index.html', error="Unknown or expired PSBT job, please generate it again"), 404
+    if job['state'] == 'failed':
+        return render_template('index.html', error=f"Failed to generate PSBT: {job['error']}")
+    if job['state'] == 'done':
         # Render the PSBT details page
-        return render_template('psbt.html', psbt_serialized=psbt_serialized, total_satoshis=total_satoshis, fee=fee, psbt_chunks=psbt_chunks)
-
-    except Exception as e:
-        return render_template('index.html', error=f"Failed to generate PSBT: {str(e)}")
+        return render_template('psbt.html', **job['result'])
+    return render_template('job.html', title="Generating PSBT", result_url=url_for('psbt_result', job_id=job_id),
+                           **job_links(job_id))
 
-# Route to broadcast signed PSBT
+# Route to broadcast signed PSBT, the broadcast itself runs in the background queue
 @app.route('/broadcast_psbt', methods=['POST'])
 def broadcast_psbt():
     signed_psbt_base64 = request.form.get('signed_psbt')
@@ -68,24 +202,34 @@ def broadcast_psbt():
         return jsonify({"error": "No signed PSBT provided"}), 400
 
     try:
-        # Decode and deserialize the signed PSBT
-        signed_psbt_bytes = base64.b64decode(signed_psbt_base64)
-        signed_psbt = PartiallySignedTransaction.deserialize(signed_psbt_bytes)
-        raw_transaction = signed_psbt.tx.serialize().hex()  # Get the final raw transaction
-
-        # Broadcast the transaction using Blockstream API or your preferred Bitcoin node API
-        broadcast_url = "https://blockstream.info/api/tx"
-        response = requests.post(broadcast_url, data=raw_transaction)
-
-        if response.status_code == 200:
-            return jsonify({"message": "Transaction broadcast successfully!"}), 200
-        else:
-            return jsonify({"error": "Failed to broadcast transaction", "details": response.text}), 400
-
+        # Validated and finalized locally, so a bad PSBT is reported right away
+        txid = broadcaster.submit(signed_psbt_base64.strip())
+    except ValueError as e:
+        return jsonify({"error": f"Failed to decode or finalize PSBT: {str(e)}"}), 400
     except Exception as e:
-        return jsonify({"error": f"Failed to decode or broadcast PSBT: {str(e)}"}), 500
-
-# Route to set Wi-Fi credentials
+        return jsonify({"error": f"Failed to queue broadcast: {str(e)}"}), 500
+
+    return jsonify({"message": "Transaction queued for broadcast", "txid": txid,
+                    "status_url": url_for('broadcast_status', txid=txid)}), 202
+
+# Route to follow a queued broadcast until it confirms
+@app.route('/broadcast_status/<txid>')
+def broadcast_status(txid):
+    status = broadcaster.status(txid)
+    if status is None:
+        return jsonify({"error": "Unknown transaction"}), 404
+    status.pop('raw_tx', None)
+    return jsonify(status), 200
+
+def run_wifi_setup(ssid, password):
+    """Job body: call the shell script with sudo to set up Wi-Fi credentials."""
+    result = subprocess.run(['sudo', '/home/daniel/setup_wifi.sh', ssid, password],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to set Wi-Fi credentials: {result.stderr.decode()}")
+    return {"message": "Wi-Fi credentials set successfully! Reconnect to the new Wi-Fi."}
+
+# Route to set Wi-Fi credentials, the script runs as a background job
 @app.route('/setup_wifi', methods=['POST'])
 def setup_wifi():
     ssid = request.form.get('ssid')
@@ -94,20 +238,10 @@ def setup_wifi():
     if not ssid or not password:
         return jsonify({"error": "Wi-Fi SSID and password are required"}), 400
 
-    # Call the shell script with sudo to set up Wi-Fi credentials
-    try:
-        result = subprocess.run(['sudo', '/home/daniel/setup_wifi.sh', ssid, password],
-                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        if result.returncode != 0:
-            return jsonify({"error": f"Failed to set Wi-Fi credentials: {result.stderr.decode()}"}), 500
+    job_id = jobs.submit('setup_wifi', run_wifi_setup, ssid, password)
+    return jsonify(dict(job_links(job_id), message="Setting Wi-Fi credentials...")), 202
 
-    except Exception as e:
-        return jsonify({"error": f"Failed to set Wi-Fi credentials: {str(e)}"}), 500
-
-    return jsonify({"message": "Wi-Fi credentials set successfully! Reconnect to the new Wi-Fi."}), 200
-    
-# Route to set zpub
+# Route to set zpub, optionally with the master fingerprint and key origin for PSBT derivation info
 @app.route('/setup_zpub', methods=['POST'])
 def setup_zpub():
     zpub = request.form.get('zpub')
@@ -115,9 +249,17 @@ def setup_zpub():
     if not zpub:
         return jsonify({"error": "zpub key is required"}), 400
 
+    try:
+        zpub, fingerprint, origin = parse_key_origin(zpub, request.form.get('fingerprint'))
+    except ValueError as e:
+        # Nothing is written, a bad key in zpub.json would break the piggybank on the next boot
+        return render_template('index.html', error=str(e)), 400
+
     # Set up the zpub in the zpub.json file
     try:
         zpub_data = {"zpub": zpub}
+        if fingerprint:
+            zpub_data.update(fingerprint=fingerprint, origin=origin)
         with open('zpub.json', 'w') as zpub_file:
             json.dump(zpub_data, zpub_file)
     except Exception as e:
@@ -174,6 +316,24 @@ def update_api_keys():
     except Exception as e:
         return render_template('index.html', error=f"Failed to update API keys: {str(e)}")
 
-# Start the Flask app
+# ======= Serving ======= #
+HOST = '0.0.0.0'
+PORT = 5001
+WSGI_THREADS = 8  # Request threads, event streams hold one each for up to SSE_TIMEOUT
+
+def serve(production=False, host=HOST, port=PORT):
+    broadcaster.ensure_worker()  # Resumes interrupted broadcasts and confirmation tracking
+    if production:
+        try:
+            from waitress import serve as waitress_serve
+        except ImportError:
+            print("waitress is not installed (pip install waitress), using the development server")
+        else:
+            print(f"Serving on http://{host}:{port} with waitress, {WSGI_THREADS} threads")
+            waitress_serve(app, host=host, port=port, threads=WSGI_THREADS)
+            return
+    app.run(host=host, port=port, threaded=True)
+
+# Start the Flask app, --production serves it with waitress instead of the development server
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001)
+    serve('--production' in sys.argv)
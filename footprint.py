@@ -0,0 +1,28 @@
+import sys
+import time
+import resource
+import importlib
+
+IMPORT_TIMES = {}  # Module name -> seconds spent importing it, for modules loaded through timed_import
+
+
+def timed_import(name):
+    """Import a heavy module on first use and remember how long it took."""
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORT_TIMES[name] = time.perf_counter() - start
+    return module
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+def report(label, started):
+    """Print wall time since `started` (time.monotonic), peak RSS and the lazy imports paid so far."""
+    imports = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in IMPORT_TIMES.items()) or "none"
+    print(f"{label} took {time.monotonic() - started:.1f}s, peak RSS {peak_rss_mb():.0f} MB, imports: {imports}")
@@ -3,13 +3,41 @@
 import os
 import sys
 import json
+import math
+import time
 import base64
-import requests
-from bip_utils import Bip84, Bip84Coins, Bip44Changes
+import threading
+from http_client import get_json
+from chain_backend import get_backend
+from address_index import AddressIndex, CHAIN_INT, DEFAULT_ACCOUNT_PATH
+from wallet_scanner import scan_wallet
+import bitcointx
 from bitcointx.wallet import CCoinAddress
-from bitcointx.core import COutPoint, lx, CTxIn, CTxOut, CMutableTransaction
-from bitcointx.core.psbt import PartiallySignedTransaction, PSBT_Input, PSBT_Output
+from bitcointx.core import COutPoint, lx, x, CTxIn, CTxOut, CMutableTransaction
+from bitcointx.core.key import CPubKey, BIP32Path
+from bitcointx.core.psbt import PartiallySignedTransaction, PSBT_Input, PSBT_Output, PSBT_KeyDerivationInfo
 from bitcointx.core.script import CScript
+from coin_selection import (estimate_fee, estimate_weight, economical_consolidation, select_coins, P2WPKH_INPUT_WEIGHT,
+                            DUST_LIMIT)
+
+# ==========================
+# Configuration Constants
+# ==========================
+UTXO_TTL = 30  # Seconds a scanned UTXO set is reused between requests
+FEE_RATE_TTL = 60
+PSBT_TTL = 120  # Seconds a generated PSBT is served again for the same inputs, fee rate and recipient
+MAX_TX_WEIGHT = 396000  # Stay clear of the 400k weight standardness limit
+MAX_PSBT_BYTES = 20000  # Per PSBT, keeps air-gapped QR transfer practical
+PSBT_INPUT_BYTES = 140  # Rough upper bound per input: unsigned txin, witness_utxo and key origin
+PSBT_OVERHEAD_BYTES = 200
+
+def select_bitcoin_params():
+    """bitcointx keeps the chain params in a contextvar, which every new thread starts without.
+
+    Called first thing by each PSBT entry point (PsbtService.generate and
+    broadcast_queue.finalize_psbt), whatever thread the web server runs them on.
+    """
+    bitcointx.select_chain_params('bitcoin')
 
 # ==========================
 # Load zpub from file
@@ -23,139 +51,302 @@ def load_zpub():
     else:
         raise FileNotFoundError("zpub.json not found. Please make sure the file exists.")
 
-zpub = load_zpub()
-
-# Initialize Bip84 context
-bip84_ctx = Bip84.FromExtendedKey(zpub, Bip84Coins.BITCOIN)
+def load_key_origin():
+    """Return (master fingerprint bytes, account path) from zpub.json, or None if no fingerprint was set up."""
+    with open("zpub.json", 'r') as f:
+        data = json.load(f)
+    if not data.get("fingerprint"):
+        return None
+    return bytes.fromhex(data["fingerprint"]), data.get("origin", DEFAULT_ACCOUNT_PATH)
 
 # ==========================
-# Function to generate all used addresses from zpub
+# Fetch Transaction Details from Blockstream API (txid-keyed cache)
 # ==========================
-def generate_used_addresses(bip84_ctx, max_addresses=12):
-    addresses = []
-    for i in range(max_addresses):
-        address_ctx = bip84_ctx.Change(Bip44Changes.CHAIN_EXT).AddressIndex(i)
-        addresses.append(address_ctx.PublicKey().ToAddress())
-    return addresses
+# Transactions never change once mined, so UTXOs sharing a parent only fetch it once
+tx_cache = {}
 
-# ==========================
-# Fetching Bitcoin UTXOs from Blockstream API
-# ==========================
-def get_utxos_blockstream(address):
-    url = f"https://blockstream.info/api/address/{address}/utxo"
-    response = requests.get(url)  # SSL verification is enabled by default
-    return response.json() if response.status_code == 200 else None
-
-# ==========================
-# Fetch Transaction Details from Blockstream API to get scriptPubKey
-# ==========================
 def get_tx_details_blockstream(txid):
-    url = f"https://blockstream.info/api/tx/{txid}"
-    response = requests.get(url)
-    return response.json() if response.status_code == 200 else None
+    if txid not in tx_cache:
+        tx_details = get_json(f"https://blockstream.info/api/tx/{txid}")
+        if tx_details is None:
+            return None
+        tx_cache[txid] = tx_details
+    return tx_cache[txid]
 
 # ==========================
-# Collect all UTXOs from all used addresses and fetch scriptPubKey
+# Collect all UTXOs from all used addresses with their scriptPubKey
 # ==========================
-def collect_all_utxos(addresses):
+def script_for_utxo(address_index, address, utxo):
+    """Our own P2WPKH script comes from the address index, only foreign outputs need the parent tx."""
+    entry = address_index.lookup_address(address)
+    if entry is not None:
+        return entry['script'].hex()
+    tx_details = get_tx_details_blockstream(utxo['txid'])
+    return tx_details['vout'][utxo['vout']]['scriptpubkey'] if tx_details else None
+
+def collect_all_utxos(addresses, address_index, backend):
     all_utxos = []
     total_input_satoshis = 0
 
-    for address in addresses:
-        utxos = get_utxos_blockstream(address)
-        if utxos:
-            for utxo in utxos:
-                # Fetch full transaction details to get scriptPubKey
-                tx_details = get_tx_details_blockstream(utxo['txid'])
-                if tx_details:
-                    # Get the specific vout corresponding to the UTXO
-                    vout = tx_details['vout'][utxo['vout']]
-                    utxo['scriptPubKey'] = vout['scriptpubkey']  # Add scriptPubKey to UTXO data
-                    all_utxos.append(utxo)
-                    total_input_satoshis += utxo['value']
+    for address, utxos in backend.utxos(addresses).items():
+        for utxo in utxos:
+            if 'scriptPubKey' not in utxo:
+                utxo['scriptPubKey'] = script_for_utxo(address_index, address, utxo)
+                if utxo['scriptPubKey'] is None:
+                    continue
+            utxo['address'] = address
+            # Chain, index and pubkey of our own outputs, for the PSBT key origin
+            entry = address_index.lookup_address(address)
+            if entry is not None:
+                utxo['key_path'] = (entry['chain'], entry['index'])
+                utxo['pubkey'] = entry['pubkey'].hex()
+            all_utxos.append(utxo)
+            total_input_satoshis += utxo['value']
     return all_utxos, total_input_satoshis
 
 # ==========================
 # Create PSBT consolidating all UTXOs into a single recipient address
 # ==========================
-def create_consolidation_psbt(utxos, recipient_address, fee_rate):
-    unsigned_tx = CMutableTransaction()
-    psbt = PartiallySignedTransaction()
+def key_derivation(origin, key_path, pubkey):
+    """derivation_map for one of our keys: pubkey -> (master fingerprint, m/84'/0'/0'/chain/index)."""
+    if origin is None or key_path is None:
+        return {}
+    fingerprint, account_path = origin
+    chain, index = key_path
+    return {CPubKey(pubkey): PSBT_KeyDerivationInfo(fingerprint, BIP32Path(f"{account_path}/{chain}/{index}"))}
 
+def add_inputs(psbt, unsigned_tx, utxos, origin=None):
     for utxo in utxos:
         outpoint = COutPoint(lx(utxo['txid']), utxo['vout'])
         tx_in = CTxIn(outpoint)
         unsigned_tx.vin.append(tx_in)
 
-        psbt_input = PSBT_Input()
-        # Now we have scriptPubKey from the UTXO
-        witness_utxo = CTxOut(utxo['value'], CScript(lx(utxo['scriptPubKey'])))
-        psbt_input._witness_utxo = witness_utxo
+        # With the key origin the signer finds its key directly instead of searching its keychain
+        derivation_map = key_derivation(origin, utxo.get('key_path'), bytes.fromhex(utxo.get('pubkey', '')))
+        # Now we have scriptPubKey from the UTXO (plain hex, not a reversed hash)
+        witness_utxo = CTxOut(utxo['value'], CScript(x(utxo['scriptPubKey'])))
+        # Passed as utxo so it is serialized as PSBT_IN_WITNESS_UTXO, the signer needs the amount and script
+        psbt_input = PSBT_Input(utxo=witness_utxo, derivation_map=derivation_map)
         psbt.add_input(tx_in, psbt_input)
 
-    fee = calculate_fee(unsigned_tx, fee_rate)
-    output_value = sum(utxo['value'] for utxo in utxos) - fee
+def add_output(psbt, unsigned_tx, address, value, derivation_map=None):
+    tx_out = CTxOut(value, CCoinAddress(address).to_scriptPubKey())
+    unsigned_tx.vout.append(tx_out)
+    psbt.add_output(tx_out, PSBT_Output(derivation_map=derivation_map or {}))
 
+def create_consolidation_psbt(utxos, recipient_address, fee_rate, origin=None):
+    unsigned_tx = CMutableTransaction()
+    psbt = PartiallySignedTransaction()
+    add_inputs(psbt, unsigned_tx, utxos, origin)
+
+    # Fee for the final transaction, including the output and the signed witnesses
     recipient_script = CCoinAddress(recipient_address).to_scriptPubKey()
-    tx_out = CTxOut(output_value, recipient_script)
-    unsigned_tx.vout.append(tx_out)
+    fee = estimate_fee(len(utxos), [len(recipient_script)], fee_rate)
+    output_value = sum(utxo['value'] for utxo in utxos) - fee
+    if output_value <= 0:
+        raise ValueError("Inputs do not cover the fee at the current fee rate")
 
-    psbt_output = PSBT_Output()
-    psbt.add_output(tx_out, psbt_output)
+    add_output(psbt, unsigned_tx, recipient_address, output_value)
     psbt.unsigned_tx = unsigned_tx
     return psbt
 
-# Function to calculate fee based on transaction size and fee rate
+# ==========================
+# Split large consolidations into several size-bounded PSBTs
+# ==========================
+def partition_inputs(utxos, recipient_script_len, max_weight=MAX_TX_WEIGHT, max_psbt_bytes=MAX_PSBT_BYTES):
+    """Split inputs into evenly sized groups whose transactions fit the weight and PSBT-byte budgets."""
+    max_by_weight = (max_weight - estimate_weight(0, [recipient_script_len]) - 16) // P2WPKH_INPUT_WEIGHT
+    max_by_bytes = (max_psbt_bytes - PSBT_OVERHEAD_BYTES) // PSBT_INPUT_BYTES
+    per_tx = max(1, min(max_by_weight, max_by_bytes))
+    size = math.ceil(len(utxos) / math.ceil(len(utxos) / per_tx))
+    return [utxos[i:i + size] for i in range(0, len(utxos), size)]
+
+def psbt_summary(psbt, inputs):
+    """Per-transaction figures shown next to each PSBT."""
+    serialized = psbt.serialize()
+    total_satoshis = sum(utxo['value'] for utxo in inputs)
+    return {
+        'psbt': base64.b64encode(serialized).decode('utf-8'),
+        'total_satoshis': total_satoshis,
+        'fee': total_satoshis - sum(tx_out.nValue for tx_out in psbt.unsigned_tx.vout),
+        'input_count': len(inputs),
+        'weight': estimate_weight(len(inputs), [len(tx_out.scriptPubKey) for tx_out in psbt.unsigned_tx.vout]),
+        'psbt_bytes': len(serialized),
+    }
+
+def build_consolidation(utxos, recipient_address, fee_rate, max_psbt_bytes=MAX_PSBT_BYTES, origin=None):
+    """Build one consolidation PSBT, halving the input set if the estimate was too optimistic."""
+    summary = psbt_summary(create_consolidation_psbt(utxos, recipient_address, fee_rate, origin), utxos)
+    if summary['psbt_bytes'] <= max_psbt_bytes or len(utxos) == 1:
+        return [summary]
+    half = len(utxos) // 2
+    return (build_consolidation(utxos[:half], recipient_address, fee_rate, max_psbt_bytes, origin)
+            + build_consolidation(utxos[half:], recipient_address, fee_rate, max_psbt_bytes, origin))
+
+def create_consolidation_psbts(utxos, recipient_address, fee_rate, max_weight=MAX_TX_WEIGHT, max_psbt_bytes=MAX_PSBT_BYTES,
+                               origin=None):
+    """Consolidate into as many transactions as the budgets require."""
+    recipient_script_len = len(CCoinAddress(recipient_address).to_scriptPubKey())
+    partitions = partition_inputs(utxos, recipient_script_len, max_weight, max_psbt_bytes)
+    # Built one after the other, the bitcointx work holds the GIL and a thread pool gained nothing
+    return [summary for part in partitions
+            for summary in build_consolidation(part, recipient_address, fee_rate, max_psbt_bytes, origin)]
+
+# ==========================
+# Create PSBT paying an amount, with change back to our change chain
+# ==========================
+def create_payment_psbt(selection, recipient_address, amount, change_entry, origin=None):
+    """change_entry is the address index entry of the change address, so the signer can verify it is ours."""
+    unsigned_tx = CMutableTransaction()
+    psbt = PartiallySignedTransaction()
+    add_inputs(psbt, unsigned_tx, selection['selected'], origin)
+    add_output(psbt, unsigned_tx, recipient_address, amount)
+    if selection['change'] > 0:
+        change_derivation = key_derivation(origin, (change_entry['chain'], change_entry['index']), change_entry['pubkey'])
+        add_output(psbt, unsigned_tx, change_entry['address'], selection['change'], change_derivation)
+    psbt.unsigned_tx = unsigned_tx
+    return psbt
+
+# Function to calculate fee based on the signed transaction weight and fee rate
 def calculate_fee(unsigned_tx, fee_rate):
-    tx_size = len(unsigned_tx.serialize())  # Calculate transaction size in bytes
-    return tx_size * fee_rate  # Fee in satoshis
+    return estimate_fee(len(unsigned_tx.vin), [len(tx_out.scriptPubKey) for tx_out in unsigned_tx.vout], fee_rate)
 
 # Fetch fee rate from mempool.space API
 def fetch_fee_rate():
     url = "https://mempool.space/api/v1/fees/recommended"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json().get('fastestFee', 10)  # Get fastest fee or default to 10 sat/vB
+    data = get_json(url)
+    if data is not None:
+        return data.get('fastestFee', 10)  # Get fastest fee or default to 10 sat/vB
     else:
         raise Exception("Failed to fetch fee rate")
 
-# Main function to generate PSBT and return it
-def generate_psbt(recipient_address):
-    # 1. Get all UTXOs and total satoshis
-    utxos, total_satoshis = collect_all_utxos(generate_used_addresses(bip84_ctx))
-    
-    # 2. Fetch fee rate from mempool.space
-    fee_rate = fetch_fee_rate()
-    
-    # 3. Generate PSBT
-    psbt = create_consolidation_psbt(utxos, recipient_address, fee_rate)
-    
-    # 4. Calculate fee
-    fee = calculate_fee(psbt.unsigned_tx, fee_rate)
-    
-    # 5. Serialize the PSBT for output
-    psbt_serialized = base64.b64encode(psbt.serialize()).decode('utf-8')
-    
-    # 6. Return the serialized PSBT, total input satoshis, and fee
-    return psbt_serialized, total_satoshis, fee
-
-# Main entry point for command line
+# ==========================
+# Warm PSBT service
+# ==========================
+class PsbtService:
+    """Keeps the wallet context warm between requests and caches recent results.
+
+    The address index, chain backend and bitcointx stay loaded in the process.
+    UTXO sets and fee rates are reused for a few seconds, and a PSBT for the
+    same (UTXO set, fee rate, recipient) is served from cache within PSBT_TTL.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.zpub = None
+        self.origin = None  # (master fingerprint, account path) when set up, enables BIP32 derivation info
+        self.address_index = None
+        self.backend = None
+        self.utxo_cache = None  # (expires, wallet scan, utxos)
+        self.fee_cache = None  # (expires, fee_rate)
+        self.psbt_cache = {}  # key -> (expires, result)
+
+    def load_wallet(self):
+        """(Re)build the wallet context when zpub.json changed, e.g. after /setup_zpub."""
+        zpub, origin = load_zpub(), load_key_origin()
+        if (zpub, origin) != (self.zpub, self.origin):
+            self.zpub, self.origin = zpub, origin
+            if self.address_index is not None:
+                self.address_index.close()
+            # Addresses are derived once and kept in address_index.db
+            self.address_index = AddressIndex(zpub)
+            # Esplora REST by default, Electrum when configured in backend.json
+            self.backend = get_backend()
+            self.utxo_cache = None
+            self.psbt_cache = {}
+
+    def utxos(self):
+        """Return (wallet scan, UTXOs) from a gap-limit scan of both chains, reused for UTXO_TTL."""
+        now = time.monotonic()
+        if self.utxo_cache is None or self.utxo_cache[0] < now:
+            wallet = scan_wallet(self.address_index, self.backend)
+            utxos, _ = collect_all_utxos(wallet.funded_addresses(), self.address_index, self.backend)
+            self.utxo_cache = (now + UTXO_TTL, wallet, utxos)
+        return self.utxo_cache[1], self.utxo_cache[2]
+
+    def fee_rate(self):
+        now = time.monotonic()
+        if self.fee_cache is None or self.fee_cache[0] < now:
+            self.fee_cache = (now + FEE_RATE_TTL, fetch_fee_rate())
+        return self.fee_cache[1]
+
+    def generate(self, recipient_address, amount=None):
+        """Return a dict with one entry per PSBT in 'transactions' plus overall totals.
+
+        Without an amount every economical UTXO is swept to the recipient, split
+        over several transactions if needed; with one, coin selection picks the
+        inputs and change goes to our change chain.
+        """
+        if amount is not None and amount <= DUST_LIMIT:
+            raise ValueError(f"Amount must be more than {DUST_LIMIT} sats, got {amount}")
+        select_bitcoin_params()
+        with self.lock:
+            self.load_wallet()
+            wallet, utxos = self.utxos()
+            if not utxos:
+                raise ValueError("No UTXOs found for this zpub")
+            fee_rate = self.fee_rate()
+
+            now = time.monotonic()
+            key = (frozenset((utxo['txid'], utxo['vout']) for utxo in utxos), fee_rate, recipient_address, amount)
+            self.psbt_cache = {k: v for k, v in self.psbt_cache.items() if v[0] >= now}
+            if key in self.psbt_cache:
+                return dict(self.psbt_cache[key][1], cached=True)
+
+            if amount is None:
+                # Inputs worth less than the fee to spend them stay where they are
+                inputs, dropped = economical_consolidation(utxos, fee_rate)
+                if not inputs:
+                    raise ValueError("Every UTXO costs more to spend than it is worth at the current fee rate")
+                transactions = create_consolidation_psbts(inputs, recipient_address, fee_rate, origin=self.origin)
+                algorithm, change = 'consolidation', 0
+            else:
+                selection = select_coins(utxos, amount, fee_rate)
+                inputs, dropped = selection['selected'], []
+                change_entry = self.address_index.entries(CHAIN_INT, wallet.next_change_index, 1)[0]
+                psbt = create_payment_psbt(selection, recipient_address, amount, change_entry, self.origin)
+                transactions = [psbt_summary(psbt, inputs)]
+                algorithm, change = selection['algorithm'], selection['change']
+
+            result = {
+                'transactions': transactions,
+                'total_satoshis': sum(tx['total_satoshis'] for tx in transactions),
+                'fee': sum(tx['fee'] for tx in transactions),
+                'fee_rate': fee_rate,
+                'input_count': len(inputs),
+                'dropped_count': len(dropped),
+                'algorithm': algorithm,
+                'change': change,
+                'cached': False,
+            }
+            self.psbt_cache[key] = (now + PSBT_TTL, result)
+            return result
+
+service = PsbtService()
+
+# Main function to generate PSBTs and return them
+def generate_psbt(recipient_address, amount=None):
+    """Return [(serialized PSBT, total input satoshis, fee), ...], one per transaction."""
+    result = service.generate(recipient_address, amount)
+    return [(tx['psbt'], tx['total_satoshis'], tx['fee']) for tx in result['transactions']]
+
+# Main entry point for command line, a thin wrapper around the service
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python generate_psbt.py <recipient_address>")
+        print("Usage: python generate_psbt.py <recipient_address> [amount_sats]")
         sys.exit(1)
 
     recipient_address = sys.argv[1]
-    
+    amount = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
     # Generate the PSBT, total satoshis, and fee
     try:
-        psbt_data, total_satoshis, fee = generate_psbt(recipient_address)
-        
-        # Output all 3 values separated by newlines for Flask app to capture
-        print(psbt_data)
-        print(total_satoshis)
-        print(fee)
-    
+        # Output 3 values per transaction separated by newlines
+        for psbt_data, total_satoshis, fee in generate_psbt(recipient_address, amount):
+            print(psbt_data)
+            print(total_satoshis)
+            print(fee)
+
     except Exception as e:
         print(f"Failed to generate PSBT: {str(e)}")
         sys.exit(1)
@@ -0,0 +1,151 @@
+import time
+import random
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+# ==========================
+# Configuration Constants
+# ==========================
+TIMEOUT = (5, 15)  # (connect, read) seconds
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0  # Seconds, doubled on every retry
+BACKOFF_CAP = 30.0
+POOL_SIZE = 8
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Requests per second and burst size per host
+DEFAULT_RATE_LIMIT = (5.0, 10)
+RATE_LIMITS = {
+    'blockstream.info': (5.0, 10),
+    'mempool.space': (2.0, 5),
+    'api.alternative.me': (1.0, 2),
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket, acquire() blocks until a token is available."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def endpoint_key(url):
+    """Group URLs by endpoint, replacing addresses, txids and heights with '*'."""
+    parts = urlsplit(url)
+    segments = ['*' if len(s) >= 20 or s.isdigit() else s for s in parts.path.split('/')]
+    return parts.netloc + '/'.join(segments)
+
+
+class HttpClient:
+    """Pooled HTTP client with per-host rate limiting, retries and per-endpoint stats."""
+
+    def __init__(self, timeout=TIMEOUT, max_retries=MAX_RETRIES, rate_limits=None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.rate_limits = dict(RATE_LIMITS if rate_limits is None else rate_limits)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.buckets = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def bucket_for(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                rate, capacity = self.rate_limits.get(host, DEFAULT_RATE_LIMIT)
+                self.buckets[host] = TokenBucket(rate, capacity)
+            return self.buckets[host]
+
+    def record(self, url, latency=None, retry=False, error=False):
+        key = endpoint_key(url)
+        with self.lock:
+            stats = self.stats.setdefault(key, {'requests': 0, 'retries': 0, 'errors': 0,
+                                                'total_latency': 0.0, 'max_latency': 0.0})
+            if retry:
+                stats['retries'] += 1
+            if error:
+                stats['errors'] += 1
+            if latency is not None:
+                stats['requests'] += 1
+                stats['total_latency'] += latency
+                stats['max_latency'] = max(stats['max_latency'], latency)
+
+    def backoff_delay(self, attempt, response=None):
+        """Jittered exponential backoff, honouring Retry-After when the server sends one."""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(BACKOFF_CAP, float(retry_after))
+        return min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def request(self, method, url, **kwargs):
+        """Send a request, retrying on 429/5xx and connection errors. Returns the last response."""
+        kwargs.setdefault('timeout', self.timeout)
+        bucket = self.bucket_for(urlsplit(url).hostname)
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.record(url, time.monotonic() - start, error=True)
+                if attempt == self.max_retries:
+                    raise
+                print(f"Request to {url} failed ({e}), retrying...")
+                response = None
+            else:
+                self.record(url, time.monotonic() - start)
+                if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    return response
+                print(f"Got {response.status_code} from {url}, backing off...")
+            self.record(url, retry=True)
+            time.sleep(self.backoff_delay(attempt, response))
+
+    def get_json(self, url, **kwargs):
+        """GET a JSON document, returning None on failure like the old api_get helpers."""
+        try:
+            response = self.request('GET', url, **kwargs)
+        except requests.RequestException as e:
+            print(f"Failed to GET {url}: {e}")
+            return None
+        return response.json() if response.status_code == 200 else None
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats_report(self):
+        """Return per-endpoint request, retry and latency counters."""
+        with self.lock:
+            return {key: dict(stats, avg_latency=stats['total_latency'] / stats['requests'] if stats['requests'] else 0.0)
+                    for key, stats in self.stats.items()}
+
+
+# Shared client, every module goes through this one so limits apply process-wide
+client = HttpClient()
+
+
+def get_json(url, **kwargs):
+    return client.get_json(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return client.post(url, **kwargs)
@@ -0,0 +1,62 @@
+import numpy as np
+
+# ==========================
+# Configuration Constants
+# ==========================
+SMOOTH_BLOCK = 64  # Candles per closed-form block, keeps the scaled cumulative sums well inside float64 range
+
+
+def wilder_smooth(values, period, seed):
+    """Wilder smoothing s[t] = s[t-1] * (p-1)/p + x[t] / p for t >= 0, starting from s[-1] = seed.
+
+    Computed without a per-element Python loop: inside each block the
+    recursion is expanded into a cumulative sum of x[k] / a^k, and blocks are
+    chained through their last value.
+    """
+    a = (period - 1) / period
+    values = np.asarray(values, dtype=np.float64)
+    out = np.empty_like(values)
+    powers = a ** np.arange(1, SMOOTH_BLOCK + 1)
+    prev = seed
+    for start in range(0, len(values), SMOOTH_BLOCK):
+        block = values[start:start + SMOOTH_BLOCK]
+        p = powers[:len(block)]
+        out[start:start + len(block)] = p * prev + (1 - a) * p / a * np.cumsum(block / p * a)
+        prev = out[start + len(block) - 1]
+    return out
+
+
+def wilder_rsi(closes, period):
+    """RSI with TA-Lib's seeding and output layout: NaN for the first `period` closes.
+
+    The first average gain/loss is the simple mean of the first `period`
+    changes, every later one is Wilder-smoothed.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    rsi = np.full(len(closes), np.nan)
+    if len(closes) <= period:
+        return rsi
+    changes = np.diff(closes)
+    gains, losses = np.maximum(changes, 0.0), np.maximum(-changes, 0.0)
+
+    avg_gain = np.empty(len(changes) - period + 1)
+    avg_loss = np.empty_like(avg_gain)
+    avg_gain[0], avg_loss[0] = gains[:period].mean(), losses[:period].mean()
+    avg_gain[1:] = wilder_smooth(gains[period:], period, avg_gain[0])
+    avg_loss[1:] = wilder_smooth(losses[period:], period, avg_loss[0])
+
+    total = avg_gain + avg_loss
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rsi[period:] = np.where(total > 0, 100.0 * avg_gain / total, 0.0)
+    return rsi
+
+
+def rolling_min(values, window):
+    """Minimum over the trailing `window` values (NaN-aware), NaN until the window is full."""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        view = np.lib.stride_tricks.sliding_window_view(np.where(np.isnan(values), np.inf, values), window)
+        mins = view.min(axis=1)
+        out[window - 1:] = np.where(np.isinf(mins), np.nan, mins)
+    return out
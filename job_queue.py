@@ -0,0 +1,76 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# ==========================
+# Configuration Constants
+# ==========================
+JOB_WORKERS = 2  # Slow jobs run at the same time, a Pi Zero has little to gain from more
+KEEP_JOBS = 3600  # Seconds a finished job stays available for polling
+
+
+class JobQueue:
+    """In-process queue for slow web requests (PSBT generation, Wi-Fi setup).
+
+    A request submits its work and answers right away with the job id, the
+    work runs on a small thread pool and the page follows it by polling or
+    with server-sent events. Jobs only live in memory, like the PSBT service
+    they mostly call.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, keep=KEEP_JOBS):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self.keep = keep
+        self.jobs = {}
+        self.condition = threading.Condition()
+
+    def submit(self, kind, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) and return the job id. Its return value becomes the job result."""
+        self.prune()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.condition:
+            self.jobs[job_id] = {'id': job_id, 'kind': kind, 'state': 'queued', 'version': 0,
+                                 'created_at': now, 'updated_at': now, 'result': None, 'error': None}
+        self.pool.submit(self.run, job_id, func, args, kwargs)
+        return job_id
+
+    def run(self, job_id, func, args, kwargs):
+        self.update(job_id, state='running')
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.update(job_id, state='failed', error=str(e))
+        else:
+            self.update(job_id, state='done', result=result)
+
+    def update(self, job_id, **fields):
+        with self.condition:
+            job = self.jobs[job_id]
+            job.update(fields, updated_at=time.time(), version=job['version'] + 1)
+            self.condition.notify_all()
+
+    def get(self, job_id):
+        with self.condition:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def wait(self, job_id, version, timeout):
+        """Wait up to timeout for the job to move past version. Returns the job, or None if unknown."""
+        with self.condition:
+            self.condition.wait_for(lambda: job_id not in self.jobs or self.jobs[job_id]['version'] != version,
+                                    timeout)
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def prune(self):
+        cutoff = time.time() - self.keep
+        with self.condition:
+            for job_id in [job_id for job_id, job in self.jobs.items()
+                           if job['state'] in ('done', 'failed') and job['updated_at'] < cutoff]:
+                del self.jobs[job_id]
+
+
+# Shared by every worker thread of the web server
+jobs = JobQueue()
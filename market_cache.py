@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from footprint import timed_import
+
+# ==========================
+# Configuration Constants
+# ==========================
+CACHE_DIR = "market_cache"
+MARKETS_TTL = 24 * 3600  # Seconds before cached metadata is refreshed in the background
+CACHED_SYMBOLS = ('BTC/USDT',)
+CACHED_CURRENCIES = ('BTC', 'USDT')  # Withdrawal networks and fees live in the currency entries
+
+
+def cache_path(name, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f"{name}.json")
+
+
+def read_cache(name, cache_dir=CACHE_DIR):
+    """Return {'fetched_at', 'markets', 'currencies'} for an exchange, or None."""
+    path = cache_path(name, cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable market cache {path}: {e}")
+        return None
+
+
+def save_cache(name, exchange, cache_dir=CACHE_DIR):
+    """Keep only what the DCA bot trades and withdraws, the full lists are megabytes per exchange."""
+    data = {
+        'fetched_at': time.time(),
+        'markets': {symbol: exchange.markets[symbol] for symbol in CACHED_SYMBOLS if symbol in exchange.markets},
+        'currencies': {code: exchange.currencies[code] for code in CACHED_CURRENCIES
+                       if code in (exchange.currencies or {})},
+    }
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(name, cache_dir)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(data, f, default=str)
+    os.replace(f"{path}.tmp", path)
+
+
+def fetch_markets(name, config, cache_dir=CACHE_DIR):
+    """Download markets and currencies with a throwaway client and store them."""
+    ccxt = timed_import('ccxt')
+
+    start = time.monotonic()
+    exchange = getattr(ccxt, name)(config)
+    exchange.load_markets()
+    save_cache(name, exchange, cache_dir)
+    return time.monotonic() - start
+
+
+# ==========================
+# Warm-up
+# ==========================
+def prepare(configs, cache_dir=CACHE_DIR, ttl=MARKETS_TTL):
+    """Make sure every exchange in {name: ccxt config} has cached metadata.
+
+    Missing caches are filled now, in parallel. Stale ones are still used for
+    this run and refreshed by a background thread, which is returned (or None)
+    so a one-shot run can let it finish before exiting.
+    """
+    missing, stale = [], []
+    for name in configs:
+        cached = read_cache(name, cache_dir)
+        if cached is None:
+            missing.append(name)
+        elif time.time() - cached['fetched_at'] > ttl:
+            stale.append(name)
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+            futures = {name: pool.submit(fetch_markets, name, configs[name], cache_dir) for name in missing}
+        for name, future in futures.items():
+            try:
+                print(f"Loaded markets for {name} in {future.result():.2f}s (cold)")
+            except Exception as e:
+                print(f"Failed to load markets for {name}: {e}")
+
+    if not stale:
+        return None
+
+    def refresh():
+        for name in stale:
+            try:
+                fetch_markets(name, configs[name], cache_dir)
+            except Exception as e:
+                print(f"Background market refresh for {name} failed: {e}")
+
+    thread = threading.Thread(target=refresh, name="market-refresh")
+    thread.start()
+    return thread
+
+
+def warm(exchange, name, cache_dir=CACHE_DIR):
+    """Load cached metadata into a ccxt exchange (sync or async) so it never calls load_markets itself.
+
+    Returns True if the cache was used.
+    """
+    cached = read_cache(name, cache_dir)
+    if not cached or not cached['markets']:
+        return False
+    exchange.set_markets(cached['markets'], cached['currencies'] or None)
+    return True
@@ -1,18 +1,30 @@
-import sys, os, logging, platform, time, requests, json, socket
-from waveshare_epd import epd2in13_V4  # Import the Waveshare E-Ink display driver
-from PIL import Image, ImageDraw, ImageFont
-from bip_utils import Bip84, Bip84Coins, Bip44Changes
-import qrcode
-import socket
+import time
+STARTUP_T0 = time.monotonic()  # Taken before any other import for the startup timing report
+
+import sys, os, logging, platform, json, socket
+from eink_display import DisplayManager
 import subprocess
 
+# PIL, qrcode, requests and bip_utils are imported where they are first needed, so the
+# cached last screen can be shown before paying for them.
+
 # Initialize paths, logging, and display driver
 picdir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'pic')
 libdir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'lib')
 if os.path.exists(libdir): sys.path.append(libdir)
 
+if os.environ.get('PIGGYBANK_FAKE_EPD') == '1':
+    import fake_epd as epd2in13_V4  # Run without the HAT, e.g. on a PC
+else:
+    from waveshare_epd import epd2in13_V4  # Import the Waveshare E-Ink display driver
+
 logging.basicConfig(level=logging.DEBUG)
-time.sleep(30)  # Delay before fetching data
+
+NETWORK_CHECK_HOST = ("blockstream.info", 443)
+NETWORK_WAIT_TIMEOUT = 120  # Seconds to wait for the network on boot before carrying on anyway
+WIFI_GRACE_PERIOD = 15  # Seconds for Wi-Fi to associate on boot, after that we are in hotspot mode and show setup
+LAST_FRAME_FILE = "last_frame.bin"
+startup_timings = {}
 
 # ==========================
 # Helper Functions
@@ -28,9 +40,6 @@ def get_ip_address():
     return ip_address
 
 
-# Example usage:
-print(f"Current IP: {get_ip_address()}")
-
 def load_json(file):
     if os.path.exists(file):
         with open(file, 'r') as f:
@@ -38,8 +47,8 @@ def load_json(file):
     raise FileNotFoundError(f"{file} not found. Please make sure the file exists.")
 
 def api_get(url):
-    response = requests.get(url)
-    return response.json() if response.status_code == 200 else None
+    from http_client import get_json
+    return get_json(url)
 
 def is_wifi_configured():
     """Check if Wi-Fi is configured and connected by checking active interfaces or using NetworkManager."""
@@ -50,7 +59,7 @@ def is_wifi_configured():
         for line in nmcli_output.splitlines():
             if 'wifi' in line and 'connected' in line:
                 return True
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, FileNotFoundError):
         # If NetworkManager is not managing it, fallback to check the wlan0 interface status
         try:
             iwconfig_output = subprocess.check_output(['iwconfig'], text=True)
@@ -61,20 +70,38 @@ def is_wifi_configured():
 
     return False
 
+def wait_for_network(timeout=NETWORK_WAIT_TIMEOUT, wifi_grace=WIFI_GRACE_PERIOD):
+    """Wait until Wi-Fi is up and the API host accepts connections, instead of a fixed sleep.
+
+    Gives up after wifi_grace seconds when Wi-Fi never connects, so hotspot
+    mode gets to the setup screen without waiting for the full timeout.
+    """
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if is_wifi_configured():
+            try:
+                socket.create_connection(NETWORK_CHECK_HOST, timeout=3).close()
+                return True
+            except OSError:
+                pass
+        elif time.monotonic() - start >= wifi_grace:
+            return False
+        time.sleep(1)
+    return False
+
+def print_startup_report():
+    """Print how long each cold-start phase took and save it next to the other state files."""
+    startup_timings['total'] = time.monotonic() - STARTUP_T0
+    print("Startup timing: " + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup_timings.items()))
+    with open("startup_timing.json", 'w') as f:
+        json.dump(startup_timings, f, indent=4)
+
 # ==========================
 # Bitcoin Functions
 # ==========================
 def get_utxos(address):
     return api_get(f"https://blockstream.info/api/address/{address}/utxo")
 
-def get_balance(address):
-    data = api_get(f"https://blockstream.info/api/address/{address}")
-    if data:
-        balance = data.get('chain_stats', {}).get('funded_txo_sum', 0) - data.get('chain_stats', {}).get('spent_txo_sum', 0)
-        mempool_balance = data.get('mempool_stats', {}).get('funded_txo_sum', 0) - data.get('mempool_stats', {}).get('spent_txo_sum', 0)
-        return balance + mempool_balance
-    return None
-
 def collect_utxos(addresses):
     all_utxos, total_satoshis, utxo_count = [], 0, 0
     for address in addresses:
@@ -89,14 +116,18 @@ def collect_utxos(addresses):
 # ==========================
 # Display Functions
 # ==========================
+# One manager for the whole run: skips identical frames and uses partial refresh for small changes
+# The last frame is kept on disk so a cold start can show it straight away
+display = DisplayManager(epd2in13_V4.EPD(), state_file=LAST_FRAME_FILE)
+
 def display_setup_info(message):
     """Display setup information on the E-Ink screen for Wi-Fi or zpub configuration."""
+    from PIL import Image, ImageDraw
+    from render_cache import load_font
     ip_address = get_ip_address()  # Get the correct IP address
-    epd = epd2in13_V4.EPD()
-    epd.init(), epd.Clear(0xFF)
-    img = Image.new('1', (epd.height, epd.width), 255)
+    img = Image.new('1', (display.height, display.width), 255)
     draw = ImageDraw.Draw(img)
-    font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 11)
+    font = load_font(11)
 
     draw.text((10, 10), message, font=font, fill=0)
     draw.text((10, 30), "Connect to:", font=font, fill=0)
@@ -106,39 +137,22 @@ def display_setup_info(message):
     # Use the correct IP address
     draw.text((10, 90), f"Visit: http://{ip_address}:5001/", font=font, fill=0)
 
-    epd.display(epd.getbuffer(img.rotate(90, expand=True)))
-    epd.sleep()
+    display.show(img)
 
 
 
 def display_on_eink(index, balance, addr, utxo_count):
     """Pattern B: Display QR code of receiving address."""
-    epd = epd2in13_V4.EPD()
-    epd.init(), epd.Clear(0xFF)
-    img = Image.new('1', (epd.height, epd.width), 255)
-    draw = ImageDraw.Draw(img)
-    font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 11)
-
-    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=3, border=1)
-    qr.add_data(addr), qr.make(fit=True)
-    qr_img = qr.make_image(fill="black", back_color="white").resize((100, 100))
-    img.paste(qr_img, (5, 10))
-
-    draw.text((110, 10), "Bitcoin PiggyBank", font=font, fill=0)
-    draw.text((110, 40), "Total Balance:", font=font, fill=0)
-    draw.text((110, 60), f"{balance} sats", font=font, fill=0)
-    draw.text((110, 90), f"You saved {utxo_count} times!", font=font, fill=0)
-
-    epd.display(epd.getbuffer(img.rotate(90, expand=True)))
-    epd.sleep()
+    # QR code and labels come pre-rendered from the cache, only the numbers are drawn here
+    display.show(render_cache.frame(index, balance, utxo_count))
 
 def display_full_status(total_satoshis):
     """Pattern C: Display full status and instructions to break piggybank."""
-    epd = epd2in13_V4.EPD()
-    epd.init(), epd.Clear(0xFF)
-    eink_image = Image.new('1', (epd.height, epd.width), 255)
+    from PIL import Image, ImageDraw
+    from render_cache import load_font
+    eink_image = Image.new('1', (display.height, display.width), 255)
     draw = ImageDraw.Draw(eink_image)
-    font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 12)
+    font = load_font(12)
 
     draw.text((10, 10), "I'm full! Break me to take out sats", font=font, fill=0)
     draw.text((10, 30), "Total Balance:", font=font, fill=0)
@@ -146,53 +160,130 @@ def display_full_status(total_satoshis):
     draw.text((10, 80), "Please use your seed directly.", font=font, fill=0)
     draw.text((10, 95), "I'm really proud of you. Good job!", font=font, fill=0)
 
-    epd.display(epd.getbuffer(eink_image.rotate(90, expand=True)))
-    epd.sleep()
+    display.show(eink_image)
 
 # ==========================
-# Main Execution Loop
+# Chain Watching
 # ==========================
-zpub = load_json("zpub.json").get("zpub") if os.path.exists("zpub.json") else None
-bip84_ctx = Bip84.FromExtendedKey(zpub, Bip84Coins.BITCOIN) if zpub else None
-addresses = [bip84_ctx.Change(Bip44Changes.CHAIN_EXT).AddressIndex(i).PublicKey().ToAddress() for i in range(21)] if zpub else []
-
-while True:
-    if not is_wifi_configured() or not zpub:
-        # Pattern A: Wi-Fi or zpub not configured, show setup info
-        display_setup_info("Wi-Fi or zpub not configured!")
-        print("Displaying hotspot or zpub setup instructions.")
-        time.sleep(30)
-        continue
-
-    total_balance, found_unused, utxo_count, i = 0, False, 0, 0
-
-    while not found_unused:
-        addr = addresses[i]
-        balance = get_balance(addr)
-        print(f"Checking address {i}: {addr}, Balance: {balance} sats")
-
-        if balance is None:
-            print(f"Skipping address {i} due to rate limit.")
-            continue
-
-        if balance == 0 and not found_unused:
-            found_unused, current_index = True, i
-
-        if balance > 0:
-            total_balance += balance
-            utxos = get_utxos(addr)
-            utxo_count += len(utxos)
-
-        i += 1
+render_cache = None
+
+def load_zpub():
+    return load_json("zpub.json").get("zpub") if os.path.exists("zpub.json") else None
+
+def open_watcher(zpub, address_index, backend):
+    """Gap-limit scan once to find how far the wallet has been used, then watch incrementally."""
+    global render_cache
+    from render_cache import RenderCache
+    from wallet_scanner import scan_wallet
+    from address_index import CHAIN_EXT
+    wallet = scan_wallet(address_index, backend)
+    print(f"Wallet scan: {len(wallet.used_addresses())} used addresses, next receive index {wallet.next_receive_index}")
+    addresses = address_index.addresses(CHAIN_EXT, max(21, wallet.next_receive_index + 1))
+    render_cache = RenderCache(zpub, addresses, (display.height, display.width))
+    render_cache.pregenerate()
+    return backend.watcher(addresses)
+
+def show_snapshot(snapshot, addresses):
+    """Draw pattern B or C. Returns 'receive', 'full', or 'extend' when every watched address is used."""
+    total_balance, utxo_count, current_index = snapshot.total_balance, snapshot.utxo_count, snapshot.first_unused
+
+    if current_index is None and utxo_count < 21:
+        # Every watched address is used but there is still room, rescan to extend the range
+        return 'extend'
 
     if utxo_count < 21:
         # Pattern B: Display receiving address QR code
+        addr = addresses[current_index]
         display_on_eink(current_index, total_balance, addr, utxo_count)
         print(f"Displaying receiving address QR code: {addr}")
-    else:
-        # Pattern C: Display full status and instructions
-        display_full_status(total_balance)
-        print("UTXOs reached 21. Displaying break piggybank instructions.")
-        break
+        return 'receive'
+
+    # Pattern C: Display full status and instructions
+    display_full_status(total_balance)
+    print("UTXOs reached 21. Displaying break piggybank instructions.")
+    return 'full'
+
+# ==========================
+# Main Execution Loop
+# ==========================
+def run_loop():
+    from chain_backend import get_backend
+    from address_index import AddressIndex, CHAIN_EXT
+    zpub = load_zpub()
+    backend = get_backend()
+    watcher = None
+    displayed = False
+
+    start = time.monotonic()
+    address_index = AddressIndex(zpub) if zpub else None
+    if address_index:
+        address_index.ensure(CHAIN_EXT, 21)  # Served from address_index.db after the first boot
+    startup_timings['derivation'] = time.monotonic() - start
+
+    # Without a zpub there is nothing to fetch, the setup screen is drawn right away
+    if zpub:
+        start = time.monotonic()
+        print(f"Network ready: {wait_for_network()}")
+        startup_timings['network_wait'] = time.monotonic() - start
+
+    while True:
+        if not is_wifi_configured() or not zpub:
+            # Pattern A: Wi-Fi or zpub not configured, show setup info
+            display_setup_info("Wi-Fi or zpub not configured!")
+            print("Displaying hotspot or zpub setup instructions.")
+            displayed = False
+            time.sleep(30)
+            continue
 
-    time.sleep(30)
+        if watcher is None:
+            try:
+                watcher = open_watcher(zpub, address_index, backend)
+            except Exception as e:
+                print(f"Wallet scan failed ({e}). Retrying next cycle.")
+                time.sleep(30)
+                continue
+
+        try:
+            snapshot, changed = watcher.poll()
+        except Exception as e:
+            print(f"Chain poll failed ({e}). Retrying next cycle.")
+            watcher.wait(30)
+            continue
+        print(f"Chain poll used {watcher.api_calls} API calls, changed: {changed}")
+
+        if changed or not displayed:
+            result = show_snapshot(snapshot, watcher.addresses)
+            if result == 'extend':
+                watcher.close()
+                watcher = None
+                continue
+            if not displayed and 'first_render' not in startup_timings:
+                startup_timings['first_render'] = time.monotonic() - STARTUP_T0
+                print_startup_report()
+            if result == 'full':
+                break
+            displayed = True
+
+        # Electrum wakes up as soon as a payment notification arrives, Esplora just sleeps
+        watcher.wait(30)
+
+def main():
+    startup_timings['import'] = time.monotonic() - STARTUP_T0
+
+    # Put the last known screen back up before anything slow happens
+    start = time.monotonic()
+    display.restore()
+    startup_timings['cached_render'] = time.monotonic() - start
+
+    if '--daemon' in sys.argv:
+        import asyncio
+        from piggybank_daemon import run_daemon
+        # This module, so the daemon draws with the DisplayManager restored above
+        asyncio.run(run_daemon(sys.modules[__name__]))
+        return
+
+    print(f"Current IP: {get_ip_address()}")
+    run_loop()
+
+if __name__ == "__main__":
+    main()
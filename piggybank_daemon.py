@@ -0,0 +1,162 @@
+import signal
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from address_index import AddressIndex
+from chain_backend import get_backend
+
+# ==========================
+# Configuration Constants
+# ==========================
+CONNECTIVITY_INTERVAL = 30  # Seconds between Wi-Fi checks
+POLL_INTERVAL = 30  # Seconds between chain polls when no notification arrives
+WAIT_SLICE = 5  # Blocking waits run in short slices so shutdown never hangs on them
+
+
+class StateChannel:
+    """Latest-value channel linking the daemon tasks.
+
+    Producers publish partial updates, consumers wait for a newer version and
+    always read the most recent state, so a slow reader never works through a
+    backlog of stale ones.
+    """
+
+    def __init__(self):
+        self.state = {'wifi': None, 'ip': None, 'snapshot': None, 'addresses': []}
+        self.version = 0
+        self.condition = asyncio.Condition()
+
+    async def publish(self, **updates):
+        async with self.condition:
+            if all(self.state.get(key) == value for key, value in updates.items()):
+                return
+            self.state.update(updates)
+            self.version += 1
+            self.condition.notify_all()
+
+    async def next(self, last_version):
+        """Wait for a state newer than last_version, returns (version, state)."""
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.version != last_version)
+            return self.version, dict(self.state)
+
+    async def wait_for(self, predicate):
+        async with self.condition:
+            await self.condition.wait_for(lambda: predicate(self.state))
+
+
+# ==========================
+# Tasks
+# ==========================
+async def connectivity_task(channel, piggybank):
+    loop = asyncio.get_running_loop()
+    while True:
+        wifi = await loop.run_in_executor(None, piggybank.is_wifi_configured)
+        ip = await loop.run_in_executor(None, piggybank.get_ip_address)
+        await channel.publish(wifi=wifi, ip=ip)
+        await asyncio.sleep(CONNECTIVITY_INTERVAL)
+
+
+async def wait_for_chain(watcher, timeout):
+    """Wait up to timeout for the next poll, returning early on a push notification."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline:
+        if await loop.run_in_executor(None, watcher.wait, min(WAIT_SLICE, deadline - loop.time())):
+            return
+
+
+async def chain_task(channel, zpub, piggybank):
+    loop = asyncio.get_running_loop()
+    address_index = AddressIndex(zpub)
+    backend = get_backend()
+    watcher = None
+    try:
+        while True:
+            await channel.wait_for(lambda state: state['wifi'])
+
+            if watcher is None:
+                try:
+                    watcher = await loop.run_in_executor(None, piggybank.open_watcher, zpub, address_index, backend)
+                except Exception as e:
+                    print(f"Wallet scan failed ({e}). Retrying in {POLL_INTERVAL}s.")
+                    await asyncio.sleep(POLL_INTERVAL)
+                    continue
+
+            try:
+                snapshot, changed = await loop.run_in_executor(None, watcher.poll)
+            except Exception as e:
+                print(f"Chain poll failed ({e}). Retrying in {POLL_INTERVAL}s.")
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+
+            if snapshot.first_unused is None and snapshot.utxo_count < 21:
+                # Every watched address is used, rescan to extend the range
+                watcher.close()
+                watcher = None
+                continue
+
+            await channel.publish(snapshot=snapshot, addresses=watcher.addresses)
+            await wait_for_chain(watcher, POLL_INTERVAL)
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+
+def render(state, zpub, piggybank):
+    """Runs in the display executor: pick the screen for a state and draw it."""
+    if not state['wifi'] or not zpub:
+        piggybank.display_setup_info("Wi-Fi or zpub not configured!")
+    elif state['snapshot'] is not None:
+        piggybank.show_snapshot(state['snapshot'], state['addresses'])
+
+
+async def display_task(channel, zpub, executor, piggybank):
+    loop = asyncio.get_running_loop()
+    version = 0
+    while True:
+        version, state = await channel.next(version)
+        if state['wifi'] is None:
+            continue
+        try:
+            await loop.run_in_executor(executor, render, state, zpub, piggybank)
+        except Exception as e:
+            print(f"Display update failed: {e}")
+
+
+# ==========================
+# Daemon entry point
+# ==========================
+async def run_daemon(piggybank):
+    """piggybank is the running piggybank module, passed in rather than imported.
+
+    `python piggybank.py --daemon` runs it as __main__, so an import here
+    would load it a second time with a second EPD and DisplayManager.
+    """
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    zpub = piggybank.load_zpub()
+    channel = StateChannel()
+    display_executor = ThreadPoolExecutor(max_workers=1)  # The panel driver is not thread-safe
+
+    tasks = [asyncio.create_task(connectivity_task(channel, piggybank)),
+             asyncio.create_task(display_task(channel, zpub, display_executor, piggybank))]
+    if zpub:
+        tasks.append(asyncio.create_task(chain_task(channel, zpub, piggybank)))
+    stop_task = asyncio.create_task(stop.wait())
+
+    try:
+        done, _ = await asyncio.wait(tasks + [stop_task], return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task is not stop_task and task.exception():
+                print(f"Daemon task failed: {task.exception()}")
+    finally:
+        print("Shutting down piggybank daemon...")
+        for task in tasks + [stop_task]:
+            task.cancel()
+        await asyncio.gather(*tasks, stop_task, return_exceptions=True)
+        # Let a refresh in progress finish, then make sure the panel sleeps
+        await loop.run_in_executor(display_executor, piggybank.display.shutdown)
+        display_executor.shutdown(wait=True)
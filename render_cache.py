@@ -0,0 +1,88 @@
+import os
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+import qrcode
+from address_index import zpub_fingerprint
+
+# ==========================
+# Configuration Constants
+# ==========================
+CACHE_DIR = "render_cache"
+LAYOUT_VERSION = 1  # Bump when the static layout below changes
+FONT_PATH = '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'
+
+
+@lru_cache(maxsize=None)
+def load_font(size):
+    """Load the TrueType font once per size instead of on every render."""
+    return ImageFont.truetype(FONT_PATH, size)
+
+
+class RenderCache:
+    """Pre-rendered receive screens, one packed 1-bit frame per address index.
+
+    The QR code and the static labels only depend on the address, so they are
+    drawn once, stored on disk keyed by zpub fingerprint and reused across
+    restarts. A cycle copies the cached frame and stamps the balance and
+    counter on top.
+    """
+
+    def __init__(self, zpub, addresses, size, cache_dir=CACHE_DIR):
+        self.addresses = list(addresses)
+        self.size = size
+        self.directory = os.path.join(cache_dir, f"{zpub_fingerprint(zpub)}-v{LAYOUT_VERSION}-{size[0]}x{size[1]}")
+        self.frames = {}
+
+    def frame_path(self, index):
+        return os.path.join(self.directory, f"frame_{index}.bin")
+
+    def build_static(self, index):
+        img = Image.new('1', self.size, 255)
+        draw = ImageDraw.Draw(img)
+        font = load_font(11)
+
+        qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=3, border=1)
+        qr.add_data(self.addresses[index]), qr.make(fit=True)
+        qr_img = qr.make_image(fill="black", back_color="white").resize((100, 100))
+        img.paste(qr_img, (5, 10))
+
+        draw.text((110, 10), "Bitcoin PiggyBank", font=font, fill=0)
+        draw.text((110, 40), "Total Balance:", font=font, fill=0)
+        return img.tobytes()
+
+    def static_frame(self, index):
+        """Return the packed static frame for an index, building and storing it if needed."""
+        if index in self.frames:
+            return self.frames[index]
+
+        path = self.frame_path(index)
+        expected = (self.size[0] + 7) // 8 * self.size[1]
+        data = None
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            if len(data) != expected:
+                data = None
+        if data is None:
+            data = self.build_static(index)
+            os.makedirs(self.directory, exist_ok=True)
+            with open(f"{path}.tmp", 'wb') as f:
+                f.write(data)
+            os.replace(f"{path}.tmp", path)
+
+        self.frames[index] = data
+        return data
+
+    def pregenerate(self):
+        """Render every address up front, e.g. right after the zpub is known."""
+        for index in range(len(self.addresses)):
+            self.static_frame(index)
+
+    def frame(self, index, balance, utxo_count):
+        """Compose the receive screen from the cached frame plus the dynamic text."""
+        img = Image.frombytes('1', self.size, self.static_frame(index))
+        draw = ImageDraw.Draw(img)
+        font = load_font(11)
+        draw.text((110, 60), f"{balance} sats", font=font, fill=0)
+        draw.text((110, 90), f"You saved {utxo_count} times!", font=font, fill=0)
+        return img
@@ -1,10 +1,8 @@
 #!/bin/bash
 
-# dca
-source /home/daniel/myenv/bin/activate
+# dca daemon (runs in the background, buys and withdraws after each hourly candle close)
 cd /home/daniel
-python dca.py
-deactivate
+/home/daniel/myenv/bin/python dca.py --daemon >> /home/daniel/dca.log 2>&1 &
 
 # piggybank
 source /home/daniel/venv/bin/activate
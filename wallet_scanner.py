@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from address_index import CHAIN_EXT, CHAIN_INT
+
+# ==========================
+# Configuration Constants
+# ==========================
+GAP_LIMIT = 20  # BIP44: stop after this many consecutive unused addresses
+SCAN_BATCH = 20  # Addresses derived and queried per round trip
+
+
+@dataclass
+class WalletScan:
+    """Everything we know about the wallet after a gap-limit scan of both chains.
+
+    external and internal hold one stats dict per scanned index (with 'chain'
+    and 'index' added), up to the last used index plus the gap limit.
+    """
+    external: list = field(default_factory=list)
+    internal: list = field(default_factory=list)
+    gap_limit: int = GAP_LIMIT
+
+    @property
+    def all_stats(self):
+        return self.external + self.internal
+
+    @property
+    def total_balance(self):
+        return sum(stats['balance'] for stats in self.all_stats)
+
+    @property
+    def utxo_count(self):
+        return sum(stats['utxo_count'] for stats in self.all_stats)
+
+    @staticmethod
+    def next_unused(chain_stats):
+        used = [stats['index'] for stats in chain_stats if stats['tx_count'] > 0]
+        return max(used) + 1 if used else 0
+
+    @property
+    def next_receive_index(self):
+        return self.next_unused(self.external)
+
+    @property
+    def next_change_index(self):
+        return self.next_unused(self.internal)
+
+    def used_addresses(self):
+        return [stats['address'] for stats in self.all_stats if stats['tx_count'] > 0]
+
+    def funded_addresses(self):
+        """Addresses that currently hold at least one UTXO, on either chain."""
+        return [stats['address'] for stats in self.all_stats if stats['utxo_count'] > 0]
+
+
+def scan_chain(address_index, backend, chain, gap_limit=GAP_LIMIT, batch_size=SCAN_BATCH):
+    """Scan one chain in batches until gap_limit consecutive addresses are unused."""
+    results, last_used, start = [], -1, 0
+    while start - (last_used + 1) < gap_limit:
+        entries = address_index.entries(chain, start, batch_size)
+        stats_list = backend.address_stats([entry['address'] for entry in entries])
+        for entry, stats in zip(entries, stats_list):
+            if stats is None:
+                raise ConnectionError(f"Failed to fetch {entry['address']}")
+            stats = dict(stats, chain=chain, index=entry['index'])
+            if stats['tx_count'] > 0:
+                last_used = entry['index']
+            results.append(stats)
+        start += batch_size
+    return results[:last_used + 1 + gap_limit]
+
+
+def scan_wallet(address_index, backend, gap_limit=GAP_LIMIT, batch_size=SCAN_BATCH):
+    """Gap-limit scan of the receive and change chains, both chains in parallel."""
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        external = pool.submit(scan_chain, address_index, backend, CHAIN_EXT, gap_limit, batch_size)
+        internal = pool.submit(scan_chain, address_index, backend, CHAIN_INT, gap_limit, batch_size)
+        return WalletScan(external=external.result(), internal=internal.result(), gap_limit=gap_limit)